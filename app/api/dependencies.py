@@ -0,0 +1,13 @@
+import secrets
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+from app.core.config import settings
+
+async def require_admin(x_admin_key: Optional[str] = Header(None)) -> None:
+    """Exige la clave de administración (cabecera X-Admin-Key)"""
+    if not settings.ADMIN_API_KEY:
+        raise HTTPException(status_code=403, detail="Endpoints de administración desactivados (ADMIN_API_KEY)")
+    if not x_admin_key or not secrets.compare_digest(x_admin_key, settings.ADMIN_API_KEY):
+        raise HTTPException(status_code=401, detail="Clave de administración no válida")
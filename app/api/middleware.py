@@ -0,0 +1,48 @@
+import time
+from typing import Any, Callable, Dict
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.tracing import current_trace, end_trace, start_trace
+
+HTTP_IN_FLIGHT = metrics.gauge("rag_http_requests_in_flight", "Peticiones HTTP en curso")
+HTTP_SECONDS = metrics.histogram(
+    "rag_http_request_seconds",
+    "Duración de las peticiones HTTP por método, ruta y código de estado",
+    ["method", "route", "status"]
+)
+
+class RequestMetricsMiddleware:
+    """Middleware ASGI: traza por petición, peticiones en curso, duración y cabecera Server-Timing"""
+
+    def __init__(self, app: Callable):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        token = start_trace()
+        status = 500
+
+        async def send_with_timing(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                trace = current_trace()
+                if settings.SERVER_TIMING_ENABLED and trace is not None:
+                    # En streaming solo incluye las etapas terminadas antes del primer fragmento
+                    message["headers"] = [*message.get("headers", []), (b"server-timing", trace.server_timing().encode("latin-1"))]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # Plantilla de la ruta (no la URL) para acotar la cardinalidad de las etiquetas
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_SECONDS.observe(time.perf_counter() - start, method=scope["method"], route=route, status=status)
+            end_trace(token)
@@ -1,13 +1,18 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Dict, Any, Optional
 
 class Query(BaseModel):
     """Modelo para las consultas del usuario"""
     query: str
+    # Sesión de conversación (POST /api/sessions o un identificador propio); sin ella, la consulta es independiente
+    session_id: Optional[str] = Field(None, max_length=128, regex=r"^[A-Za-z0-9_-]+$")
 
 class ChatResponse(BaseModel):
     """Modelo para la respuesta de chat"""
     response: str
+    session_id: Optional[str] = None
+    standalone_query: Optional[str] = None  # Pregunta usada para recuperar, si la sesión la reescribió
+    usage: Optional[Dict[str, int]] = None  # Tokens del turno por tipo (historial, reescritura, prompt, respuesta)
 
 class DocumentInfo(BaseModel):
     """Información sobre un documento recuperado"""
@@ -22,8 +27,73 @@ class DiagnosticResponse(BaseModel):
     query: str
     retrieved_documents: List[DocumentInfo]
     total_documents: int
+    timings_ms: Optional[Dict[str, float]] = None  # Duración de cada etapa de la recuperación
 
 class HealthResponse(BaseModel):
     """Modelo para la respuesta de verificación de salud"""
     status: str
-    documents_loaded: bool
\ No newline at end of file
+    documents_loaded: bool
+
+class LivenessResponse(BaseModel):
+    """Modelo para la respuesta de liveness"""
+    status: str
+
+class ReadinessResponse(BaseModel):
+    """Modelo para la respuesta de readiness"""
+    status: str
+    ready: bool
+    detail: Optional[str] = None
+    startup_seconds: Optional[float] = None
+
+class CacheStatsResponse(BaseModel):
+    """Modelo para las estadísticas de la caché de respuestas"""
+    enabled: bool
+    entries: int
+    similarity_threshold: float
+    hit_rate: float
+    exact_hits: int
+    semantic_hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+
+class FaqStatsResponse(BaseModel):
+    """Modelo para las estadísticas del almacén de preguntas frecuentes"""
+    enabled: bool
+    entries: int
+    stale: int
+    similarity_threshold: float
+    hit_rate: float
+    traffic_share: float  # Respuestas servidas por el almacén sobre todas las consultas
+    exact_hits: int
+    semantic_hits: int
+    misses: int
+    last_refresh: Optional[float] = None
+
+class ReindexStatusResponse(BaseModel):
+    """Modelo para el estado de la última reindexación"""
+    status: str  # idle, running, completed, failed
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    report: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+class SessionCreatedResponse(BaseModel):
+    """Modelo para la sesión de conversación creada"""
+    session_id: str
+
+class SessionTurn(BaseModel):
+    """Turno de conversación conservado literalmente"""
+    query: str
+    standalone_query: str
+    answer: str
+    usage: Dict[str, int]
+
+class SessionResponse(BaseModel):
+    """Modelo para el estado de una sesión de conversación"""
+    session_id: str
+    summary: str
+    summarized_turns: int  # Turnos antiguos ya incorporados al resumen
+    turns: List[SessionTurn]
+    history_tokens: int  # Tokens del historial que se enviaría en el siguiente turno
+    updated_at: float
@@ -1,14 +1,57 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Response
+from typing import List
+from fastapi.responses import JSONResponse, StreamingResponse
+import json
 import logging
+import math
 
-from app.api.models import Query, ChatResponse, DiagnosticResponse, HealthResponse
-from app.services.rag_service import get_rag_answer, get_relevant_documents
+from app.api.dependencies import require_admin
+from app.api.models import (
+    Query, ChatResponse, DiagnosticResponse, HealthResponse, CacheStatsResponse, FaqStatsResponse,
+    LivenessResponse, ReadinessResponse, ReindexStatusResponse, SessionCreatedResponse, SessionResponse
+)
+from app.core.config import settings
+from app.core.metrics import snapshot as metrics_snapshot
+from app.core.readiness import is_ready, readiness_status
+from app.core.tracing import current_trace
+from app.services.conversation import delete_session, finish_turn, get_session_info, new_session_id, start_turn
+from app.services.llm_gateway import LLMOverloadedError
+from app.services.rag_service import (
+    get_rag_answer, get_rag_answers_batch, get_relevant_documents, get_relevant_documents_batch, stream_rag_answer
+)
+from app.db.reindex import reindex_status, start_reindex
 from app.db.vector_store import get_vector_store
+from app.services.answer_cache import get_answer_cache
+from app.services.faq_store import get_faq_store
+from app.services.streaming import Replacement
 
 # Crear router
 router = APIRouter()
 logger = logging.getLogger("rag-app")
 
+def _sse_event(data: dict, event: str = None) -> str:
+    """Serializa un evento en formato Server-Sent Events"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def _ndjson_line(data: dict) -> str:
+    """Serializa un resultado como una línea de NDJSON"""
+    return json.dumps(data, ensure_ascii=False) + "\n"
+
+def _check_batch(queries: List[Query]) -> None:
+    if not queries:
+        raise HTTPException(status_code=422, detail="El lote no contiene consultas")
+    if len(queries) > settings.BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=413, detail=f"El lote supera el máximo de {settings.BATCH_MAX_QUERIES} consultas")
+
+def _overloaded(e: LLMOverloadedError) -> HTTPException:
+    """Respuesta 429 con el tiempo de espera recomendado"""
+    return HTTPException(
+        status_code=429,
+        detail=str(e),
+        headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))}
+    )
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat(query: Query):
     """Endpoint para chatear con el sistema RAG"""
@@ -17,12 +60,80 @@ async def chat(query: Query):
         raise HTTPException(status_code=500, detail="Almacén vectorial no inicializado")
     
     try:
-        response = await get_rag_answer(query.query, vector_store)
-        return {"response": response}
+        # Con sesión, las preguntas de seguimiento se reescriben como preguntas autónomas
+        turn = await start_turn(query.session_id, query.query) if query.session_id else None
+        response = await get_rag_answer(turn.standalone_query if turn else query.query, vector_store)
+        trace = current_trace()
+        usage = trace.usage() if trace else None
+        if turn:
+            finish_turn(turn, response, usage)
+        return {
+            "response": response,
+            "session_id": query.session_id,
+            "standalone_query": turn.standalone_query if turn else None,
+            "usage": usage
+        }
+    except LLMOverloadedError as e:
+        raise _overloaded(e)
     except Exception as e:
         logger.error(f"Error procesando chat: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error procesando solicitud: {str(e)}")
 
+@router.post("/chat/stream")
+async def chat_stream(query: Query):
+    """Endpoint para chatear con el sistema RAG recibiendo la respuesta token a token (SSE)"""
+    vector_store = await get_vector_store()
+    if not vector_store:
+        raise HTTPException(status_code=500, detail="Almacén vectorial no inicializado")
+    
+    # Esperar el primer fragmento antes de responder: si el LLM está saturado, se devuelve 429
+    # en lugar de abrir un flujo que quedaría esperando turno
+    try:
+        turn = await start_turn(query.session_id, query.query, lane="stream") if query.session_id else None
+        tokens = stream_rag_answer(turn.standalone_query if turn else query.query, vector_store)
+        first_text = await tokens.__anext__()
+    except StopAsyncIteration:
+        first_text = None
+    except LLMOverloadedError as e:
+        raise _overloaded(e)
+    except Exception as e:
+        logger.error(f"Error iniciando chat en streaming: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error procesando solicitud: {str(e)}")
+    
+    async def event_stream():
+        try:
+            parts = []
+            if first_text is not None:
+                parts.append(first_text)
+                yield _sse_event({"token": first_text})
+            async for text in tokens:
+                if isinstance(text, Replacement):
+                    # El formato final difiere de lo enviado: el cliente sustituye todo el texto
+                    parts = [text]
+                    yield _sse_event({"text": text}, event="replace")
+                    continue
+                parts.append(text)
+                yield _sse_event({"token": text})
+            # El turno se guarda en la sesión solo si la respuesta se completó
+            trace = current_trace()
+            usage = trace.usage() if trace else None
+            if turn:
+                finish_turn(turn, "".join(parts), usage)
+            yield _sse_event({
+                "session_id": query.session_id,
+                "standalone_query": turn.standalone_query if turn else None,
+                "usage": usage
+            }, event="end")
+        except Exception as e:
+            logger.error(f"Error procesando chat en streaming: {e}", exc_info=True)
+            yield _sse_event({"detail": f"Error procesando solicitud: {str(e)}"}, event="error")
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.post("/diagnose", response_model=DiagnosticResponse)
 async def diagnose_query(query: Query):
     """Endpoint para diagnosticar una consulta mostrando los documentos recuperados"""
@@ -32,15 +143,74 @@ async def diagnose_query(query: Query):
     
     try:
         results = await get_relevant_documents(query.query, vector_store)
+        trace = current_trace()
         return {
             "query": query.query,
             "retrieved_documents": results,
-            "total_documents": len(results)
+            "total_documents": len(results),
+            "timings_ms": trace.timings_ms() if trace else None
         }
     except Exception as e:
         logger.error(f"Error diagnosticando consulta: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error procesando solicitud: {str(e)}")
 
+@router.post("/chat/batch")
+async def chat_batch(queries: List[Query]):
+    """Endpoint para responder un lote de consultas; devuelve NDJSON a medida que termina cada una"""
+    _check_batch(queries)
+    vector_store = await get_vector_store()
+    if not vector_store:
+        raise HTTPException(status_code=500, detail="Almacén vectorial no inicializado")
+    
+    texts = [query.query for query in queries]
+    
+    async def results():
+        async for result in get_rag_answers_batch(texts, vector_store):
+            yield _ndjson_line({"query": texts[result["index"]], **result})
+    
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+@router.post("/diagnose/batch")
+async def diagnose_batch(queries: List[Query]):
+    """Endpoint para diagnosticar un lote de consultas; devuelve NDJSON con una línea por consulta"""
+    _check_batch(queries)
+    vector_store = await get_vector_store()
+    if not vector_store:
+        raise HTTPException(status_code=500, detail="Almacén vectorial no inicializado")
+    
+    texts = [query.query for query in queries]
+    try:
+        batch = await get_relevant_documents_batch(texts, vector_store)
+    except Exception as e:
+        logger.error(f"Error diagnosticando lote de consultas: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error procesando solicitud: {str(e)}")
+    
+    lines = (
+        _ndjson_line({"index": i, "query": text, "retrieved_documents": results, "total_documents": len(results)})
+        for i, (text, results) in enumerate(zip(texts, batch))
+    )
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
+@router.post("/sessions", response_model=SessionCreatedResponse, status_code=201)
+async def create_session():
+    """Endpoint para obtener un identificador de sesión de conversación nuevo"""
+    return {"session_id": new_session_id()}
+
+@router.get("/sessions/{session_id}", response_model=SessionResponse)
+async def get_session(session_id: str):
+    """Endpoint para consultar el resumen, los turnos recientes y los tokens de historial de una sesión"""
+    session = get_session_info(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Sesión no encontrada o caducada")
+    return session
+
+@router.delete("/sessions/{session_id}", status_code=204)
+async def remove_session(session_id: str):
+    """Endpoint para borrar una sesión de conversación"""
+    if not delete_session(session_id):
+        raise HTTPException(status_code=404, detail="Sesión no encontrada o caducada")
+    return Response(status_code=204)
+
 @router.get("/health", response_model=HealthResponse)
 async def health_check():
     """Endpoint para verificar si el sistema está funcionando correctamente"""
@@ -48,4 +218,44 @@ async def health_check():
     return {
         "status": "healthy" if vector_store else "not_ready",
         "documents_loaded": bool(vector_store)
-    }
\ No newline at end of file
+    }
+
+@router.get("/live", response_model=LivenessResponse)
+async def liveness():
+    """Endpoint de liveness: el proceso responde, aunque aún no esté listo"""
+    return {"status": "alive"}
+
+@router.get("/ready", response_model=ReadinessResponse, responses={503: {"model": ReadinessResponse}})
+async def readiness():
+    """Endpoint de readiness: 200 cuando el almacén vectorial y la cadena RAG están preparados"""
+    status = readiness_status()
+    if not is_ready():
+        return JSONResponse(status_code=503, content=status)
+    return status
+
+@router.get("/cache/stats", response_model=CacheStatsResponse)
+async def cache_stats():
+    """Endpoint para consultar aciertos y fallos de la caché de respuestas"""
+    return get_answer_cache().stats()
+
+@router.get("/faq/stats", response_model=FaqStatsResponse)
+async def faq_stats():
+    """Endpoint para consultar qué parte del tráfico responde el almacén de preguntas frecuentes"""
+    return get_faq_store().stats()
+
+@router.get("/metrics")
+async def metrics():
+    """Endpoint para consultar las métricas del proceso en JSON (en formato Prometheus: /metrics)"""
+    return metrics_snapshot()
+
+@router.post("/admin/reindex", response_model=ReindexStatusResponse, status_code=202, dependencies=[Depends(require_admin)])
+async def admin_reindex():
+    """Endpoint para lanzar una reindexación completa sin interrumpir el servicio"""
+    if not start_reindex():
+        return JSONResponse(status_code=409, content=reindex_status())
+    return reindex_status()
+
+@router.get("/admin/reindex", response_model=ReindexStatusResponse, dependencies=[Depends(require_admin)])
+async def admin_reindex_status():
+    """Endpoint para consultar el estado de la última reindexación"""
+    return reindex_status()
@@ -0,0 +1,43 @@
+import asyncio
+import contextvars
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+from app.core.config import settings
+
+logger = logging.getLogger("rag-app")
+
+T = TypeVar("T")
+
+# Singleton para el ejecutor de llamadas bloqueantes
+_executor: Optional[ThreadPoolExecutor] = None
+
+def get_executor() -> ThreadPoolExecutor:
+    """Obtiene el ejecutor acotado para llamadas bloqueantes, creándolo si no existe"""
+    global _executor
+
+    if _executor is None:
+        logger.info(f"Inicializando ejecutor de llamadas bloqueantes con {settings.BLOCKING_POOL_SIZE} hilos")
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.BLOCKING_POOL_SIZE,
+            thread_name_prefix="rag-blocking"
+        )
+
+    return _executor
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Ejecuta una llamada bloqueante (LLM, Qdrant, embeddings) fuera del bucle de eventos"""
+    loop = asyncio.get_running_loop()
+    # Propagar las variables de contexto al hilo de trabajo
+    call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+    return await loop.run_in_executor(get_executor(), call)
+
+def shutdown_executor() -> None:
+    """Detiene el ejecutor de llamadas bloqueantes"""
+    global _executor
+
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
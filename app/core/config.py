@@ -16,12 +16,101 @@ class Settings(BaseSettings):
     OPENAI_EMBEDDING_MODEL: str = "text-embedding-ada-002"
     OPENAI_LLM_MODEL: str = "gpt-4o"
     
+    # Configuración de recuperación
+    RAG_RETRIEVAL_K: int = 8  # Fragmentos recuperados para /chat
+    DIAGNOSE_RETRIEVAL_K: int = 3  # Fragmentos recuperados para /diagnose
+    LEXICAL_INDEX_ENABLED: bool = True  # Índice BM25 construido al indexar, combinado con la búsqueda vectorial
+    HYBRID_CANDIDATES: int = 20  # Candidatos de cada recuperador antes de la fusión
+    HYBRID_RRF_K: int = 60  # Constante de la fusión por rango recíproco (RRF)
+    # Pesos de la fusión por endpoint (0 desactiva ese recuperador)
+    CHAT_VECTOR_WEIGHT: float = 1.0
+    CHAT_LEXICAL_WEIGHT: float = 1.0
+    DIAGNOSE_VECTOR_WEIGHT: float = 1.0
+    DIAGNOSE_LEXICAL_WEIGHT: float = 1.0
+    
+    # Configuración del gateway de llamadas al LLM
+    LLM_MAX_CONCURRENCY: int = 8  # Llamadas simultáneas al LLM
+    LLM_TOKENS_PER_MINUTE: float = 0.0  # Presupuesto de tokens (prompt + respuesta estimada); 0 sin límite
+    LLM_COMPLETION_TOKENS_ESTIMATE: int = 400  # Tokens de respuesta reservados por llamada
+    LLM_MAX_QUEUE: int = 64  # Peticiones en espera antes de rechazar con 429
+    LLM_MAX_WAIT_SECONDS: float = 10.0  # Espera máxima (estimada o real) antes de rechazar con 429
+    LLM_MAX_RETRIES: int = 3  # Reintentos de errores transitorios de OpenAI
+    LLM_RETRY_BASE_SECONDS: float = 1.0
+    # Prioridad de cada carril en la cola (menor valor = antes)
+    LLM_PRIORITY_LANES: dict = {"chat": 0, "stream": 0, "diagnose": 1, "batch": 2, "summary": 3, "faq": 3}
+    
+    # Configuración de las peticiones por lotes (/chat/batch, /diagnose/batch)
+    BATCH_MAX_QUERIES: int = 100  # Consultas máximas por petición
+    BATCH_LLM_CONCURRENCY: int = 4  # Generaciones simultáneas de un mismo lote
+    
+    # Configuración de las sesiones de conversación
+    SESSION_BACKEND: str = "memory"  # "memory" (en el proceso) o "sqlite" (compartidas entre workers)
+    SESSION_STORE_PATH: str = "./data/sessions.sqlite"  # Base de datos del backend "sqlite"
+    SESSION_TTL_SECONDS: float = 1800.0  # Inactividad tras la que se descarta una sesión
+    SESSION_MAX_ENTRIES: int = 10000  # Sesiones en memoria antes de descartar la usada hace más tiempo
+    SESSION_HISTORY_TOKEN_BUDGET: int = 600  # Tokens máximos de historial (resumen + turnos) por prompt
+    SESSION_RECENT_TURNS: int = 3  # Turnos conservados literalmente; al llegar al doble, los anteriores se resumen
+    SESSION_SUMMARY_MAX_TOKENS: int = 250  # Tokens máximos del resumen acumulado
+    SESSION_QUERY_REWRITE_ENABLED: bool = True  # Reescribir las preguntas de seguimiento como preguntas autónomas
+    
+    # Configuración del almacén de preguntas frecuentes (app.services.faq_store)
+    FAQ_STORE_ENABLED: bool = True  # Responder las preguntas frecuentes con respuestas precalculadas
+    FAQ_STORE_PATH: str = "./data/faq_store.json"  # Preguntas, embeddings y respuestas generadas
+    FAQ_CURATED_PATH: str = "./data/faq.yaml"  # Lista YAML opcional de preguntas (y respuestas fijas)
+    FAQ_SIMILARITY_THRESHOLD: float = 0.93  # Similitud coseno mínima con una pregunta guardada
+    FAQ_GENERATION_CONCURRENCY: int = 2  # Respuestas generadas a la vez al construir el almacén
+    FAQ_STORE_CHECK_SECONDS: float = 1.0  # Intervalo mínimo entre comprobaciones del índice y del fichero en las consultas
+    
+    # Configuración del enrutado por intención
+    INTENT_ROUTER_ENABLED: bool = True  # Responder saludos y despedidas sin RAG y ajustar k y prompt por tema
+    INTENT_MODEL_PATH: str = ""  # Modelo fastText opcional para consultas que las reglas no reconocen
+    INTENT_MODEL_MIN_CONFIDENCE: float = 0.7
+    # Fragmentos recuperados por intención (las no indicadas usan RAG_RETRIEVAL_K)
+    INTENT_RETRIEVAL_K: dict = {"hours": 3, "services": 5, "restaurants": 6, "brands": 8}
+    CATEGORY_BOOST_ENABLED: bool = True  # Favorecer en la recuperación las categorías de documentos de la intención
+    CATEGORY_BOOST_WEIGHT: float = 0.5  # Peso en la fusión de los candidatos de esas categorías (vectorial y léxico: 1.0)
+    # Categorías de documentos por intención (app.db.schema.DOCUMENT_RULES)
+    INTENT_CATEGORIES: dict = {
+        "hours": ["hours", "faq"],
+        "restaurants": ["restaurants", "directory"],
+        "brands": ["directory", "products", "promotions"],
+        "services": ["services", "personal_shopper", "membership", "faq"]
+    }
+    
+    # Configuración del ensamblado del contexto
+    CONTEXT_TOKEN_BUDGET: int = 2000  # Tokens máximos de fragmentos enviados al LLM
+    CONTEXT_DEDUP_THRESHOLD: float = 0.8  # Proporción de n-gramas compartidos para descartar un casi duplicado
+    
+    # Configuración de la caché de embeddings
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 10000
+    EMBEDDING_CACHE_PATH: str = ""  # Ruta SQLite compartida entre procesos; vacío para desactivar
+    EMBEDDING_BATCH_WINDOW_MS: float = 5.0  # Ventana para agrupar consultas concurrentes
+    EMBEDDING_BATCH_MAX_SIZE: int = 64
+    
     # Configuración de la base de datos vectorial
-    VECTOR_DB_LOCATION: str = ":memory:"  # Usar persistencia en producción
+    VECTOR_DB_BACKEND: str = "qdrant"  # "qdrant" o "local" (índice NumPy con memoria mapeada)
+    LOCAL_INDEX_DIR: str = "./data/local_index"  # Directorio del índice local
+    LOCAL_INDEX_KEEP_VERSIONS: int = 2  # Versiones del índice local conservadas al publicar, incluida la activa
+    LOCAL_INDEX_REFRESH_SECONDS: float = 1.0  # Intervalo mínimo entre comprobaciones de la versión activa
+    VECTOR_DB_LOCATION: str = ":memory:"  # Qdrant embebido si no hay VECTOR_DB_URL (":memory:" o ruta)
     VECTOR_DB_COLLECTION: str = "docs"
+    ALIAS_REFRESH_SECONDS: float = 5.0  # Intervalo de consulta del alias de Qdrant para el estado de la colección activa
+    # Esquema de las colecciones de Qdrant (app.db.schema); el modo embebido lo ignora
+    VECTOR_DB_HNSW_M: int = 16  # Vecinos por nodo del grafo HNSW
+    VECTOR_DB_HNSW_EF_CONSTRUCT: int = 100  # Candidatos al construir el grafo
+    VECTOR_DB_HNSW_EF: int = 128  # Candidatos explorados por búsqueda; 0 usa el valor del servidor
+    VECTOR_DB_QUANTIZATION: str = "int8"  # "int8" (cuantización escalar) o "" para desactivar
+    VECTOR_DB_QUANTIZATION_QUANTILE: float = 0.99  # Cuantil de los valores usados para calcular el rango int8
+    VECTOR_DB_QUANTIZATION_ALWAYS_RAM: bool = True  # Vectores cuantizados siempre en memoria
+    VECTOR_DB_ON_DISK_VECTORS: bool = False  # Vectores originales en disco (solo se leen al reordenar)
+    VECTOR_DB_RESCORE: bool = True  # Reordenar los candidatos cuantizados con los vectores originales
+    VECTOR_DB_OVERSAMPLING: float = 2.0  # Candidatos cuantizados por resultado antes de reordenar
+    VECTOR_DB_UPDATE_EXISTING_SCHEMA: bool = False  # Aplicar al arrancar HNSW y cuantización a colecciones existentes (cambia el recall)
 
     VECTOR_DB_URL: str = os.getenv("QDRANT_URL", "")
     VECTOR_DB_API_KEY: str = os.getenv("QDRANT_API_KEY", "")
+    VECTOR_STORE_INIT_BACKOFF_SECONDS: float = 1.0  # Espera tras el primer fallo de inicialización
+    VECTOR_STORE_INIT_BACKOFF_MAX_SECONDS: float = 60.0
     
     # Configuración del procesamiento de documentos
     DOCUMENT_DIR: str = "./documents"
@@ -29,6 +118,47 @@ class Settings(BaseSettings):
     CHUNK_SIZE: int = 800
     CHUNK_OVERLAP: int = 250
     
+    # Configuración de la indexación incremental
+    INDEX_STATE_DIR: str = "./data/index"  # Manifiestos de ficheros y fragmentos indexados
+    INDEX_BATCH_SIZE: int = 64  # Fragmentos por llamada de embeddings y subida a Qdrant
+    INDEX_EMBEDDING_CONCURRENCY: int = 4  # Lotes de embeddings en vuelo simultáneamente
+    INDEX_REQUESTS_PER_MINUTE: float = 3000.0  # Límite de peticiones de embeddings
+    INDEX_TOKENS_PER_MINUTE: float = 1000000.0  # Límite de tokens de embeddings
+    INDEX_MAX_RETRIES: int = 5
+    INDEX_RETRY_BASE_SECONDS: float = 1.0
+    INDEX_CHECKPOINT_BATCHES: int = 10  # Lotes entre subidas confirmadas (wait=True) que se registran en el checkpoint
+    INDEX_ON_STARTUP: bool = False  # Sincronizar documentos nuevos o modificados al arrancar
+    INDEX_VERSION_REFRESH_SECONDS: float = 1.0  # Intervalo de comprobación del manifiesto para invalidar cachés
+    # Reindexación completa en una colección versionada (python -m app.db.reindex o POST /api/admin/reindex)
+    REINDEX_KEEP_VERSIONS: int = 2  # Versiones conservadas, incluida la activa
+    REINDEX_GC_GRACE_SECONDS: float = 300.0  # Espera desde que una versión deja de estar activa hasta eliminarla
+    REINDEX_MIN_POINTS_RATIO: float = 0.5  # Puntos mínimos de la versión nueva respecto a la activa
+    REINDEX_SMOKE_QUERIES: list = ["horarios del centro comercial", "restaurantes", "personal shopper"]
+    PARSE_WORKERS: int = max((os.cpu_count() or 1) - 1, 1)  # Procesos para extraer texto de los PDF
+    PARSED_TEXT_CACHE_DIR: str = "./data/parsed"  # Caché del texto extraído; vacío para desactivar
+    
+    # Configuración de la caché de respuestas
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_MAX_ENTRIES: int = 1000
+    ANSWER_CACHE_TTL_SECONDS: float = 3600.0
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = 0.95  # Similitud coseno mínima para el nivel semántico
+    REQUEST_COALESCING_ENABLED: bool = True  # Consultas idénticas concurrentes comparten una sola generación
+    
+    # Configuración de concurrencia
+    BLOCKING_POOL_SIZE: int = 16  # Hilos para llamadas bloqueantes (LLM, Qdrant, embeddings)
+    
+    # Configuración del arranque
+    STARTUP_MODE: str = "background"  # "background": calentar tras arrancar; "eager": bloquear hasta estar listo
+    EMBEDDINGS_STARTUP_PROBE: bool = False  # Llamada de prueba al servicio de embeddings al inicializarlo
+    VECTOR_STORE_STARTUP_PROBE: bool = False  # Búsqueda de prueba al inicializar el almacén vectorial
+    NLTK_DOWNLOAD_ON_STARTUP: bool = False  # Descargar recursos NLTK que falten durante el calentamiento
+    
+    # Configuración de la instrumentación
+    SERVER_TIMING_ENABLED: bool = True  # Desglose de latencia por etapa en la cabecera Server-Timing
+    
+    # Configuración de administración
+    ADMIN_API_KEY: str = ""  # Clave de los endpoints /api/admin (cabecera X-Admin-Key); vacío los desactiva
+    
     # Configuración CORS
     CORS_ORIGINS: list = ["http://localhost:5173"]
     
@@ -39,6 +169,13 @@ class Settings(BaseSettings):
 # Instancia singleton de configuración
 settings = Settings()
 
-# Validar configuración crítica
-if not settings.OPENAI_API_KEY:
-    raise ValueError("No se encontró la clave API de OpenAI en las variables de entorno")
\ No newline at end of file
+def validate_settings() -> None:
+    """Valida la configuración crítica (se llama al calentar, no al importar)"""
+    if not settings.OPENAI_API_KEY:
+        raise ValueError("No se encontró la clave API de OpenAI en las variables de entorno")
+    if settings.VECTOR_DB_BACKEND not in ("qdrant", "local"):
+        raise ValueError(f"VECTOR_DB_BACKEND no válido: '{settings.VECTOR_DB_BACKEND}' (use 'qdrant' o 'local')")
+    if settings.SESSION_BACKEND not in ("memory", "sqlite"):
+        raise ValueError(f"SESSION_BACKEND no válido: '{settings.SESSION_BACKEND}' (use 'memory' o 'sqlite')")
+    if settings.VECTOR_DB_QUANTIZATION not in ("", "int8"):
+        raise ValueError(f"VECTOR_DB_QUANTIZATION no válido: '{settings.VECTOR_DB_QUANTIZATION}' (use 'int8' o '')")
\ No newline at end of file
@@ -1,7 +1,5 @@
 import logging
 import sys
-import nltk
-import pathlib
 
 def setup_logging():
     """Configura el logging para la aplicación"""
@@ -13,24 +11,7 @@ def setup_logging():
     )
     logger = logging.getLogger("rag-app")
     
-    # Descargar recursos NLTK si no existen
-    nltk_data_path = nltk.data.path[0]
-    resources = [
-        'punkt',
-        'punkt_tab',
-        'averaged_perceptron_tagger_eng',
-        'averaged_perceptron_tagger',
-        'stopwords',
-        'wordnet',
-        'omw-1.4'
-    ]
-
-    for resource in resources:
-        resource_path = pathlib.Path(nltk_data_path) / resource
-        if not resource_path.exists():
-            logger.info(f"Descargando recurso NLTK: {resource}")
-            nltk.download(resource)
-        else:
-            logger.info(f"El recurso NLTK ya existe: {resource}")
+    # Los recursos NLTK se instalan al construir la imagen (app/core/nltk_resources.py)
+    # o en el calentamiento en segundo plano si NLTK_DOWNLOAD_ON_STARTUP está activo
     
-    return logger
\ No newline at end of file
+    return logger
@@ -0,0 +1,179 @@
+"""
+Métricas del proceso (contadores, medidores e histogramas con etiquetas).
+
+Cada métrica se registra una sola vez por nombre; llamar de nuevo a counter(),
+gauge() o histogram() con el mismo nombre devuelve la métrica existente. snapshot() devuelve
+el estado actual de todas ellas.
+"""
+import bisect
+import itertools
+import threading
+from typing import Any, Dict, Iterable, List, Tuple
+
+# Límites por defecto de los histogramas de duración, en segundos
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry: Dict[str, "_Metric"] = {}
+_registry_lock = threading.Lock()
+
+class _Metric:
+    """Métrica con valores por combinación de etiquetas"""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"La métrica '{self.name}' espera las etiquetas {self.labelnames}, recibió {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = list(self._values.items())
+        return [{"labels": dict(zip(self.labelnames, key)), "value": value} for key, value in items]
+
+class Counter(_Metric):
+    """Contador monótono"""
+
+    type = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        if amount < 0:
+            raise ValueError("Un contador solo puede incrementarse")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+class Gauge(_Metric):
+    """Valor que puede subir y bajar"""
+
+    type = "gauge"
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+class Histogram(_Metric):
+    """Distribución de observaciones en intervalos, con suma y recuento"""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Por combinación de etiquetas: [observaciones por intervalo (el último es +Inf)..., suma]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def value(self, **labels: Any) -> float:
+        """Número de observaciones"""
+        series = self._series.get(self._key(labels))
+        return sum(series[:-1]) if series else 0.0
+
+    def sum(self, **labels: Any) -> float:
+        series = self._series.get(self._key(labels))
+        return series[-1] if series else 0.0
+
+    def samples(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        samples = []
+        for key, series in items:
+            # Recuentos acumulados (observaciones <= límite), como en Prometheus
+            cumulative = list(itertools.accumulate(series[:-1]))
+            samples.append({
+                "labels": dict(zip(self.labelnames, key)),
+                "buckets": {str(bound): count for bound, count in zip(self.buckets, cumulative)},
+                "sum": series[-1],
+                "count": cumulative[-1],
+            })
+        return samples
+
+def _get_or_create(cls, name: str, documentation: str, labelnames: Iterable[str], **options: Any) -> Any:
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = cls(name, documentation, labelnames, **options)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"La métrica '{name}' ya está registrada como {metric.type}")
+        return metric
+
+def counter(name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+    return _get_or_create(Counter, name, documentation, labelnames)
+
+def gauge(name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+    return _get_or_create(Gauge, name, documentation, labelnames)
+
+def histogram(name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+    return _get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+def snapshot() -> Dict[str, Dict[str, Any]]:
+    """Estado actual de todas las métricas registradas"""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    return {
+        metric.name: {"type": metric.type, "help": metric.documentation, "samples": metric.samples()}
+        for metric in metrics
+    }
+
+BACKSLASH = "\\"
+NEWLINE = "\n"
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+def _escape(value: str) -> str:
+    return value.replace(BACKSLASH, BACKSLASH * 2).replace(NEWLINE, "\\n").replace('"', '\\"')
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + "}"
+
+def render_prometheus() -> str:
+    """Todas las métricas en el formato de texto de Prometheus (versión 0.0.4)"""
+    with _registry_lock:
+        metrics = list(_registry.values())
+
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation.replace(BACKSLASH, BACKSLASH * 2).replace(NEWLINE, ' ')}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for sample in metric.samples():
+            labels = sample["labels"]
+            if metric.type != "histogram":
+                lines.append(f"{metric.name}{_format_labels(labels)} {_format_value(sample['value'])}")
+                continue
+            for bound, count in sample["buckets"].items():
+                lines.append(f"{metric.name}_bucket{_format_labels({**labels, 'le': bound})} {_format_value(count)}")
+            lines.append(f"{metric.name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {_format_value(sample['count'])}")
+            lines.append(f"{metric.name}_sum{_format_labels(labels)} {_format_value(sample['sum'])}")
+            lines.append(f"{metric.name}_count{_format_labels(labels)} {_format_value(sample['count'])}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,44 @@
+"""
+Recursos NLTK que necesita `unstructured` para procesar los PDF.
+
+Se descargan al construir la imagen Docker para no hacerlo en cada arranque:
+    python -m app.core.nltk_resources
+"""
+import logging
+
+logger = logging.getLogger("rag-app")
+
+# Recurso NLTK -> ruta relativa dentro de nltk_data
+NLTK_RESOURCES = {
+    "punkt": "tokenizers/punkt",
+    "punkt_tab": "tokenizers/punkt_tab",
+    "averaged_perceptron_tagger_eng": "taggers/averaged_perceptron_tagger_eng",
+    "averaged_perceptron_tagger": "taggers/averaged_perceptron_tagger",
+    "stopwords": "corpora/stopwords",
+    "wordnet": "corpora/wordnet",
+    "omw-1.4": "corpora/omw-1.4",
+}
+
+def missing_nltk_resources():
+    """Devuelve los recursos NLTK que no están instalados"""
+    import nltk
+
+    missing = []
+    for resource, path in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            missing.append(resource)
+    return missing
+
+def ensure_nltk_resources() -> None:
+    """Descarga los recursos NLTK que falten"""
+    import nltk
+
+    for resource in missing_nltk_resources():
+        logger.info(f"Descargando recurso NLTK: {resource}")
+        nltk.download(resource, quiet=True)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    ensure_nltk_resources()
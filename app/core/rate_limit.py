@@ -0,0 +1,70 @@
+import logging
+import random
+import threading
+import time
+from typing import Any, Callable, Tuple, Type, TypeVar
+
+logger = logging.getLogger("rag-app")
+
+T = TypeVar("T")
+
+class TokenBucket:
+    """Limitador de tasa token bucket, seguro entre hilos"""
+
+    def __init__(self, rate_per_second: float, capacity: float):
+        self.rate_per_second = rate_per_second
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        """Repone tokens según el tiempo transcurrido (llamar con el lock adquirido)"""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate_per_second)
+        self._updated_at = now
+
+    def try_acquire(self, amount: float = 1.0) -> float:
+        """Consume `amount` tokens si hay disponibles; si no, devuelve los segundos de espera necesarios"""
+        # Una petición mayor que la capacidad nunca cabría: se limita a la capacidad
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return 0.0
+            return (amount - self._tokens) / self.rate_per_second
+
+    def acquire(self, amount: float = 1.0) -> None:
+        """Espera (bloqueando el hilo) hasta poder consumir `amount` tokens"""
+        while True:
+            wait_seconds = self.try_acquire(amount)
+            if wait_seconds <= 0:
+                return
+            time.sleep(wait_seconds)
+
+def backoff_delay(attempt: int, base_seconds: float, max_seconds: float) -> float:
+    """Espera exponencial con jitter completo para el intento `attempt` (desde 1)"""
+    return random.uniform(0, min(max_seconds, base_seconds * 2 ** (attempt - 1)))
+
+def call_with_retries(
+    func: Callable[..., T],
+    *args: Any,
+    retries: int = 5,
+    base_seconds: float = 1.0,
+    max_seconds: float = 30.0,
+    retry_on: Tuple[Type[BaseException], ...] = (Exception,),
+    **kwargs: Any
+) -> T:
+    """Llama a `func` reintentando los errores indicados con backoff exponencial y jitter"""
+    attempt = 0
+    while True:
+        try:
+            return func(*args, **kwargs)
+        except retry_on as e:
+            attempt += 1
+            if attempt > retries:
+                raise
+            delay = backoff_delay(attempt, base_seconds, max_seconds)
+            logger.warning(f"Error en {getattr(func, '__name__', 'llamada')} ({e}); reintento {attempt}/{retries} en {delay:.1f} s")
+            time.sleep(delay)
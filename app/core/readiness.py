@@ -0,0 +1,31 @@
+import time
+from typing import Any, Dict, Optional
+
+# Estado de preparación del proceso (liveness != readiness)
+_started_at = time.monotonic()
+_ready_at: Optional[float] = None
+_error: Optional[str] = None
+
+def mark_ready() -> None:
+    """Marca el proceso como listo para servir peticiones"""
+    global _ready_at, _error
+    _ready_at = time.monotonic()
+    _error = None
+
+def mark_failed(error: str) -> None:
+    """Registra un fallo del calentamiento"""
+    global _error
+    _error = error
+
+def is_ready() -> bool:
+    """Indica si el calentamiento terminó correctamente"""
+    return _ready_at is not None
+
+def readiness_status() -> Dict[str, Any]:
+    """Estado de preparación para el endpoint de readiness"""
+    return {
+        "status": "ready" if is_ready() else ("failed" if _error else "starting"),
+        "ready": is_ready(),
+        "detail": _error,
+        "startup_seconds": (_ready_at - _started_at) if _ready_at is not None else None
+    }
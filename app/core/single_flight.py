@@ -0,0 +1,94 @@
+"""
+Coalescencia de cálculos idénticos en curso (single-flight).
+
+La primera llamada con una clave lanza el cálculo como tarea; las llamadas
+concurrentes con la misma clave se unen a ella en lugar de repetirlo. El cálculo
+puede publicar fragmentos parciales (p. ej. tokens del LLM), que se difunden a
+todos los suscriptores, incluidos los que se unen tarde: reciben primero lo ya
+publicado. La clave se libera al terminar, de modo que las llamadas posteriores
+lanzan un cálculo nuevo.
+"""
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger("rag-app")
+
+# Marca de fin de flujo para los suscriptores
+_DONE = object()
+
+class Flight:
+    """Cálculo compartido: difunde los fragmentos publicados y el resultado final"""
+
+    def __init__(self, func: Callable[["Flight"], Awaitable[Any]]):
+        self._chunks: List[Any] = []
+        self._subscribers: List[asyncio.Queue] = []
+        self.followers = 0
+        self._task = asyncio.ensure_future(func(self))
+        self._task.add_done_callback(self._close)
+
+    def put_nowait(self, chunk: Any) -> None:
+        """Publica un fragmento parcial (misma interfaz que asyncio.Queue para TokenQueueHandler)"""
+        self._chunks.append(chunk)
+        for queue in self._subscribers:
+            queue.put_nowait(chunk)
+
+    def _close(self, _task: "asyncio.Future[Any]") -> None:
+        for queue in self._subscribers:
+            queue.put_nowait(_DONE)
+        self._subscribers.clear()
+
+    def add_done_callback(self, callback: Callable[["asyncio.Future[Any]"], None]) -> None:
+        self._task.add_done_callback(callback)
+
+    @property
+    def chunks_published(self) -> int:
+        return len(self._chunks)
+
+    async def result(self) -> Any:
+        """Espera el resultado; cancelar a un suscriptor no cancela el cálculo compartido"""
+        return await asyncio.shield(self._task)
+
+    async def stream(self) -> AsyncIterator[Any]:
+        """Fragmentos publicados desde el inicio del cálculo hasta su final"""
+        queue: asyncio.Queue = asyncio.Queue()
+        for chunk in self._chunks:
+            queue.put_nowait(chunk)
+        if self._task.done():
+            queue.put_nowait(_DONE)
+        else:
+            self._subscribers.append(queue)
+
+        try:
+            while True:
+                chunk = await queue.get()
+                if chunk is _DONE:
+                    break
+                yield chunk
+        finally:
+            if queue in self._subscribers:
+                self._subscribers.remove(queue)
+
+class SingleFlight:
+    """Registro de cálculos en curso por clave"""
+
+    def __init__(self):
+        self._flights: Dict[Hashable, Flight] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def join(self, key: Optional[Hashable], func: Callable[[Flight], Awaitable[Any]]) -> Tuple[Flight, bool]:
+        """Se une al cálculo en curso con la clave o lanza uno nuevo; devuelve (cálculo, es_nuevo)"""
+        if key is None:
+            # Sin clave: cálculo independiente
+            return Flight(func), True
+
+        flight = self._flights.get(key)
+        if flight is not None:
+            flight.followers += 1
+            return flight, False
+
+        flight = self._flights[key] = Flight(func)
+        flight.add_done_callback(lambda _: self._flights.pop(key, None))
+        return flight, True
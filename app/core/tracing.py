@@ -0,0 +1,105 @@
+"""
+Latencia por etapa de cada petición.
+
+stage("nombre") mide un bloque de código: lo observa en el histograma
+rag_stage_seconds{stage} y, si hay una traza de petición activa (la abre el
+middleware HTTP), lo suma a su desglose, que se devuelve en la cabecera
+Server-Timing y en la respuesta de /api/diagnose. record_tokens() suma a la
+traza los tokens enviados y recibidos del LLM en cada paso (reescritura de la
+pregunta, prompt RAG, respuesta), que /api/chat devuelve como `usage`.
+
+La traza viaja en una variable de contexto; run_blocking copia el contexto al
+hilo de trabajo, de modo que las etapas medidas en hilos se suman a la misma traza.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Dict, Iterator, Optional
+
+from app.core import metrics
+
+STAGE_SECONDS = metrics.histogram("rag_stage_seconds", "Duración de cada etapa del procesamiento de una consulta", ["stage"])
+
+# Tipos de tokens que se envían o reciben del LLM (los demás, como "history", son parte de ellos)
+LLM_TOKEN_KINDS = ("rewrite_prompt", "rewrite_completion", "prompt", "completion")
+
+class RequestTrace:
+    """Tiempo acumulado por etapa y tokens por tipo durante una petición"""
+
+    __slots__ = ("start", "stages", "tokens", "_lock")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.tokens: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def add_tokens(self, kind: str, tokens: int) -> None:
+        with self._lock:
+            self.tokens[kind] = self.tokens.get(kind, 0) + tokens
+
+    def usage(self) -> Dict[str, int]:
+        """Tokens por tipo, con el total enviado y recibido del LLM"""
+        with self._lock:
+            usage = dict(self.tokens)
+        usage["total"] = sum(tokens for kind, tokens in usage.items() if kind in LLM_TOKEN_KINDS)
+        return usage
+
+    def timings_ms(self) -> Dict[str, float]:
+        """Desglose en milisegundos, con el total transcurrido hasta ahora"""
+        with self._lock:
+            timings = {stage: round(seconds * 1000, 3) for stage, seconds in self.stages.items()}
+        timings["total"] = round((time.perf_counter() - self.start) * 1000, 3)
+        return timings
+
+    def server_timing(self) -> str:
+        """Valor de la cabecera Server-Timing"""
+        return ", ".join(f"{stage};dur={ms}" for stage, ms in self.timings_ms().items())
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("rag_request_trace", default=None)
+
+def start_trace() -> Token:
+    """Abre una traza para la petición en curso; devuelve el token para cerrarla"""
+    return _current_trace.set(RequestTrace())
+
+def end_trace(token: Token) -> None:
+    _current_trace.reset(token)
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+@contextmanager
+def without_trace() -> Iterator[None]:
+    """Ejecuta el bloque fuera de la traza en curso (trabajo en segundo plano lanzado desde una petición)"""
+    token = _current_trace.set(None)
+    try:
+        yield
+    finally:
+        _current_trace.reset(token)
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Registra la duración de una etapa ya medida"""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+def record_tokens(kind: str, tokens: int) -> None:
+    """Suma tokens de un tipo a la traza de la petición en curso"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_tokens(kind, tokens)
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Mide la duración del bloque como la etapa `name`"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
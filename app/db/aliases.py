@@ -0,0 +1,120 @@
+"""
+Colecciones versionadas y alias de la colección activa.
+
+La reindexación completa (app.db.reindex) construye una colección nueva
+`{VECTOR_DB_COLLECTION}_v{n}` mientras se sigue sirviendo la anterior y después
+cambia el alias de forma atómica:
+
+- Qdrant: alias de colección del servidor con el nombre configurado. Las
+  consultas usan el nombre del alias y el servidor lo resuelve, de modo que
+  todas las réplicas y clientes externos pasan a la colección nueva a la vez.
+  La colección física solo se resuelve (cada ALIAS_REFRESH_SECONDS) para el
+  estado asociado: manifiesto, índice léxico y versión del índice.
+- Índice local: puntero `{alias}.alias` de INDEX_STATE_DIR, sustituido con
+  os.replace; cada proceso lo comprueba antes de consultar.
+
+Sin alias (despliegues anteriores a las colecciones versionadas) el nombre se
+usa tal cual.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from qdrant_client.http import models as rest
+
+from app.core.config import settings
+from app.db.client import get_qdrant_client
+
+logger = logging.getLogger("rag-app")
+
+# Destino resuelto por alias, con la fecha de modificación del puntero (índice local)
+# o el instante de la consulta al servidor (Qdrant)
+_resolved: Dict[str, Tuple[float, str]] = {}
+_lock = threading.Lock()
+
+def alias_path(alias: str) -> str:
+    return os.path.join(settings.INDEX_STATE_DIR, f"{alias}.alias")
+
+def versioned_name(alias: str, version: int) -> str:
+    return f"{alias}_v{version}"
+
+def collection_version(alias: str, collection_name: str) -> Optional[int]:
+    """Número de versión de una colección versionada del alias; None si no lo es"""
+    match = re.fullmatch(rf"{re.escape(alias)}_v(\d+)", collection_name)
+    return int(match.group(1)) if match else None
+
+def resolve_collection(name: Optional[str] = None) -> str:
+    """Colección física a la que apunta un alias (por defecto VECTOR_DB_COLLECTION)"""
+    name = name or settings.VECTOR_DB_COLLECTION
+    if settings.VECTOR_DB_BACKEND == "qdrant":
+        return _resolve_server_alias(name)
+
+    path = alias_path(name)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return name
+
+    cached = _resolved.get(name)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with _lock:
+        with open(path, encoding="utf-8") as f:
+            target = f.read().strip() or name
+        _resolved[name] = (mtime, target)
+    return target
+
+def _resolve_server_alias(name: str) -> str:
+    """Colección del alias de Qdrant, consultada como mucho cada ALIAS_REFRESH_SECONDS"""
+    cached = _resolved.get(name)
+    now = time.monotonic()
+    if cached and now - cached[0] < settings.ALIAS_REFRESH_SECONDS:
+        return cached[1]
+
+    with _lock:
+        cached = _resolved.get(name)
+        if cached and now - cached[0] < settings.ALIAS_REFRESH_SECONDS:
+            return cached[1]
+        try:
+            aliases = {description.alias_name: description.collection_name for description in get_qdrant_client().get_aliases().aliases}
+        except Exception as e:
+            # Sin servidor se mantiene el último destino conocido; las consultas usan el alias igualmente
+            logger.warning(f"No se pudo consultar el alias '{name}' en Qdrant: {e}")
+            return cached[1] if cached else name
+        target = aliases.get(name, name)
+        _resolved[name] = (now, target)
+    return target
+
+def set_alias(alias: str, collection_name: str) -> None:
+    """Apunta el alias a una colección; las consultas posteriores usan la nueva"""
+    if settings.VECTOR_DB_BACKEND == "qdrant":
+        _set_server_alias(alias, collection_name)
+    else:
+        os.makedirs(settings.INDEX_STATE_DIR, exist_ok=True)
+        tmp_path = f"{alias_path(alias)}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(collection_name)
+        os.replace(tmp_path, alias_path(alias))
+    with _lock:
+        _resolved.pop(alias, None)
+    logger.info(f"Alias '{alias}' apuntando a la colección '{collection_name}'")
+
+def _set_server_alias(alias: str, collection_name: str) -> None:
+    """Cambia el alias de colección de Qdrant en una sola operación atómica"""
+    client = get_qdrant_client()
+    aliases = {description.alias_name for description in client.get_aliases().aliases}
+    operations: List[Any] = []
+    if alias in aliases:
+        operations.append(rest.DeleteAliasOperation(delete_alias=rest.DeleteAlias(alias_name=alias)))
+    elif alias in {collection.name for collection in client.get_collections().collections}:
+        # Colección sin versionar de un despliegue anterior: ocupa el nombre del alias. Todas las
+        # réplicas consultan por ese nombre, así que solo pasan a la versión nueva cuando se
+        # libera; las consultas en curso durante el cambio pueden fallar (migración única)
+        logger.warning(f"Eliminando la colección sin versionar '{alias}' para crear el alias con su nombre")
+        client.delete_collection(alias)
+    operations.append(rest.CreateAliasOperation(create_alias=rest.CreateAlias(collection_name=collection_name, alias_name=alias)))
+    client.update_collection_aliases(change_aliases_operations=operations)
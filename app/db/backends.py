@@ -0,0 +1,195 @@
+"""
+Backends del almacén vectorial, seleccionados con VECTOR_DB_BACKEND.
+
+- "qdrant": Qdrant remoto (VECTOR_DB_URL) o embebido (VECTOR_DB_LOCATION).
+- "local": índice NumPy con memoria mapeada en LOCAL_INDEX_DIR (app.db.local_index).
+
+El indexador escribe a través de un destino (sink) con la misma interfaz en ambos
+backends; las consultas usan un VectorStore de langchain. Los nombres de colección
+se resuelven a través de los alias de app.db.aliases; en Qdrant las consultas usan
+el nombre del alias, que resuelve el servidor.
+"""
+import logging
+import os
+import shutil
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from langchain.embeddings.base import Embeddings
+from langchain.schema import Document
+from langchain.vectorstores import Qdrant
+from langchain.vectorstores.base import VectorStore
+from qdrant_client import QdrantClient
+from qdrant_client.http import models as rest
+from qdrant_client.http.exceptions import ResponseHandlingException, UnexpectedResponse
+
+from app.core.config import settings
+from app.db.aliases import resolve_collection
+from app.db.client import get_qdrant_client
+from app.db.local_index import LocalIndexWriter, LocalVectorIndex
+from app.db.schema import create_collection, ensure_schema, qdrant_filter, search_params
+
+logger = logging.getLogger("rag-app")
+
+# Errores de escritura que pueden resolverse reintentando: red y tiempos de espera
+TRANSIENT_ERRORS = (ResponseHandlingException, ConnectionError, TimeoutError)
+
+class QdrantSink:
+    """Destino de indexación sobre una colección de Qdrant"""
+
+    # Cada lote queda persistido al subirlo: una ejecución interrumpida se puede reanudar
+    supports_resume = True
+
+    def __init__(self, client: QdrantClient, collection_name: str):
+        self.client = client
+        self.collection_name = collection_name
+        self._last_batch: Optional[List[rest.PointStruct]] = None
+
+    def count(self) -> Optional[int]:
+        """Número de puntos de la colección; None si no existe (cualquier otro error se propaga)"""
+        try:
+            return self.client.count(collection_name=self.collection_name, exact=True).count
+        except UnexpectedResponse as e:
+            if e.status_code == 404:
+                return None
+            raise
+        except ValueError as e:
+            # Qdrant embebido indica así que la colección no existe
+            if "not found" in str(e):
+                return None
+            raise
+
+    def drop(self) -> None:
+        self.client.delete_collection(self.collection_name)
+
+    def ensure(self, vector_size: int) -> None:
+        """Crea la colección con el esquema configurado si no existe; si existe, completa su esquema"""
+        if self.count() is None:
+            create_collection(self.client, self.collection_name, vector_size)
+        else:
+            ensure_schema(self.client, self.collection_name)
+
+    def upsert(self, ids: List[str], vectors: List[List[float]], payloads: List[Dict[str, Any]], wait: bool = False) -> None:
+        points = [
+            rest.PointStruct(id=point_id, vector=vector, payload=payload)
+            for point_id, vector, payload in zip(ids, vectors, payloads)
+        ]
+        self.client.upsert(collection_name=self.collection_name, points=points, wait=wait)
+        self._last_batch = None if wait else points
+
+    def delete(self, ids: List[str]) -> None:
+        self.client.delete(
+            collection_name=self.collection_name,
+            points_selector=rest.PointIdsList(points=ids)
+        )
+        # delete espera por defecto: todas las operaciones anteriores ya son visibles
+        self._last_batch = None
+
+    def scroll(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Recorre (id, payload) de todos los puntos"""
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                limit=256,
+                offset=offset,
+                with_payload=True,
+                with_vectors=False
+            )
+            for point in points:
+                yield str(point.id), point.payload or {}
+            if offset is None:
+                return
+
+    def commit(self) -> None:
+        if self._last_batch:
+            # Repetir el último lote esperando: Qdrant aplica las operaciones en orden,
+            # así que al volver todos los lotes anteriores son visibles
+            self.client.upsert(collection_name=self.collection_name, points=self._last_batch, wait=True)
+            self._last_batch = None
+
+def get_index_sink(collection_name: Optional[str] = None):
+    """Destino de indexación del backend configurado"""
+    collection_name = resolve_collection(collection_name)
+    if settings.VECTOR_DB_BACKEND == "local":
+        return LocalIndexWriter(settings.LOCAL_INDEX_DIR, collection_name, keep_versions=settings.LOCAL_INDEX_KEEP_VERSIONS)
+    return QdrantSink(get_qdrant_client(), collection_name)
+
+def open_vector_store(embeddings: Embeddings, collection_name: Optional[str] = None) -> VectorStore:
+    """VectorStore de langchain del backend configurado; sin colección, la activa del alias"""
+    if settings.VECTOR_DB_BACKEND == "local":
+        return LocalVectorIndex(
+            settings.LOCAL_INDEX_DIR,
+            resolve_collection(collection_name),
+            embeddings,
+            refresh_seconds=settings.LOCAL_INDEX_REFRESH_SECONDS
+        )
+    # El alias del servidor cambia de colección de forma atómica para todas las réplicas
+    return Qdrant(client=get_qdrant_client(), collection_name=collection_name or settings.VECTOR_DB_COLLECTION, embeddings=embeddings)
+
+def ensure_collection_schema(collection_name: Optional[str] = None) -> None:
+    """Aplica el esquema configurado (índices de payload, HNSW, cuantización) a una colección de Qdrant existente"""
+    if settings.VECTOR_DB_BACKEND != "qdrant":
+        return
+    ensure_schema(get_qdrant_client(), resolve_collection(collection_name))
+
+def search_options(vector_store: VectorStore, filter: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Argumentos de similarity_search del backend: filtro de metadatos y, en Qdrant, parámetros de búsqueda"""
+    if not isinstance(vector_store, Qdrant):
+        return {"filter": filter}
+    return {"filter": qdrant_filter(filter, vector_store.metadata_payload_key), "search_params": search_params()}
+
+def search_batch(
+    vector_store: VectorStore,
+    vectors: List[List[float]],
+    limits: List[int],
+    filters: Optional[List[Optional[Dict[str, Any]]]] = None
+) -> List[List[Document]]:
+    """Búsqueda vectorial de varias consultas en una sola llamada al backend (límite 0: sin búsqueda)"""
+    filters = filters or [None] * len(vectors)
+    if isinstance(vector_store, LocalVectorIndex):
+        return vector_store.similarity_search_by_vectors(vectors, limits, filters)
+    if not isinstance(vector_store, Qdrant):
+        return [
+            vector_store.similarity_search_by_vector(vector, k=limit, filter=filter) if limit > 0 else []
+            for vector, limit, filter in zip(vectors, limits, filters)
+        ]
+
+    searches = [i for i, limit in enumerate(limits) if limit > 0]
+    requests = [
+        rest.SearchRequest(
+            vector=vectors[i] if vector_store.vector_name is None else rest.NamedVector(name=vector_store.vector_name, vector=vectors[i]),
+            filter=qdrant_filter(filters[i], vector_store.metadata_payload_key) if isinstance(filters[i], dict) else filters[i],
+            limit=limits[i],
+            params=search_params(),
+            with_payload=True
+        )
+        for i in searches
+    ]
+    results: List[List[Document]] = [[] for _ in vectors]
+    if requests:
+        responses = vector_store.client.search_batch(collection_name=vector_store.collection_name, requests=requests)
+        for i, points in zip(searches, responses):
+            results[i] = [
+                Qdrant._document_from_scored_point(point, vector_store.content_payload_key, vector_store.metadata_payload_key)
+                for point in points
+            ]
+    return results
+
+def list_collections() -> List[str]:
+    """Colecciones físicas del backend configurado (sin alias)"""
+    if settings.VECTOR_DB_BACKEND == "local":
+        if not os.path.isdir(settings.LOCAL_INDEX_DIR):
+            return []
+        return sorted(
+            name for name in os.listdir(settings.LOCAL_INDEX_DIR)
+            if os.path.isdir(os.path.join(settings.LOCAL_INDEX_DIR, name))
+        )
+    return sorted(collection.name for collection in get_qdrant_client().get_collections().collections)
+
+def drop_collection(collection_name: str) -> None:
+    """Elimina una colección física"""
+    if settings.VECTOR_DB_BACKEND == "local":
+        # Los procesos que aún mapean sus ficheros los conservan hasta cerrarlos
+        shutil.rmtree(os.path.join(settings.LOCAL_INDEX_DIR, collection_name), ignore_errors=True)
+    else:
+        get_qdrant_client().delete_collection(collection_name)
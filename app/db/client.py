@@ -0,0 +1,30 @@
+import logging
+from typing import Optional
+
+from qdrant_client import QdrantClient
+
+from app.core.config import settings
+
+logger = logging.getLogger("rag-app")
+
+# Singleton para el cliente de Qdrant
+_client: Optional[QdrantClient] = None
+
+def get_qdrant_client() -> QdrantClient:
+    """Obtiene el cliente de Qdrant, creándolo si no existe"""
+    global _client
+
+    if _client is None:
+        if settings.VECTOR_DB_URL:
+            _client = QdrantClient(
+                url=settings.VECTOR_DB_URL,
+                api_key=settings.VECTOR_DB_API_KEY
+            )
+        elif settings.VECTOR_DB_LOCATION == ":memory:":
+            logger.info("VECTOR_DB_URL no configurada: usando Qdrant embebido en memoria")
+            _client = QdrantClient(location=":memory:")
+        else:
+            logger.info(f"VECTOR_DB_URL no configurada: usando Qdrant embebido en '{settings.VECTOR_DB_LOCATION}'")
+            _client = QdrantClient(path=settings.VECTOR_DB_LOCATION)
+
+    return _client
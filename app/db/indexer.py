@@ -0,0 +1,364 @@
+"""
+Indexación incremental de documentos en el almacén vectorial.
+
+Mantiene un manifiesto con el hash de cada fichero y de cada fragmento, de modo
+que solo se generan embeddings para los fragmentos nuevos o modificados y se
+eliminan los puntos de los ficheros borrados. Los IDs de punto se derivan del
+contenido, por lo que repetir la indexación es idempotente.
+
+Uso:
+    python -m app.db.indexer [--dry-run] [--rebuild]
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import resource
+import sys
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from langchain.embeddings.base import Embeddings
+from langchain.schema import Document
+
+from app.core.config import settings
+from app.core.rate_limit import TokenBucket, call_with_retries
+from app.db.backends import TRANSIENT_ERRORS
+from app.db.document_loader import get_text_splitter, list_document_files
+from app.db.lexical_index import build_lexical_index, lexical_index_path
+from app.db.parsing import file_hash, iter_parsed_files
+from app.db.schema import document_metadata
+from app.services.llm_gateway import RETRYABLE_ERRORS
+
+logger = logging.getLogger("rag-app")
+
+MANIFEST_VERSION = 1
+# Espacio de nombres fijo para derivar IDs de punto deterministas (uuid5)
+POINT_ID_NAMESPACE = uuid.UUID("6f0c5a2e-3b1d-4c8e-9a57-2d4e8b1f7c30")
+# Claves de payload que usa langchain.vectorstores.Qdrant (y el índice local)
+CONTENT_KEY = "page_content"
+METADATA_KEY = "metadata"
+
+@dataclass
+class IndexReport:
+    """Resumen de una ejecución del indexador"""
+    files_total: int = 0
+    files_unchanged: int = 0
+    files_indexed: int = 0
+    files_removed: int = 0
+    chunks_skipped: int = 0
+    chunks_added: int = 0
+    chunks_resumed: int = 0
+    chunks_deleted: int = 0
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.chunks_added or self.chunks_deleted)
+
+def chunk_hash(chunk: Document) -> str:
+    """Hash SHA-256 del texto y los metadatos de un fragmento"""
+    payload = json.dumps([chunk.page_content, chunk.metadata], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def point_id(source: str, chunk_digest: str) -> str:
+    """ID de punto determinista para un fragmento de un fichero"""
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{source}\0{chunk_digest}"))
+
+def manifest_path(collection_name: str) -> str:
+    return os.path.join(settings.INDEX_STATE_DIR, f"{collection_name}.manifest.json")
+
+def _manifest_params() -> Dict[str, Any]:
+    """Parámetros que, si cambian, invalidan todos los fragmentos indexados"""
+    return {
+        "version": MANIFEST_VERSION,
+        "embedding_model": settings.OPENAI_EMBEDDING_MODEL,
+        "chunk_size": settings.CHUNK_SIZE,
+        "chunk_overlap": settings.CHUNK_OVERLAP,
+    }
+
+def load_manifest(collection_name: str) -> Optional[Dict[str, Any]]:
+    """Carga el manifiesto de la colección; None si no existe o es de otra configuración"""
+    path = manifest_path(collection_name)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("params") != _manifest_params():
+        logger.info("El manifiesto corresponde a otra configuración de indexación (modelo o fragmentación)")
+        return None
+    return manifest
+
+def save_manifest(collection_name: str, manifest: Dict[str, Any]) -> None:
+    """Guarda el manifiesto de forma atómica"""
+    path = manifest_path(collection_name)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+def _split_file(path: Path, documents: List[Document]) -> List[Tuple[str, str, Document]]:
+    """Divide un fichero ya extraído; devuelve (id, hash, fragmento) sin duplicados"""
+    # Categoría y tipo de documento para filtrar la recuperación por intención
+    metadata = document_metadata(path)
+    for document in documents:
+        document.metadata.update(metadata)
+    chunks = get_text_splitter().split_documents(documents)
+    seen = {}
+    for chunk in chunks:
+        digest = chunk_hash(chunk)
+        seen.setdefault(point_id(str(path), digest), (digest, chunk))
+    return [(chunk_id, digest, chunk) for chunk_id, (digest, chunk) in seen.items()]
+
+# Intervalo mínimo entre mensajes de progreso de la subida
+PROGRESS_LOG_SECONDS = 10.0
+
+class _Checkpoint:
+    """Registro de fragmentos ya subidos, para reanudar una indexación interrumpida"""
+
+    def __init__(self, collection_name: str):
+        self.path = os.path.join(settings.INDEX_STATE_DIR, f"{collection_name}.checkpoint")
+        self.done = set()
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                self.done = {line.strip() for line in f if line.strip()}
+
+    def record(self, chunk_ids: List[str]) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(f"{chunk_id}\n" for chunk_id in chunk_ids))
+        self.done.update(chunk_ids)
+
+    def clear(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.done = set()
+
+def _peak_rss_mb() -> float:
+    """Memoria residente máxima del proceso en MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa en KB, macOS en bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def _upsert_chunks(
+    sink,
+    embeddings: Embeddings,
+    chunks: Iterable[Tuple[str, str, Document]],
+    checkpoint: _Checkpoint
+) -> None:
+    """
+    Genera embeddings y sube los fragmentos por lotes a medida que llegan.
+
+    Mantiene como máximo INDEX_EMBEDDING_CONCURRENCY lotes en vuelo, respeta los
+    límites de peticiones y tokens por minuto y sube cada lote al destino en cuanto
+    tiene sus embeddings. Solo se registran en el checkpoint los lotes confirmados:
+    cada INDEX_CHECKPOINT_BATCHES lotes la subida espera a que Qdrant la aplique.
+    """
+    concurrency = max(settings.INDEX_EMBEDDING_CONCURRENCY, 1)
+    request_bucket = TokenBucket(settings.INDEX_REQUESTS_PER_MINUTE / 60, capacity=concurrency)
+    tokens_per_second = settings.INDEX_TOKENS_PER_MINUTE / 60
+    token_bucket = TokenBucket(tokens_per_second, capacity=tokens_per_second * 10)
+    retry_options = {"retries": settings.INDEX_MAX_RETRIES, "base_seconds": settings.INDEX_RETRY_BASE_SECONDS}
+
+    collection_ready = False
+    uploaded = 0
+    batches = 0
+    # Fragmentos subidos sin confirmar: Qdrant los ha aceptado pero quizá aún no los ha escrito
+    unconfirmed: List[str] = []
+    start = last_log = time.perf_counter()
+
+    def embed(batch: List[Tuple[str, str, Document]]) -> List[List[float]]:
+        texts = [chunk.page_content for _, _, chunk in batch]
+        # Estimación aproximada de tokens (~4 caracteres por token)
+        request_bucket.acquire(1)
+        token_bucket.acquire(sum(len(text) for text in texts) / 4)
+        return call_with_retries(embeddings.embed_documents, texts, retry_on=RETRYABLE_ERRORS, **retry_options)
+
+    def upload(batch: List[Tuple[str, str, Document]], vectors: List[List[float]]) -> None:
+        nonlocal collection_ready, uploaded, batches
+        if not collection_ready:
+            sink.ensure(len(vectors[0]))
+            collection_ready = True
+
+        ids = [chunk_id for chunk_id, _, _ in batch]
+        payloads = [{CONTENT_KEY: chunk.page_content, METADATA_KEY: chunk.metadata} for _, _, chunk in batch]
+        batches += 1
+        # Los lotes intermedios no esperan a que Qdrant los aplique salvo cada INDEX_CHECKPOINT_BATCHES;
+        # como aplica las operaciones en orden, esa espera confirma también los anteriores
+        confirm = sink.supports_resume and batches % max(settings.INDEX_CHECKPOINT_BATCHES, 1) == 0
+        call_with_retries(sink.upsert, ids, vectors, payloads, wait=confirm, retry_on=TRANSIENT_ERRORS, **retry_options)
+        if sink.supports_resume:
+            unconfirmed.extend(ids)
+            if confirm:
+                checkpoint.record(unconfirmed)
+                unconfirmed.clear()
+        uploaded += len(batch)
+
+    def log_progress(force: bool = False) -> None:
+        nonlocal last_log
+        now = time.perf_counter()
+        if not force and now - last_log < PROGRESS_LOG_SECONDS:
+            return
+        last_log = now
+        elapsed = now - start
+        logger.info(
+            f"Indexados {uploaded} fragmentos ({uploaded / elapsed:.1f} fragmentos/s, "
+            f"memoria máxima {_peak_rss_mb():.0f} MB)"
+        )
+
+    chunks = iter(chunks)
+    # Los embeddings se calculan en paralelo; las subidas se hacen en orden desde este hilo
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="rag-index") as executor:
+        in_flight = {}
+        while batch := list(islice(chunks, settings.INDEX_BATCH_SIZE)):
+            if len(in_flight) >= concurrency:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    upload(in_flight.pop(future), future.result())
+                log_progress()
+            in_flight[executor.submit(embed, batch)] = batch
+        for future in list(in_flight):
+            upload(in_flight.pop(future), future.result())
+    if uploaded:
+        log_progress(force=True)
+
+def index_documents(
+    sink,
+    embeddings: Embeddings,
+    dry_run: bool = False,
+    rebuild: bool = False
+) -> IndexReport:
+    """
+    Sincroniza la colección con el directorio de documentos de forma incremental.
+
+    `sink` es el destino de indexación del backend (ver app.db.backends.get_index_sink).
+    """
+    collection_name = sink.collection_name
+    report = IndexReport()
+
+    checkpoint = _Checkpoint(collection_name)
+    if rebuild and not dry_run and sink.count() is not None:
+        logger.info(f"Eliminando colección '{collection_name}' para reconstruirla")
+        sink.drop()
+
+    points = sink.count()
+    if not points or not sink.supports_resume:
+        # El checkpoint solo es válido mientras existan los puntos que registra
+        checkpoint.clear()
+    elif checkpoint.done:
+        logger.info(f"Reanudando indexación interrumpida: {len(checkpoint.done)} fragmentos ya subidos")
+    manifest = load_manifest(collection_name) if points else None
+    if manifest is None and points and not checkpoint.done:
+        # Los puntos existentes no tienen IDs deterministas: se duplicarían
+        raise RuntimeError(
+            f"La colección '{collection_name}' tiene {points} puntos pero no hay manifiesto compatible; "
+            "ejecute el indexador con --rebuild"
+        )
+    previous_files: Dict[str, Dict[str, Any]] = (manifest or {}).get("files", {})
+    files: Dict[str, Dict[str, Any]] = {}
+
+    to_delete: List[str] = []
+
+    # Fase 1: detectar ficheros sin cambios por hash, sin extraer su texto
+    changed_files: List[Tuple[Path, str]] = []
+    current_sources = set()
+    for path in list_document_files():
+        source = str(path)
+        current_sources.add(source)
+        report.files_total += 1
+        digest = file_hash(path)
+        previous = previous_files.get(source)
+
+        if previous and previous["hash"] == digest:
+            files[source] = previous
+            report.files_unchanged += 1
+            report.chunks_skipped += len(previous["chunks"])
+        else:
+            changed_files.append((path, digest))
+
+    # Ficheros eliminados del directorio de documentos
+    for source, previous in previous_files.items():
+        if source not in current_sources:
+            to_delete.extend(previous["chunks"])
+            report.files_removed += 1
+            logger.info(f"Fichero eliminado: {source}")
+
+    # Fase 2: extraer y dividir los ficheros modificados a medida que terminan
+    changed_digests = dict(changed_files)
+
+    def new_chunks() -> Iterator[Tuple[str, str, Document]]:
+        for path, documents in iter_parsed_files(changed_files):
+            source = str(path)
+            chunks = _split_file(path, documents)
+            previous = previous_files.get(source)
+            previous_chunks = previous["chunks"] if previous else {}
+            current_chunks = {chunk_id: chunk_digest for chunk_id, chunk_digest, _ in chunks}
+
+            added = [chunk for chunk in chunks if chunk[0] not in previous_chunks]
+            to_delete.extend(chunk_id for chunk_id in previous_chunks if chunk_id not in current_chunks)
+            # Fragmentos subidos por una ejecución anterior interrumpida
+            resumed = [chunk for chunk in added if chunk[0] in checkpoint.done]
+            added = [chunk for chunk in added if chunk[0] not in checkpoint.done]
+
+            report.files_indexed += 1
+            report.chunks_added += len(added)
+            report.chunks_resumed += len(resumed)
+            report.chunks_skipped += len(chunks) - len(added) - len(resumed)
+            files[source] = {"hash": changed_digests[path], "chunks": current_chunks}
+            logger.info(f"Fichero modificado o nuevo: {source} ({len(added)} fragmentos nuevos)")
+            yield from added
+
+    if dry_run:
+        for _ in new_chunks():
+            pass
+        report.chunks_deleted = len(to_delete)
+        return report
+
+    # Fase 3: generar embeddings y subir por lotes; después, eliminar lo obsoleto
+    _upsert_chunks(sink, embeddings, new_chunks(), checkpoint)
+    report.chunks_deleted = len(to_delete)
+    if to_delete:
+        sink.delete(to_delete)
+    sink.commit()
+
+    if settings.LEXICAL_INDEX_ENABLED and (report.changed or not os.path.exists(lexical_index_path(collection_name))):
+        build_lexical_index(sink)
+
+    save_manifest(collection_name, {"params": _manifest_params(), "files": files})
+    checkpoint.clear()
+    logger.info(
+        f"Indexación completada: {report.chunks_added} fragmentos añadidos, "
+        f"{report.chunks_skipped} sin cambios, {report.chunks_deleted} eliminados"
+    )
+    return report
+
+def main() -> None:
+    from app.core.config import validate_settings
+    from app.core.logging import setup_logging
+    from app.db.backends import get_index_sink
+    from app.services.embeddings import get_index_embeddings
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="Calcular cambios sin modificar la colección")
+    parser.add_argument("--rebuild", action="store_true", help="Eliminar la colección y reindexar todo")
+    parser.add_argument("--collection", default=None, help="Colección destino (por defecto VECTOR_DB_COLLECTION)")
+    args = parser.parse_args()
+
+    setup_logging()
+    validate_settings()
+    report = index_documents(
+        get_index_sink(args.collection),
+        get_index_embeddings(),
+        dry_run=args.dry_run,
+        rebuild=args.rebuild
+    )
+    print(json.dumps(asdict(report), indent=2))
+
+if __name__ == "__main__":
+    main()
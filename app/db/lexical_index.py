@@ -0,0 +1,189 @@
+"""
+Índice léxico BM25 de los fragmentos indexados.
+
+Se construye al final de la indexación recorriendo la colección y se guarda en un
+único .npz con forma compacta (CSR): para cada término, los fragmentos en los que
+aparece y su peso BM25 ya calculado. Una consulta solo suma los pesos de las
+listas de sus términos, sin recorrer los textos.
+
+Los textos y metadatos se guardan como JSON concatenado en un bloque de bytes con
+sus desplazamientos, y solo se decodifican los fragmentos devueltos.
+"""
+import json
+import logging
+import math
+import os
+import re
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain.schema import Document
+
+from app.core.config import settings
+from app.db.local_index import metadata_matches
+
+logger = logging.getLogger("rag-app")
+
+# Parámetros BM25 habituales
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Palabras vacías frecuentes en los documentos (castellano, catalán, inglés)
+STOPWORDS = frozenset("""
+a al algo como con de del el en es esta este esto ha hay la las le lo los mas me mi muy no o para
+pero por que se si sin sobre su sus te tu un una uno y ya donde cual cuales cuando quien
+els les amb per una i
+an and are at be by for from in is it of on or the to with
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    """Términos de un texto: minúsculas, sin acentos, alfanuméricos y sin palabras vacías"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return [term for term in re.findall(r"[a-z0-9]+", text) if term not in STOPWORDS]
+
+def lexical_index_path(collection_name: str) -> str:
+    return os.path.join(settings.INDEX_STATE_DIR, f"{collection_name}.bm25.npz")
+
+def _pack_strings(values: List[bytes]) -> Tuple[np.ndarray, np.ndarray]:
+    """Concatena cadenas codificadas en un bloque de bytes con sus desplazamientos"""
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(value) for value in values])
+    return np.frombuffer(b"".join(values), dtype=np.uint8), offsets
+
+class BM25Index:
+    """Índice invertido BM25 con pesos precalculados en arrays CSR"""
+
+    def __init__(
+        self,
+        terms: List[str],
+        indptr: np.ndarray,
+        doc_indices: np.ndarray,
+        weights: np.ndarray,
+        payload_blob: np.ndarray,
+        payload_offsets: np.ndarray
+    ):
+        self.vocabulary = {term: i for i, term in enumerate(terms)}
+        self.indptr = indptr
+        self.doc_indices = doc_indices
+        self.weights = weights
+        self.payload_blob = payload_blob
+        self.payload_offsets = payload_offsets
+        self._metadata: Optional[List[Dict[str, Any]]] = None
+
+    def __len__(self) -> int:
+        return len(self.payload_offsets) - 1
+
+    @classmethod
+    def build(cls, chunks: Iterable[Tuple[str, Dict[str, Any]]]) -> "BM25Index":
+        """Construye el índice a partir de (id, payload) con las claves page_content y metadata"""
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        doc_lengths: List[int] = []
+        payloads: List[bytes] = []
+
+        for doc, (chunk_id, payload) in enumerate(chunks):
+            terms = tokenize(payload.get("page_content", ""))
+            doc_lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                postings.setdefault(term, []).append((doc, tf))
+            payloads.append(json.dumps({"id": chunk_id, **payload}, ensure_ascii=False, default=str).encode("utf-8"))
+
+        n_docs = len(doc_lengths)
+        lengths = np.asarray(doc_lengths, dtype=np.float32)
+        avg_length = float(lengths.mean()) if n_docs and lengths.mean() > 0 else 1.0
+
+        terms = sorted(postings)
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(postings[term]) for term in terms])
+        doc_indices = np.empty(indptr[-1], dtype=np.int32)
+        weights = np.empty(indptr[-1], dtype=np.float32)
+
+        for i, term in enumerate(terms):
+            docs, tfs = zip(*postings[term])
+            docs = np.asarray(docs, dtype=np.int32)
+            tfs = np.asarray(tfs, dtype=np.float32)
+            df = len(docs)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[docs] / avg_length)
+            doc_indices[indptr[i]:indptr[i + 1]] = docs
+            weights[indptr[i]:indptr[i + 1]] = idf * tfs * (BM25_K1 + 1) / (tfs + norm)
+
+        payload_blob, payload_offsets = _pack_strings(payloads)
+        return cls(terms, indptr, doc_indices, weights, payload_blob, payload_offsets)
+
+    def save(self, path: str) -> None:
+        """Guarda el índice de forma atómica"""
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        term_blob, term_offsets = _pack_strings([term.encode("utf-8") for term in terms])
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            term_blob=term_blob,
+            term_offsets=term_offsets,
+            indptr=self.indptr,
+            doc_indices=self.doc_indices,
+            weights=self.weights,
+            payload_blob=self.payload_blob,
+            payload_offsets=self.payload_offsets
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with np.load(path) as data:
+            term_blob = data["term_blob"].tobytes()
+            term_offsets = data["term_offsets"]
+            terms = [term_blob[term_offsets[i]:term_offsets[i + 1]].decode("utf-8") for i in range(len(term_offsets) - 1)]
+            return cls(
+                terms,
+                data["indptr"],
+                data["doc_indices"],
+                data["weights"],
+                data["payload_blob"],
+                data["payload_offsets"]
+            )
+
+    def _payload(self, doc: int) -> Dict[str, Any]:
+        start, end = self.payload_offsets[doc], self.payload_offsets[doc + 1]
+        return json.loads(self.payload_blob[start:end].tobytes().decode("utf-8"))
+
+    def _filter_mask(self, filter: Dict[str, Any]) -> np.ndarray:
+        if self._metadata is None:
+            self._metadata = [self._payload(doc).get("metadata") or {} for doc in range(len(self))]
+        return np.fromiter((metadata_matches(metadata, filter) for metadata in self._metadata), dtype=bool, count=len(self))
+
+    def search(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None) -> List[Tuple[Document, float]]:
+        """Fragmentos con mayor puntuación BM25 para la consulta"""
+        scores = np.zeros(len(self), dtype=np.float32)
+        for term in set(tokenize(query)):
+            i = self.vocabulary.get(term)
+            if i is not None:
+                start, end = self.indptr[i], self.indptr[i + 1]
+                # Cada fragmento aparece una sola vez por término: suma vectorizada sin conflictos
+                scores[self.doc_indices[start:end]] += self.weights[start:end]
+
+        if filter:
+            scores[~self._filter_mask(filter)] = 0
+        matched = np.flatnonzero(scores)
+        if not len(matched) or k <= 0:
+            return []
+
+        k = min(k, len(matched))
+        top = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        for doc in top:
+            payload = self._payload(int(doc))
+            results.append((Document(page_content=payload.get("page_content", ""), metadata=payload.get("metadata") or {}), float(scores[doc])))
+        return results
+
+def build_lexical_index(sink) -> BM25Index:
+    """Reconstruye y guarda el índice léxico de la colección del destino de indexación"""
+    index = BM25Index.build(sink.scroll())
+    index.save(lexical_index_path(sink.collection_name))
+    logger.info(f"Índice léxico BM25 de '{sink.collection_name}' construido: {len(index)} fragmentos, {len(index.vocabulary)} términos")
+    return index
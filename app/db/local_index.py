@@ -0,0 +1,349 @@
+"""
+Índice vectorial local en disco, alternativa embebida a Qdrant.
+
+Cada colección es un directorio con versiones inmutables:
+
+    {LOCAL_INDEX_DIR}/{colección}/CURRENT          nombre de la versión activa
+    {LOCAL_INDEX_DIR}/{colección}/v{n}/vectors.npy  embeddings float32 normalizados (N x D)
+    {LOCAL_INDEX_DIR}/{colección}/v{n}/chunks.jsonl id, texto y metadatos de cada fila
+
+Los vectores se abren con memoria mapeada en solo lectura, de modo que todos los
+workers de uvicorn comparten las mismas páginas a través de la caché del sistema
+operativo. Las escrituras crean una versión nueva y cambian CURRENT de forma atómica;
+las versiones anteriores se conservan (`keep_versions`) para los lectores que aún
+las usan y se eliminan en las publicaciones siguientes (collect_garbage). Los
+lectores comprueban CURRENT (inodo y mtime) como mucho cada `refresh_seconds`.
+"""
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Type
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+from langchain.schema import Document
+from langchain.vectorstores.base import VectorStore
+
+logger = logging.getLogger("rag-app")
+
+CURRENT_FILE = "CURRENT"
+VECTORS_FILE = "vectors.npy"
+CHUNKS_FILE = "chunks.jsonl"
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """Normaliza las filas a norma 1 para que el producto escalar sea la similitud coseno"""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def _current_version(directory: str) -> Optional[str]:
+    try:
+        with open(os.path.join(directory, CURRENT_FILE), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def _read_version(directory: str, version: str) -> Tuple[np.ndarray, List[Dict[str, Any]]]:
+    """Abre una versión: vectores con memoria mapeada y filas de metadatos"""
+    path = os.path.join(directory, version)
+    vectors = np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r")
+    with open(os.path.join(path, CHUNKS_FILE), encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f]
+    return vectors, rows
+
+def metadata_matches(metadata: Dict[str, Any], filter: Dict[str, Any]) -> bool:
+    """Filtro por igualdad de metadatos; una lista como valor equivale a "cualquiera de" """
+    for key, expected in filter.items():
+        value = metadata.get(key)
+        if isinstance(expected, (list, tuple, set)):
+            if value not in expected:
+                return False
+        elif value != expected:
+            return False
+    return True
+
+class LocalIndexWriter:
+    """Destino de indexación para el índice local: acumula cambios y publica una versión nueva"""
+
+    # Los lotes solo se persisten al confirmar: no se puede reanudar una ejecución a medias
+    supports_resume = False
+
+    def __init__(self, directory: str, collection_name: str, keep_versions: int = 2):
+        self.collection_name = collection_name
+        self.directory = os.path.join(directory, collection_name)
+        # Versiones conservadas al publicar, incluida la activa
+        self.keep_versions = keep_versions
+        self._rows: Optional[Dict[str, Tuple[np.ndarray, Dict[str, Any]]]] = None
+        self._dirty = False
+
+    def _load(self) -> Dict[str, Tuple[np.ndarray, Dict[str, Any]]]:
+        if self._rows is None:
+            self._rows = {}
+            version = _current_version(self.directory)
+            if version:
+                vectors, rows = _read_version(self.directory, version)
+                for vector, row in zip(vectors, rows):
+                    self._rows[row["id"]] = (np.array(vector), row["payload"])
+        return self._rows
+
+    def count(self) -> Optional[int]:
+        """Número de fragmentos de la versión activa; None si la colección no existe"""
+        if self._rows is not None:
+            return len(self._rows)
+        version = _current_version(self.directory)
+        if version is None:
+            return None
+        # Solo se lee la cabecera del .npy
+        return np.load(os.path.join(self.directory, version, VECTORS_FILE), mmap_mode="r").shape[0]
+
+    def drop(self) -> None:
+        self._rows = {}
+        self._dirty = True
+
+    def ensure(self, vector_size: int) -> None:
+        self._load()
+
+    def upsert(self, ids: List[str], vectors: List[List[float]], payloads: List[Dict[str, Any]], wait: bool = False) -> None:
+        rows = self._load()
+        normalized = _normalize(np.asarray(vectors, dtype=np.float32))
+        for chunk_id, vector, payload in zip(ids, normalized, payloads):
+            rows[chunk_id] = (vector, payload)
+        self._dirty = True
+
+    def delete(self, ids: List[str]) -> None:
+        rows = self._load()
+        for chunk_id in ids:
+            rows.pop(chunk_id, None)
+        self._dirty = True
+
+    def scroll(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Recorre (id, payload) de todos los fragmentos"""
+        for chunk_id, (_, payload) in self._load().items():
+            yield chunk_id, payload
+
+    def commit(self) -> None:
+        """Escribe una versión nueva y la activa de forma atómica"""
+        if not self._dirty:
+            return
+        rows = self._load()
+        previous = _current_version(self.directory)
+        number = int(previous[1:]) + 1 if previous else 1
+        version = f"v{number}"
+        path = os.path.join(self.directory, version)
+        os.makedirs(path, exist_ok=True)
+
+        dimension = len(next(iter(rows.values()))[0]) if rows else 0
+        matrix = np.zeros((len(rows), dimension), dtype=np.float32)
+        with open(os.path.join(path, CHUNKS_FILE), "w", encoding="utf-8") as f:
+            for i, (chunk_id, (vector, payload)) in enumerate(rows.items()):
+                matrix[i] = vector
+                f.write(json.dumps({"id": chunk_id, "payload": payload}, ensure_ascii=False, default=str) + "\n")
+        np.save(os.path.join(path, VECTORS_FILE), matrix)
+
+        tmp_path = os.path.join(self.directory, f"{CURRENT_FILE}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(version)
+        os.replace(tmp_path, os.path.join(self.directory, CURRENT_FILE))
+        self._dirty = False
+        logger.info(f"Índice local '{self.collection_name}' publicado como {version} ({len(rows)} fragmentos)")
+        self.collect_garbage()
+
+    def collect_garbage(self) -> List[str]:
+        """Elimina las versiones salvo las `keep_versions` más recientes y la activa"""
+        active = _current_version(self.directory)
+        versions = sorted(
+            (int(name[1:]), name) for name in os.listdir(self.directory)
+            if name.startswith("v") and name[1:].isdigit()
+        )
+        # La versión recién sustituida se conserva: otros procesos pueden estar abriéndola
+        # o no haber visto aún el cambio de CURRENT
+        kept = {name for _, name in versions[-max(self.keep_versions, 1):]} | {active}
+        removed = [name for _, name in versions if name not in kept]
+        for name in removed:
+            # Los procesos que aún mapean la versión la conservan hasta cerrarla
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+            logger.info(f"Versión antigua '{name}' del índice local '{self.collection_name}' eliminada")
+        return removed
+
+class LocalVectorIndex(VectorStore):
+    """Almacén vectorial de solo lectura sobre el índice local (producto matricial + argpartition)"""
+
+    def __init__(
+        self,
+        directory: str,
+        collection_name: str,
+        embeddings: Embeddings,
+        content_payload_key: str = "page_content",
+        metadata_payload_key: str = "metadata",
+        refresh_seconds: float = 1.0
+    ):
+        self.directory = os.path.join(directory, collection_name)
+        self.collection_name = collection_name
+        self._embeddings = embeddings
+        self.content_payload_key = content_payload_key
+        self.metadata_payload_key = metadata_payload_key
+        self._lock = threading.Lock()
+        self._version: Optional[str] = None
+        # Intervalo mínimo entre comprobaciones de CURRENT y (inodo, mtime) de la última vista
+        self.refresh_seconds = refresh_seconds
+        self._checked_at = float("-inf")
+        self._current_stat: Optional[Tuple[int, int]] = None
+        # Vectores y filas se sustituyen juntos para que una consulta nunca mezcle versiones
+        self._data: Tuple[np.ndarray, List[Dict[str, Any]]] = (np.zeros((0, 0), dtype=np.float32), [])
+        self._refresh()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embeddings
+
+    def __len__(self) -> int:
+        return len(self._data[1])
+
+    def _refresh(self) -> None:
+        """Abre la versión activa si CURRENT ha cambiado (se comprueba como mucho cada refresh_seconds)"""
+        now = time.monotonic()
+        if now - self._checked_at < self.refresh_seconds:
+            return
+        self._checked_at = now
+        try:
+            # CURRENT se sustituye con os.replace: cambia el inodo aunque el mtime coincida
+            stat = os.stat(os.path.join(self.directory, CURRENT_FILE))
+        except FileNotFoundError:
+            return
+        current_stat = (stat.st_ino, stat.st_mtime_ns)
+        if current_stat == self._current_stat:
+            return
+        with self._lock:
+            if current_stat == self._current_stat:
+                return
+            version = _current_version(self.directory)
+            if version is None:
+                return
+            if version == self._version:
+                self._current_stat = current_stat
+                return
+            try:
+                vectors, rows = _read_version(self.directory, version)
+            except FileNotFoundError:
+                # Versión sustituida mientras se abría: se cargará la siguiente en la próxima comprobación
+                return
+            self._data, self._version, self._current_stat = (vectors, rows), version, current_stat
+            logger.info(f"Índice local '{self.collection_name}' cargado: {version} ({len(rows)} fragmentos)")
+
+    def _document(self, row: Dict[str, Any]) -> Document:
+        payload = row["payload"]
+        return Document(
+            page_content=payload.get(self.content_payload_key, ""),
+            metadata=payload.get(self.metadata_payload_key) or {}
+        )
+
+    def _top_k(self, query_vector: np.ndarray, k: int, filter: Optional[Dict[str, Any]] = None) -> List[Tuple[Dict[str, Any], float]]:
+        self._refresh()
+        vectors, rows = self._data
+        if not rows or k <= 0:
+            return []
+        return self._select(vectors @ query_vector, rows, k, filter)
+
+    def _select(self, scores: np.ndarray, rows: List[Dict[str, Any]], k: int, filter: Optional[Dict[str, Any]] = None) -> List[Tuple[Dict[str, Any], float]]:
+        """Las k filas con mayor puntuación que cumplen el filtro"""
+        if filter:
+            mask = np.fromiter(
+                (metadata_matches(row["payload"].get(self.metadata_payload_key) or {}, filter) for row in rows),
+                dtype=bool,
+                count=len(rows)
+            )
+            scores = np.where(mask, scores, -np.inf)
+            k = min(k, int(mask.sum()))
+            if k == 0:
+                return []
+
+        k = min(k, len(rows))
+        # argpartition selecciona los k mejores en O(N); solo se ordenan esos k
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(rows[i], float(scores[i])) for i in top]
+
+    def similarity_search_by_vectors(
+        self,
+        embeddings: List[List[float]],
+        ks: List[int],
+        filters: Optional[List[Optional[Dict[str, Any]]]] = None
+    ) -> List[List[Document]]:
+        """Búsqueda de varias consultas con un solo producto matricial"""
+        self._refresh()
+        vectors, rows = self._data
+        if not rows or not embeddings:
+            return [[] for _ in embeddings]
+        filters = filters or [None] * len(embeddings)
+        scores = vectors @ _normalize(np.asarray(embeddings, dtype=np.float32)).T
+        return [
+            [self._document(row) for row, _ in self._select(scores[:, i], rows, k, filter)] if k > 0 else []
+            for i, (k, filter) in enumerate(zip(ks, filters))
+        ]
+
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        query_vector = _normalize(np.asarray(embedding, dtype=np.float32))
+        return [(self._document(row), score) for row, score in self._top_k(query_vector, k, filter)]
+
+    def similarity_search_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, filter)]
+
+    def similarity_search_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self._embeddings.embed_query(query), k, filter)
+
+    def similarity_search(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def _similarity_search_with_relevance_scores(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        # Similitud coseno en [-1, 1] llevada a [0, 1]
+        return [(doc, (score + 1) / 2) for doc, score in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, **kwargs: Any) -> List[str]:
+        raise NotImplementedError("El índice local es de solo lectura; use el indexador (python -m app.db.indexer)")
+
+    @classmethod
+    def from_texts(
+        cls: Type["LocalVectorIndex"],
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        directory: str = "./data/local_index",
+        collection_name: str = "docs",
+        **kwargs: Any
+    ) -> "LocalVectorIndex":
+        """Crea (o reemplaza) una colección local con los textos dados"""
+        writer = LocalIndexWriter(directory, collection_name)
+        writer.drop()
+        metadatas = metadatas or [{} for _ in texts]
+        ids = [str(uuid.uuid4()) for _ in texts]
+        payloads = [{"page_content": text, "metadata": metadata} for text, metadata in zip(texts, metadatas)]
+        writer.upsert(ids, embedding.embed_documents(list(texts)), payloads)
+        writer.commit()
+        return cls(directory, collection_name, embedding)
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from langchain.schema import Document
+from unstructured.__version__ import __version__ as unstructured_version
+
+from app.core.config import settings
+
+logger = logging.getLogger("rag-app")
+
+# Cambia al modificar cómo se extrae el texto: invalida la caché de texto extraído
+PARSER_VERSION = f"unstructured-{unstructured_version}/1"
+
+def file_hash(path: Path) -> str:
+    """Hash SHA-256 del contenido de un fichero"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _parse_file(path: str) -> List[Dict[str, Any]]:
+    """Extrae el texto de un fichero (se ejecuta en un proceso del pool)"""
+    # Importar aquí para que los procesos hijos no carguen el resto de la aplicación
+    from app.db.document_loader import load_file
+
+    return [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in load_file(Path(path))]
+
+class ParsedTextCache:
+    """Caché en disco del texto extraído, indexada por hash del fichero y versión del parser"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, file_digest: str) -> str:
+        key = hashlib.sha256(f"{file_digest}\0{PARSER_VERSION}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, file_digest: str) -> Optional[List[Dict[str, Any]]]:
+        try:
+            with open(self._path(file_digest), encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def put(self, file_digest: str, parsed: List[Dict[str, Any]]) -> None:
+        path = self._path(file_digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(parsed, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, path)
+
+def _to_documents(path: Path, parsed: List[Dict[str, Any]]) -> List[Document]:
+    # La caché se indexa por contenido: la fuente es siempre la ruta actual
+    return [Document(page_content=item["page_content"], metadata={**item["metadata"], "source": str(path)}) for item in parsed]
+
+def iter_parsed_files(
+    files: Iterable[Tuple[Path, str]],
+    workers: Optional[int] = None,
+    cache: Optional[ParsedTextCache] = None
+) -> Iterator[Tuple[Path, List[Document]]]:
+    """
+    Extrae el texto de los ficheros (ruta, hash) y lo entrega a medida que cada uno termina.
+
+    Los ficheros presentes en la caché se entregan primero; el resto se procesa en un
+    pool de procesos de `workers` procesos (1 = en serie, en el proceso actual).
+    """
+    workers = workers if workers is not None else settings.PARSE_WORKERS
+    if cache is None and settings.PARSED_TEXT_CACHE_DIR:
+        cache = ParsedTextCache(settings.PARSED_TEXT_CACHE_DIR)
+
+    pending: List[Tuple[Path, str]] = []
+    for path, file_digest in files:
+        parsed = cache.get(file_digest) if cache else None
+        if parsed is not None:
+            yield path, _to_documents(path, parsed)
+        else:
+            pending.append((path, file_digest))
+
+    if not pending:
+        return
+
+    logger.info(f"Extrayendo texto de {len(pending)} ficheros con {max(workers, 1)} procesos")
+    if workers <= 1 or len(pending) == 1:
+        for path, file_digest in pending:
+            parsed = _parse_file(str(path))
+            if cache:
+                cache.put(file_digest, parsed)
+            yield path, _to_documents(path, parsed)
+        return
+
+    # spawn evita heredar hilos y conexiones del proceso del servidor
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=min(workers, len(pending)), mp_context=context) as executor:
+        futures = {executor.submit(_parse_file, str(path)): (path, file_digest) for path, file_digest in pending}
+        for future in as_completed(futures):
+            path, file_digest = futures[future]
+            parsed = future.result()
+            if cache:
+                cache.put(file_digest, parsed)
+            yield path, _to_documents(path, parsed)
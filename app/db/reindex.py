@@ -0,0 +1,279 @@
+"""
+Reindexación completa sin interrupción del servicio.
+
+1. Construye la colección `{VECTOR_DB_COLLECTION}_v{n}` (vectores e índice léxico)
+   mientras la API sigue sirviendo la colección activa.
+2. La valida: número de puntos frente a la activa y consultas de prueba
+   (REINDEX_SMOKE_QUERIES) que deben devolver resultados.
+3. La activa con un cambio atómico del alias (app.db.aliases): en Qdrant, el
+   alias de colección del servidor, por el que consultan todas las réplicas.
+4. Elimina las versiones antiguas, conservando las REINDEX_KEEP_VERSIONS más
+   recientes (incluida la activa). Una versión solo se elimina cuando han pasado
+   REINDEX_GC_GRACE_SECONDS desde que dejó de estar activa, para que todos los
+   lectores hayan cambiado de colección; la API repite la limpieza al vencer el
+   plazo y desde la línea de comandos se lanza con --gc. La colección sin
+   versionar de despliegues anteriores cuenta como la más antigua.
+
+Las peticiones nunca ven una colección a medio construir: hasta el cambio del
+alias consultan la anterior, y después la nueva ya completa.
+
+Uso:
+    python -m app.db.reindex [--keep 2] [--skip-smoke]
+    python -m app.db.reindex --gc   # solo eliminar las versiones antiguas
+
+Con Qdrant embebido (sin VECTOR_DB_URL) la colección pertenece al proceso de la
+API: use POST /api/admin/reindex.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+from langchain.embeddings.base import Embeddings
+
+from app.core.concurrency import run_blocking
+from app.core.config import settings
+from app.db.aliases import collection_version, resolve_collection, set_alias, versioned_name
+from app.db.backends import drop_collection, get_index_sink, list_collections, open_vector_store
+from app.db.indexer import index_documents, manifest_path
+from app.db.lexical_index import lexical_index_path
+from app.services.embeddings import get_index_embeddings
+
+logger = logging.getLogger("rag-app")
+
+class ReindexError(Exception):
+    """La reindexación no se pudo completar; la colección activa no cambia"""
+
+@dataclass
+class ReindexReport:
+    alias: str
+    collection: str
+    previous: Optional[str]
+    points: int
+    chunks_added: int
+    smoke_queries: Dict[str, int] = field(default_factory=dict)
+    removed: List[str] = field(default_factory=list)
+    seconds: float = 0.0
+
+# Una sola reindexación a la vez por proceso
+_lock = threading.Lock()
+
+def next_version(alias: str) -> int:
+    versions = [collection_version(alias, name) for name in list_collections()]
+    return max([version for version in versions if version is not None], default=0) + 1
+
+def _remove_index_state(collection_name: str) -> None:
+    """Elimina manifiesto, checkpoint e índice léxico de una colección"""
+    for path in (
+        manifest_path(collection_name),
+        os.path.join(settings.INDEX_STATE_DIR, f"{collection_name}.checkpoint"),
+        lexical_index_path(collection_name),
+    ):
+        if os.path.exists(path):
+            os.remove(path)
+
+def validate_collection(collection_name: str, embeddings: Embeddings, points: int, previous_points: Optional[int], smoke_queries: List[str]) -> Dict[str, int]:
+    """Comprueba la colección construida antes de activarla; devuelve los resultados por consulta de prueba"""
+    if not points:
+        raise ReindexError(f"La colección '{collection_name}' está vacía")
+    if previous_points and points < previous_points * settings.REINDEX_MIN_POINTS_RATIO:
+        raise ReindexError(
+            f"La colección '{collection_name}' tiene {points} puntos frente a {previous_points} de la activa "
+            f"(mínimo {settings.REINDEX_MIN_POINTS_RATIO:.0%})"
+        )
+    if settings.LEXICAL_INDEX_ENABLED and not os.path.exists(lexical_index_path(collection_name)):
+        raise ReindexError(f"No se generó el índice léxico de '{collection_name}'")
+
+    vector_store = open_vector_store(embeddings, collection_name)
+    results = {}
+    for query in smoke_queries:
+        results[query] = len(vector_store.similarity_search(query, k=3))
+        if not results[query]:
+            raise ReindexError(f"La consulta de prueba '{query}' no devuelve resultados en '{collection_name}'")
+    return results
+
+def _retired_path(alias: str) -> str:
+    return os.path.join(settings.INDEX_STATE_DIR, f"{alias}.retired.json")
+
+def _load_retired(alias: str) -> Dict[str, float]:
+    """Instante en que cada colección del alias dejó de estar activa"""
+    try:
+        with open(_retired_path(alias), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def _save_retired(alias: str, retired: Dict[str, float]) -> None:
+    os.makedirs(settings.INDEX_STATE_DIR, exist_ok=True)
+    tmp_path = f"{_retired_path(alias)}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(retired, f)
+    os.replace(tmp_path, _retired_path(alias))
+
+def activate_collection(alias: str, collection_name: str) -> None:
+    """Apunta el alias a la colección: las peticiones siguientes la consultan"""
+    previous = resolve_collection(alias)
+    set_alias(alias, collection_name)
+    if previous != collection_name:
+        retired = _load_retired(alias)
+        retired[previous] = time.time()
+        retired.pop(collection_name, None)
+        _save_retired(alias, retired)
+
+def collect_garbage(alias: str, keep: int, grace_seconds: Optional[float] = None) -> List[str]:
+    """
+    Elimina las versiones del alias salvo las `keep` más recientes y la activa,
+    siempre que hayan dejado de estar activas hace al menos `grace_seconds`
+    """
+    grace_seconds = settings.REINDEX_GC_GRACE_SECONDS if grace_seconds is None else grace_seconds
+    active = resolve_collection(alias)
+    collections = list_collections()
+    versions = sorted(
+        (version, name) for name in collections
+        if (version := collection_version(alias, name)) is not None
+    )
+    # Colección sin versionar de un despliegue anterior: cuenta como la versión más antigua,
+    # así se conserva mientras otras réplicas o clientes externos puedan estar leyéndola
+    if alias in collections:
+        versions.insert(0, (0, alias))
+    kept = {name for _, name in versions[-max(keep, 1):]} | {active}
+
+    retired = _load_retired(alias)
+    now = time.time()
+    removed = []
+    for _, name in versions:
+        if name in kept:
+            continue
+        # Sin registro (versión de otro proceso o anterior a él): el plazo empieza ahora
+        retired_at = retired.setdefault(name, now)
+        if now - retired_at < grace_seconds:
+            logger.info(f"Colección antigua '{name}' conservada hasta que venza el plazo de {grace_seconds:.0f} s")
+            continue
+        drop_collection(name)
+        _remove_index_state(name)
+        removed.append(name)
+        logger.info(f"Colección antigua '{name}' eliminada")
+    pending = {name for _, name in versions if name not in kept and name not in removed}
+    _save_retired(alias, {name: retired_at for name, retired_at in retired.items() if name in pending or name in kept - {active}})
+    return removed
+
+def reindex(
+    embeddings: Optional[Embeddings] = None,
+    alias: Optional[str] = None,
+    keep: Optional[int] = None,
+    smoke_queries: Optional[List[str]] = None
+) -> ReindexReport:
+    """Construye, valida y activa una versión nueva de la colección (bloqueante)"""
+    embeddings = embeddings or get_index_embeddings()
+    alias = alias or settings.VECTOR_DB_COLLECTION
+    keep = settings.REINDEX_KEEP_VERSIONS if keep is None else keep
+    smoke_queries = settings.REINDEX_SMOKE_QUERIES if smoke_queries is None else smoke_queries
+
+    if not _lock.acquire(blocking=False):
+        raise ReindexError("Ya hay una reindexación en curso")
+    try:
+        start = time.monotonic()
+        previous = resolve_collection(alias)
+        previous_points = get_index_sink(previous).count()
+        collection_name = versioned_name(alias, next_version(alias))
+        logger.info(f"Reindexando '{alias}' en la colección nueva '{collection_name}' (activa: '{previous}')")
+
+        sink = get_index_sink(collection_name)
+        try:
+            index_report = index_documents(sink, embeddings, rebuild=True)
+            points = sink.count() or 0
+            smoke_results = validate_collection(collection_name, embeddings, points, previous_points, smoke_queries)
+        except Exception:
+            logger.error(f"Reindexación fallida; se mantiene la colección '{previous}'")
+            drop_collection(collection_name)
+            _remove_index_state(collection_name)
+            raise
+
+        activate_collection(alias, collection_name)
+        removed = collect_garbage(alias, keep)
+        report = ReindexReport(
+            alias=alias,
+            collection=collection_name,
+            previous=previous if previous_points is not None else None,
+            points=points,
+            chunks_added=index_report.chunks_added,
+            smoke_queries=smoke_results,
+            removed=removed,
+            seconds=round(time.monotonic() - start, 3)
+        )
+        logger.info(f"Reindexación completada en {report.seconds:.1f} s: '{alias}' -> '{collection_name}' ({points} puntos)")
+        return report
+    finally:
+        _lock.release()
+
+# Última reindexación lanzada desde la API
+_job: Dict[str, Any] = {"status": "idle"}
+_job_task: Optional[asyncio.Task] = None
+# Limpieza pendiente de las versiones sustituidas
+_gc_task: Optional[asyncio.Task] = None
+
+def reindex_status() -> Dict[str, Any]:
+    return dict(_job)
+
+async def _run_job() -> None:
+    global _job
+    try:
+        report = await run_blocking(reindex)
+        _job = {**_job, "status": "completed", "report": asdict(report)}
+    except Exception as e:
+        logger.error(f"Error en la reindexación: {e}", exc_info=not isinstance(e, ReindexError))
+        _job = {**_job, "status": "failed", "error": str(e)}
+        return
+    finally:
+        _job["finished_at"] = time.time()
+    _schedule_garbage_collection(report.alias)
+
+async def _collect_garbage_later(alias: str) -> None:
+    """Elimina la versión sustituida cuando todos los lectores han tenido tiempo de cambiar"""
+    await asyncio.sleep(settings.REINDEX_GC_GRACE_SECONDS)
+    try:
+        await run_blocking(collect_garbage, alias, settings.REINDEX_KEEP_VERSIONS)
+    except Exception as e:
+        logger.error(f"Error eliminando las colecciones antiguas de '{alias}': {e}", exc_info=True)
+
+def _schedule_garbage_collection(alias: str) -> None:
+    global _gc_task
+    if _gc_task is not None and not _gc_task.done():
+        _gc_task.cancel()
+    _gc_task = asyncio.ensure_future(_collect_garbage_later(alias))
+
+def start_reindex() -> bool:
+    """Lanza una reindexación en segundo plano; False si ya hay una en curso"""
+    global _job, _job_task
+    if _job_task is not None and not _job_task.done():
+        return False
+    _job = {"status": "running", "started_at": time.time()}
+    _job_task = asyncio.ensure_future(_run_job())
+    return True
+
+def main() -> None:
+    from app.core.config import validate_settings
+    from app.core.logging import setup_logging
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keep", type=int, default=None, help="Versiones conservadas, incluida la activa (por defecto REINDEX_KEEP_VERSIONS)")
+    parser.add_argument("--skip-smoke", action="store_true", help="No ejecutar las consultas de prueba")
+    parser.add_argument("--gc", action="store_true", help="Solo eliminar las versiones antiguas cuyo plazo haya vencido")
+    args = parser.parse_args()
+
+    setup_logging()
+    validate_settings()
+    if args.gc:
+        keep = settings.REINDEX_KEEP_VERSIONS if args.keep is None else args.keep
+        print(json.dumps({"removed": collect_garbage(settings.VECTOR_DB_COLLECTION, keep)}, indent=2, ensure_ascii=False))
+        return
+    report = reindex(keep=args.keep, smoke_queries=[] if args.skip_smoke else None)
+    print(json.dumps(asdict(report), indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
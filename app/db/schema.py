@@ -0,0 +1,202 @@
+"""
+Esquema de las colecciones de documentos.
+
+- Metadatos de cada fragmento derivados de la ruta del fichero dentro de
+  DOCUMENT_DIR (DOCUMENT_RULES): `category` (tema: restaurants, hours...) y
+  `doc_type` (menu, faq, schedule...). La recuperación favorece las
+  categorías de la intención de la consulta y admite filtros por ellos.
+- Colecciones de Qdrant con índices de payload keyword sobre esos campos,
+  parámetros HNSW y cuantización escalar int8 (VECTOR_DB_HNSW_*,
+  VECTOR_DB_QUANTIZATION*); las búsquedas exploran los vectores cuantizados y
+  reordenan los candidatos con los originales (VECTOR_DB_RESCORE).
+
+Las colecciones nuevas (y las de cada reindexación) se crean con el esquema; a
+las existentes solo se les añaden al arrancar los índices de payload que falten.
+Los cambios de HNSW o cuantización alteran el recall, así que en una colección
+existente únicamente se aplican con VECTOR_DB_UPDATE_EXISTING_SCHEMA; si no,
+se avisa y se aplican al reindexar (python -m app.db.reindex), igual que los
+metadatos de los fragmentos ya indexados.
+
+Qdrant embebido (sin VECTOR_DB_URL) busca por fuerza bruta: ignora HNSW,
+cuantización e índices de payload, aunque los filtros funcionan igual.
+
+Uso:
+    python -m app.db.schema   # esquema de la colección activa
+"""
+import json
+import logging
+import os
+import re
+import unicodedata
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from qdrant_client import QdrantClient
+from qdrant_client.http import models as rest
+
+from app.core.config import settings
+
+logger = logging.getLogger("rag-app")
+
+# (fragmento de la ruta normalizada, categoría, tipo de documento), por orden de prioridad
+DOCUMENT_RULES: List[Tuple[str, str, str]] = [
+    ("menus restaurantes", "restaurants", "menu"),
+    ("preguntas frecuentes", "faq", "faq"),
+    ("horarios", "hours", "schedule"),
+    ("membership", "membership", "brochure"),
+    ("personal shopper", "personal_shopper", "brochure"),
+    ("servicios y experiencias", "services", "brochure"),
+    ("tiendas y restauracion", "directory", "directory"),
+    ("productos", "products", "catalog"),
+    ("promocion", "promotions", "promotion"),
+]
+DEFAULT_CATEGORY = "general"
+DEFAULT_DOC_TYPE = "document"
+# Campos de metadatos con índice de payload (clave "metadata" del payload, como langchain)
+INDEXED_FIELDS = ("category", "doc_type")
+
+def _normalize_path(path: str) -> str:
+    text = unicodedata.normalize("NFKD", path.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(re.findall(r"[a-z0-9]+", text))
+
+def document_metadata(path: Union[str, Path]) -> Dict[str, str]:
+    """Categoría y tipo de documento de un fichero según su carpeta y nombre"""
+    try:
+        relative = os.path.relpath(path, settings.DOCUMENT_DIR)
+    except ValueError:
+        relative = str(path)
+    normalized = _normalize_path(relative)
+    for pattern, category, doc_type in DOCUMENT_RULES:
+        if pattern in normalized:
+            return {"category": category, "doc_type": doc_type}
+    return {"category": DEFAULT_CATEGORY, "doc_type": DEFAULT_DOC_TYPE}
+
+def qdrant_filter(filter: Optional[Dict[str, Any]], metadata_key: str = "metadata") -> Optional[rest.Filter]:
+    """Filtro de Qdrant equivalente al de metadatos del índice local (una lista equivale a "cualquiera de")"""
+    if not filter:
+        return None
+    return rest.Filter(must=[
+        rest.FieldCondition(
+            key=f"{metadata_key}.{key}",
+            match=rest.MatchAny(any=list(value)) if isinstance(value, (list, tuple, set)) else rest.MatchValue(value=value)
+        )
+        for key, value in filter.items()
+    ])
+
+def hnsw_config() -> rest.HnswConfigDiff:
+    return rest.HnswConfigDiff(m=settings.VECTOR_DB_HNSW_M, ef_construct=settings.VECTOR_DB_HNSW_EF_CONSTRUCT)
+
+def quantization_config() -> Optional[rest.ScalarQuantization]:
+    """Cuantización escalar configurada; None si está desactivada"""
+    if settings.VECTOR_DB_QUANTIZATION != "int8":
+        return None
+    return rest.ScalarQuantization(scalar=rest.ScalarQuantizationConfig(
+        type=rest.ScalarType.INT8,
+        quantile=settings.VECTOR_DB_QUANTIZATION_QUANTILE,
+        always_ram=settings.VECTOR_DB_QUANTIZATION_ALWAYS_RAM
+    ))
+
+def _quantization_key(config: Any) -> Optional[Tuple[Any, ...]]:
+    """
+    Campos comparables de una cuantización (tipo, cuantil, always_ram): el servidor
+    devuelve el tipo como texto y rellena los campos por defecto
+    """
+    if config is None or config == rest.Disabled.DISABLED:
+        return None
+    scalar = getattr(config, "scalar", None)
+    if scalar is None:
+        # Cuantización de otro tipo (producto, binaria)
+        return (type(config).__name__,)
+    quantile = round(scalar.quantile, 6) if scalar.quantile is not None else None
+    return (str(getattr(scalar.type, "value", scalar.type)), quantile, bool(scalar.always_ram))
+
+def search_params() -> Optional[rest.SearchParams]:
+    """Parámetros de búsqueda: candidatos HNSW y reordenación de los resultados cuantizados"""
+    quantization = None
+    if quantization_config() is not None:
+        quantization = rest.QuantizationSearchParams(
+            rescore=settings.VECTOR_DB_RESCORE,
+            oversampling=settings.VECTOR_DB_OVERSAMPLING if settings.VECTOR_DB_RESCORE else None
+        )
+    if not settings.VECTOR_DB_HNSW_EF and quantization is None:
+        return None
+    return rest.SearchParams(hnsw_ef=settings.VECTOR_DB_HNSW_EF or None, quantization=quantization)
+
+def _is_embedded() -> bool:
+    """Qdrant embebido (sin VECTOR_DB_URL): sin índices de payload, HNSW ni cuantización"""
+    return not settings.VECTOR_DB_URL
+
+def create_collection(client: QdrantClient, collection_name: str, vector_size: int) -> None:
+    """Crea la colección con el esquema configurado (distancia coseno, como langchain)"""
+    logger.info(
+        f"Creando colección '{collection_name}' con dimensión {vector_size} "
+        f"(HNSW m={settings.VECTOR_DB_HNSW_M}, cuantización {settings.VECTOR_DB_QUANTIZATION or 'desactivada'})"
+    )
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config=rest.VectorParams(
+            size=vector_size,
+            distance=rest.Distance.COSINE,
+            on_disk=settings.VECTOR_DB_ON_DISK_VECTORS or None
+        ),
+        hnsw_config=hnsw_config(),
+        quantization_config=quantization_config()
+    )
+    _create_payload_indexes(client, collection_name, set())
+
+def _create_payload_indexes(client: QdrantClient, collection_name: str, existing: set) -> None:
+    if _is_embedded():
+        return
+    for field in INDEXED_FIELDS:
+        key = f"metadata.{field}"
+        if key not in existing:
+            client.create_payload_index(collection_name, field_name=key, field_schema=rest.PayloadSchemaType.KEYWORD, wait=True)
+            logger.info(f"Índice de payload '{key}' creado en '{collection_name}'")
+
+def ensure_schema(client: QdrantClient, collection_name: str) -> None:
+    """Añade a una colección existente los índices de payload que falten; HNSW y cuantización, solo si se pide"""
+    if _is_embedded():
+        return
+    info = client.get_collection(collection_name)
+    changes: Dict[str, Any] = {}
+    current_hnsw = info.config.hnsw_config
+    if (current_hnsw.m, current_hnsw.ef_construct) != (settings.VECTOR_DB_HNSW_M, settings.VECTOR_DB_HNSW_EF_CONSTRUCT):
+        changes["hnsw_config"] = hnsw_config()
+    quantization = quantization_config()
+    if _quantization_key(quantization) != _quantization_key(info.config.quantization_config):
+        changes["quantization_config"] = quantization if quantization is not None else rest.Disabled.DISABLED
+    if changes and settings.VECTOR_DB_UPDATE_EXISTING_SCHEMA:
+        # Qdrant reconstruye los índices en segundo plano; la colección sigue sirviendo
+        client.update_collection(collection_name, **changes)
+        logger.info(f"Configuración de '{collection_name}' actualizada: {', '.join(changes)}")
+    elif changes:
+        logger.warning(
+            f"La configuración de '{collection_name}' difiere de la configurada ({', '.join(changes)}); "
+            "se aplicará al reindexar o con VECTOR_DB_UPDATE_EXISTING_SCHEMA=true"
+        )
+    _create_payload_indexes(client, collection_name, set(info.payload_schema or {}))
+
+def describe(client: QdrantClient, collection_name: str) -> Dict[str, Any]:
+    """Esquema efectivo de una colección de Qdrant"""
+    info = client.get_collection(collection_name)
+    return {
+        "collection": collection_name,
+        "points": info.points_count,
+        "vectors": info.config.params.vectors,
+        "hnsw": info.config.hnsw_config,
+        "quantization": info.config.quantization_config,
+        "payload_indexes": {key: str(schema.data_type) for key, schema in (info.payload_schema or {}).items()},
+        "embedded": _is_embedded(),
+    }
+
+def main() -> None:
+    from app.core.logging import setup_logging
+    from app.db.aliases import resolve_collection
+    from app.db.client import get_qdrant_client
+
+    setup_logging()
+    print(json.dumps(describe(get_qdrant_client(), resolve_collection()), indent=2, ensure_ascii=False, default=lambda value: value.dict() if hasattr(value, "dict") else str(value)))
+
+if __name__ == "__main__":
+    main()
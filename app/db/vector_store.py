@@ -1,101 +1,144 @@
+import asyncio
+import hashlib
 import logging
-from typing import Optional, Dict, List, Any
-from langchain.vectorstores import Qdrant
+import os
+import threading
+import time
+from typing import Optional, Dict, List, Any, Tuple
+from langchain.vectorstores.base import VectorStore
 
+from app.core.concurrency import run_blocking
 from app.core.config import settings
-from app.db.document_loader import load_and_split_documents
-from app.services.embeddings import get_embeddings
+from app.core.tracing import stage
+from app.db.aliases import resolve_collection, versioned_name
+from app.db.backends import ensure_collection_schema, get_index_sink, open_vector_store
+from app.db.indexer import index_documents, manifest_path
+from app.db.reindex import activate_collection
+from app.services.embeddings import get_embeddings, get_index_embeddings
 
-# Singleton para el almacén vectorial
+# Singleton para el almacén vectorial y colección física que consulta
 _vector_store = None
+_vector_store_collection: Optional[str] = None
+# Estado de la inicialización única (single-flight) con reintentos espaciados
+_init_task: Optional[asyncio.Task] = None
+_init_failures = 0
+_init_retry_at = 0.0
+_init_error: Optional[str] = None
+# Cambio de colección en curso tras una reindexación, compartido por todas las peticiones
+_switch_task: Optional[asyncio.Task] = None
+# Versión del índice calculada: instante de la comprobación, (ruta, inodo, mtime, tamaño) del manifiesto y versión
+_index_version: Optional[Tuple[float, Tuple[str, int, int, int], str]] = None
+_index_version_lock = threading.Lock()
 logger = logging.getLogger("rag-app")
 
-async def initialize_vector_store() -> Qdrant:
+def _manifest_stat(collection_name: str) -> Tuple[str, int, int, int]:
+    path = manifest_path(collection_name)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return path, 0, 0, 0
+    # save_manifest lo sustituye con os.replace: cambia el inodo aunque el mtime coincida
+    return path, stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+def get_index_version() -> str:
+    """
+    Identificador de la versión actual del índice, usado para invalidar cachés.
+
+    Se deriva del estado compartido entre procesos: la colección activa del alias
+    y el contenido de su manifiesto, que reescribe cualquier indexación (la de la
+    API, python -m app.db.indexer u otra réplica con el mismo INDEX_STATE_DIR).
+    Se recalcula como mucho cada INDEX_VERSION_REFRESH_SECONDS.
+    """
+    global _index_version
+
+    cached = _index_version
+    now = time.monotonic()
+    if cached and now - cached[0] < settings.INDEX_VERSION_REFRESH_SECONDS:
+        return cached[2]
+
+    with _index_version_lock:
+        collection_name = resolve_collection()
+        manifest = _manifest_stat(collection_name)
+        if cached and cached[1] == manifest:
+            version = cached[2]
+        elif manifest[2]:
+            # Una indexación sin cambios reescribe el mismo manifiesto: la versión no cambia
+            with open(manifest[0], "rb") as f:
+                version = f"{collection_name}:{hashlib.sha1(f.read()).hexdigest()[:12]}"
+        else:
+            version = f"{collection_name}:-"
+        _index_version = (now, manifest, version)
+    return version
+
+def mark_index_updated() -> None:
+    """Registra que el contenido del índice de documentos ha cambiado"""
+    global _index_version
+    # Recalcular en la próxima consulta sin esperar al intervalo
+    _index_version = None
+    logger.info(f"Índice de documentos actualizado: versión {get_index_version()}")
+
+async def _probe_vector_store(vector_store: VectorStore) -> None:
+    """Prueba opcional de recuperación (añade un embedding y una búsqueda al arranque)"""
+    if not settings.VECTOR_STORE_STARTUP_PROBE:
+        return
+    sample_query = "horarios del centro comercial"
+    await run_blocking(vector_store.similarity_search, sample_query, k=1)
+    logger.info(f"Prueba de recuperación con consulta '{sample_query}' exitosa")
+
+async def initialize_vector_store() -> VectorStore:
     """Inicializa el almacén vectorial con documentos o se conecta si ya existe"""
-    global _vector_store
+    global _vector_store, _vector_store_collection
     
     try:
         # Obtener servicio de embeddings
         embeddings = get_embeddings()
         
-        # Intentar conectarse primero a la colección existente
-        from qdrant_client import QdrantClient
-        
-        client = QdrantClient(
-            url=settings.VECTOR_DB_URL,
-            api_key=settings.VECTOR_DB_API_KEY
-        )
+        # Destino de indexación del backend configurado (Qdrant o índice local)
+        sink = get_index_sink()
         
         # Verificar si la colección existe y tiene puntos
-        collection_exists = False
-        has_points = False
-        
-        try:
-            collection_info = client.get_collection(settings.VECTOR_DB_COLLECTION)
-            collection_exists = True
-            
-            # Verificar si la colección tiene puntos
-            if hasattr(collection_info, 'points_count') and collection_info.points_count > 0:
-                has_points = True
-                logger.info(f"Colección '{settings.VECTOR_DB_COLLECTION}' encontrada con {collection_info.points_count} puntos")
-            else:
-                # Alternativa: verificar un punto de muestra
-                sample_search = client.search(
-                    collection_name=settings.VECTOR_DB_COLLECTION,
-                    query_vector=[0.0] * 1536,  # Vector de ceros como consulta
-                    limit=1
-                )
-                has_points = len(sample_search) > 0
-                logger.info(f"Colección '{settings.VECTOR_DB_COLLECTION}' encontrada, tiene puntos: {has_points}")
-                
-        except Exception as e:
-            logger.info(f"No se encontró la colección: {e}")
-            
-        # Si la colección existe y tiene puntos, solo conectarse
-        if collection_exists and has_points:
-            logger.info(f"Conectando a colección existente '{settings.VECTOR_DB_COLLECTION}'")
-            # Crear instancia de Qdrant sin cargar nuevos documentos
-            _vector_store = Qdrant(
-                client=client,
-                collection_name=settings.VECTOR_DB_COLLECTION,
-                embeddings=embeddings
-            )
-            
-            # Probar recuperación
-            sample_query = "horarios del centro comercial"
-            docs = _vector_store.similarity_search(sample_query, k=1)
-            logger.info(f"Prueba de recuperación con consulta '{sample_query}' exitosa")
-            
-            return _vector_store
-            
-        # Si llegamos aquí, necesitamos crear/poblar la colección
+        points_count = await run_blocking(sink.count)
+        collection_exists = points_count is not None
+        has_points = bool(points_count)
         if collection_exists:
-            logger.info("La colección existe pero está vacía. Cargando documentos...")
+            logger.info(f"Colección '{sink.collection_name}' encontrada con {points_count} puntos")
         else:
-            logger.info("No se encontró la colección. Creando y cargando documentos...")
+            logger.info(f"No se encontró la colección '{sink.collection_name}'")
+            if sink.collection_name == settings.VECTOR_DB_COLLECTION:
+                # Despliegue nuevo: primera versión de la colección, activada al terminar de indexar
+                sink = get_index_sink(versioned_name(settings.VECTOR_DB_COLLECTION, 1))
         
-        # Cargar y dividir documentos
-        chunks = await load_and_split_documents()
-        if not chunks:
-            logger.warning("No se encontraron fragmentos de documentos para cargar")
-            return None
-            
-        # Crear almacén vectorial
-        logger.info("Creando base de datos vectorial...")
-        _vector_store = Qdrant.from_documents(
-            documents=chunks,
-            embedding=embeddings,
-            url=settings.VECTOR_DB_URL,
-            api_key=settings.VECTOR_DB_API_KEY,
-            collection_name=settings.VECTOR_DB_COLLECTION,
-        )
+        if not has_points:
+            # Necesitamos crear/poblar la colección
+            if collection_exists:
+                logger.info("La colección existe pero está vacía. Cargando documentos...")
+            else:
+                logger.info("No se encontró la colección. Creando y cargando documentos...")
+        
+        if not has_points or settings.INDEX_ON_STARTUP:
+            # El indexador incremental solo genera embeddings de fragmentos nuevos o modificados
+            report = await run_blocking(index_documents, sink, get_index_embeddings())
+            if not report.chunks_added and not report.chunks_skipped:
+                logger.warning("No se encontraron fragmentos de documentos para cargar")
+                return None
+            if report.changed:
+                mark_index_updated()
+            if not collection_exists and sink.collection_name != settings.VECTOR_DB_COLLECTION:
+                await run_blocking(activate_collection, settings.VECTOR_DB_COLLECTION, sink.collection_name)
         
-        logger.info(f"Almacén vectorial creado exitosamente con {len(chunks)} documentos")
+        if collection_exists:
+            try:
+                # Colecciones creadas antes del esquema actual: índices de payload y cuantización
+                await run_blocking(ensure_collection_schema, sink.collection_name)
+            except Exception as e:
+                logger.warning(f"No se pudo actualizar el esquema de la colección '{sink.collection_name}': {e}")
+        
+        logger.info(f"Conectando a colección '{sink.collection_name}' (backend {settings.VECTOR_DB_BACKEND})")
+        # Sin nombre de colección: la activa del alias (en Qdrant, el propio alias del servidor)
+        _vector_store = await run_blocking(open_vector_store, embeddings)
+        _vector_store_collection = sink.collection_name
         
-        # Probar recuperación
-        sample_query = "horarios del centro comercial"
-        docs = _vector_store.similarity_search(sample_query, k=1)
-        logger.info(f"Prueba de recuperación con consulta '{sample_query}' exitosa")
+        await _probe_vector_store(_vector_store)
         
         return _vector_store
     
@@ -103,9 +146,74 @@ async def initialize_vector_store() -> Qdrant:
         logger.error(f"Error inicializando el almacén vectorial: {e}", exc_info=True)
         raise
 
-async def get_vector_store() -> Optional[Qdrant]:
+def get_initialization_error() -> Optional[str]:
+    """Último error de inicialización del almacén vectorial, si lo hubo"""
+    return _init_error
+
+async def _initialize_once() -> Optional[VectorStore]:
+    """Ejecuta una inicialización y registra su resultado para el resto de llamadas"""
+    global _init_task, _init_failures, _init_retry_at, _init_error
+    
+    try:
+        with stage("vector_store_init"):
+            vector_store = await initialize_vector_store()
+        if not vector_store:
+            raise RuntimeError("No se encontraron documentos para cargar")
+        _init_failures = 0
+        _init_error = None
+        return vector_store
+    except Exception as e:
+        # Guardar el fallo y espaciar los reintentos con backoff exponencial
+        _init_failures += 1
+        _init_error = str(e)
+        delay = min(
+            settings.VECTOR_STORE_INIT_BACKOFF_SECONDS * 2 ** (_init_failures - 1),
+            settings.VECTOR_STORE_INIT_BACKOFF_MAX_SECONDS
+        )
+        _init_retry_at = time.monotonic() + delay
+        logger.error(f"Inicialización del almacén vectorial fallida ({_init_failures} seguidas), próximo intento en {delay:.1f} s")
+        return None
+    finally:
+        _init_task = None
+
+async def _switch_collection() -> None:
+    """Pasa a consultar la colección activa del alias del índice local tras una reindexación"""
+    global _vector_store, _vector_store_collection, _switch_task
+
+    try:
+        collection_name = resolve_collection()
+        vector_store = await run_blocking(open_vector_store, get_embeddings(), collection_name)
+        if resolve_collection() != collection_name:
+            return
+        previous = _vector_store_collection
+        _vector_store, _vector_store_collection = vector_store, collection_name
+        logger.info(f"Almacén vectorial cambiado de '{previous}' a '{collection_name}'")
+    except Exception as e:
+        # Se sigue sirviendo la colección anterior; la próxima petición lo reintenta
+        logger.error(f"Error cambiando de colección: {e}", exc_info=True)
+    finally:
+        _switch_task = None
+
+async def get_vector_store() -> Optional[VectorStore]:
     """Obtiene el almacén vectorial, inicializándolo si no existe"""
-    global _vector_store
-    if not _vector_store:
-        return await initialize_vector_store()
-    return _vector_store
\ No newline at end of file
+    global _init_task, _switch_task
+    
+    if _vector_store:
+        # En Qdrant las consultas usan el alias y el servidor cambia de colección por sí solo
+        if settings.VECTOR_DB_BACKEND == "local" and _vector_store_collection != resolve_collection():
+            if _switch_task is None:
+                _switch_task = asyncio.ensure_future(_switch_collection())
+            # Todas las peticiones esperan a la misma apertura de la colección nueva;
+            # shield evita que una petición cancelada cancele el cambio compartido
+            await asyncio.shield(_switch_task)
+        return _vector_store
+    
+    if _init_task is None:
+        # Tras un fallo reciente, responder sin reintentar hasta que venza el backoff
+        if time.monotonic() < _init_retry_at:
+            return None
+        _init_task = asyncio.ensure_future(_initialize_once())
+    
+    # Todas las llamadas concurrentes esperan a la misma inicialización;
+    # shield evita que una petición cancelada cancele la inicialización compartida
+    return await asyncio.shield(_init_task)
@@ -1,10 +1,22 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+import asyncio
 import logging
 
+from app.api.middleware import RequestMetricsMiddleware
 from app.api.router import router
+from app.core.concurrency import run_blocking, shutdown_executor
+from app.core.config import settings, validate_settings
 from app.core.logging import setup_logging
-from app.db.vector_store import get_vector_store
+from app.core.metrics import render_prometheus
+from app.core.nltk_resources import ensure_nltk_resources
+from app.core.readiness import mark_failed, mark_ready, readiness_status
+from app.db.vector_store import get_initialization_error, get_vector_store
+from app.services.chain_registry import get_llm_chain
+from app.services.context_packer import get_token_counter
+from app.services.faq_store import get_faq_store
+from app.services.retrieval import get_retriever
 
 # Configurar logging
 logger = setup_logging()
@@ -20,28 +32,87 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Métricas por petición y cabecera Server-Timing
+app.add_middleware(RequestMetricsMiddleware)
+
 # Incluir router con todas las rutas
 app.include_router(router, prefix="/api")
 
-@app.on_event("startup")
-async def startup_db_client():
-    """Inicializa la base de datos vectorial al iniciar la aplicación"""
+async def warm_up() -> bool:
+    """Prepara los recursos pesados (almacén vectorial, cadena RAG) y marca el proceso como listo"""
     try:
+        validate_settings()
+        
+        if settings.NLTK_DOWNLOAD_ON_STARTUP:
+            await run_blocking(ensure_nltk_resources)
+        
         logger.info("Inicializando conexión al almacén vectorial...")
         vector_store = await get_vector_store()
-        if vector_store:
-            logger.info("Almacén vectorial inicializado correctamente")
-        else:
-            logger.warning("No se pudo inicializar el almacén vectorial")
+        if not vector_store:
+            raise RuntimeError(get_initialization_error() or "Almacén vectorial no inicializado")
+        
+        logger.info("Almacén vectorial inicializado correctamente")
+        # Construir la cadena RAG y cargar la codificación de tokens antes de la primera petición
+        get_retriever(vector_store)
+        get_llm_chain(streaming=True)
+        await run_blocking(get_token_counter)
+        mark_ready()
+        logger.info(f"Aplicación lista en {readiness_status()['startup_seconds']:.2f} s")
     except Exception as e:
         logger.error(f"Error durante el inicio de la aplicación: {e}", exc_info=True)
-        raise
+        mark_failed(str(e))
+        # En modo background el proceso sigue vivo, /api/ready informa del fallo y se reintenta
+        if settings.STARTUP_MODE == "eager":
+            raise
+        return False
+    if settings.FAQ_STORE_ENABLED:
+        # Fuera del calentamiento: un fallo aquí no afecta al arranque ni a la disponibilidad
+        app.state.faq_warm_up_task = asyncio.create_task(warm_up_faq_store())
+    return True
+
+async def warm_up_faq_store() -> None:
+    """Genera en segundo plano las respuestas de las preguntas frecuentes que falten o hayan quedado obsoletas"""
+    try:
+        await get_faq_store().ensure_current(force=True)
+    except Exception as e:
+        logger.error(f"Error preparando el almacén de preguntas frecuentes: {e}", exc_info=True)
+
+async def warm_up_until_ready() -> None:
+    """Reintenta el calentamiento con backoff exponencial hasta que el proceso esté listo"""
+    failures = 0
+    while not await warm_up():
+        failures += 1
+        delay = min(
+            settings.VECTOR_STORE_INIT_BACKOFF_SECONDS * 2 ** (failures - 1),
+            settings.VECTOR_STORE_INIT_BACKOFF_MAX_SECONDS
+        )
+        logger.warning(f"Calentamiento fallido ({failures} seguidos), nuevo intento en {delay:.1f} s")
+        await asyncio.sleep(delay)
+
+@app.on_event("startup")
+async def startup_db_client():
+    """Inicializa la base de datos vectorial al iniciar la aplicación"""
+    if settings.STARTUP_MODE == "eager":
+        await warm_up()
+    else:
+        # Aceptar tráfico de inmediato; /api/ready indica cuándo el proceso está listo
+        app.state.warm_up_task = asyncio.create_task(warm_up_until_ready())
+
+@app.on_event("shutdown")
+async def shutdown_blocking_executor():
+    """Libera los hilos del ejecutor de llamadas bloqueantes al detener la aplicación"""
+    shutdown_executor()
 
 @app.get("/")
 async def root():
     """Endpoint raíz para verificar que la API está funcionando"""
     return {"message": "La Roca Village RAG API"}
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def prometheus_metrics():
+    """Métricas del proceso en formato de texto de Prometheus"""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -0,0 +1,162 @@
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger("rag-app")
+
+def normalize_query(query: str) -> str:
+    """Normaliza una consulta para comparación exacta (minúsculas, sin tildes ni puntuación)"""
+    text = unicodedata.normalize("NFKD", query.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+@dataclass
+class _CacheEntry:
+    answer: str
+    vector: Optional[np.ndarray]
+    expires_at: float
+
+class AnswerCache:
+    """Caché de respuestas con nivel exacto y nivel semántico, TTL y expulsión LRU"""
+
+    def __init__(self, max_entries: int, ttl_seconds: float, similarity_threshold: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._version: Optional[str] = None
+        self._lock = threading.Lock()
+        # Matriz de embeddings del nivel semántico, reconstruida tras cada cambio
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[str] = []
+        self._counters = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def _sync_version(self, version: str) -> None:
+        """Vacía la caché si el índice de documentos cambió (llamar con el lock adquirido)"""
+        if self._version != version:
+            if self._entries:
+                logger.info(f"Índice de documentos actualizado ({self._version} -> {version}), vaciando caché de respuestas")
+                self._counters["invalidations"] += 1
+            self._entries.clear()
+            self._matrix = None
+            self._version = version
+
+    def _remove(self, key: str) -> None:
+        self._entries.pop(key, None)
+        self._matrix = None
+
+    def get_exact(self, query: str, version: str) -> Optional[str]:
+        """Busca una respuesta para la consulta normalizada"""
+        key = normalize_query(query)
+        now = time.monotonic()
+        with self._lock:
+            self._sync_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= now:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            self._counters["exact_hits"] += 1
+            return entry.answer
+
+    def get_semantic(self, embedding: List[float], version: str) -> Optional[str]:
+        """Busca la respuesta de una consulta cuyo embedding supere el umbral de similitud"""
+        vector = _unit_vector(embedding)
+        now = time.monotonic()
+        with self._lock:
+            self._sync_version(version)
+            matrix = self._semantic_matrix()
+            if matrix is not None:
+                scores = matrix @ vector
+                # Recorrer candidatos de mayor a menor similitud por encima del umbral
+                for index in np.argsort(-scores):
+                    if scores[index] < self.similarity_threshold:
+                        break
+                    key = self._matrix_keys[index]
+                    entry = self._entries.get(key)
+                    if entry is None or entry.expires_at <= now:
+                        continue
+                    self._entries.move_to_end(key)
+                    self._counters["semantic_hits"] += 1
+                    logger.info(f"Acierto semántico en caché de respuestas (similitud={scores[index]:.3f})")
+                    return entry.answer
+            self._counters["misses"] += 1
+            return None
+
+    def _semantic_matrix(self) -> Optional[np.ndarray]:
+        """Obtiene la matriz de embeddings de las entradas (llamar con el lock adquirido)"""
+        if self._matrix is None:
+            keys = [key for key, entry in self._entries.items() if entry.vector is not None]
+            if not keys:
+                return None
+            self._matrix = np.vstack([self._entries[key].vector for key in keys])
+            self._matrix_keys = keys
+        return self._matrix
+
+    def put(self, query: str, embedding: Optional[List[float]], answer: str, version: str) -> None:
+        """Guarda una respuesta para la consulta"""
+        key = normalize_query(query)
+        vector = _unit_vector(embedding) if embedding is not None else None
+        with self._lock:
+            self._sync_version(version)
+            self._entries[key] = _CacheEntry(answer, vector, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+            self._matrix = None
+
+    def clear(self) -> None:
+        """Vacía la caché"""
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Devuelve contadores de aciertos y fallos de la caché"""
+        with self._lock:
+            counters = dict(self._counters)
+            entries = len(self._entries)
+        lookups = counters["exact_hits"] + counters["semantic_hits"] + counters["misses"]
+        hits = counters["exact_hits"] + counters["semantic_hits"]
+        return {
+            "enabled": settings.ANSWER_CACHE_ENABLED,
+            "entries": entries,
+            "similarity_threshold": self.similarity_threshold,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            **counters
+        }
+
+def _unit_vector(embedding: List[float]) -> np.ndarray:
+    """Convierte un embedding a vector float32 de norma unitaria"""
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+# Singleton para la caché de respuestas
+_answer_cache: Optional[AnswerCache] = None
+
+def get_answer_cache() -> AnswerCache:
+    """Obtiene la caché de respuestas, inicializándola si no existe"""
+    global _answer_cache
+
+    if _answer_cache is None:
+        _answer_cache = AnswerCache(
+            max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+            similarity_threshold=settings.ANSWER_CACHE_SIMILARITY_THRESHOLD
+        )
+
+    return _answer_cache
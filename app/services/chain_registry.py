@@ -0,0 +1,87 @@
+import logging
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from langchain.chains import LLMChain
+from langchain.chat_models import ChatOpenAI
+from langchain.prompts import PromptTemplate
+
+from app.core.config import settings
+from app.services.prompt_service import get_rag_prompt
+
+logger = logging.getLogger("rag-app")
+
+# Registro de cadenas LLM construidas, indexadas por configuración
+_chains: Dict[Tuple[Any, ...], LLMChain] = {}
+_prompts: Dict[str, PromptTemplate] = {}
+_llms: Dict[bool, ChatOpenAI] = {}
+_llm_config: Optional[Tuple[Any, ...]] = None
+_lock = threading.Lock()
+
+def _current_llm_config() -> Tuple[Any, ...]:
+    """Configuración de la que depende el cliente LLM; si cambia, se reconstruye"""
+    return (settings.OPENAI_LLM_MODEL, settings.OPENAI_API_KEY)
+
+def _build_llm(streaming: bool = False) -> ChatOpenAI:
+    """Crea el cliente LLM"""
+    # Las conexiones HTTP las reutiliza openai: una sesión por hilo del ejecutor, renovada periódicamente
+    return ChatOpenAI(
+        model_name=settings.OPENAI_LLM_MODEL,
+        openai_api_key=settings.OPENAI_API_KEY,
+        streaming=streaming,
+        # Un solo intento: los reintentos los gestiona el gateway LLM sin ocupar hilos esperando
+        max_retries=1
+    )
+
+def _get_llm(streaming: bool = False) -> ChatOpenAI:
+    """Obtiene el cliente LLM compartido (llamar con el lock adquirido)"""
+    global _llm_config
+
+    config = _current_llm_config()
+    if _llm_config != config:
+        # Las cadenas y clientes existentes usan la configuración anterior
+        _llms.clear()
+        _chains.clear()
+        _llm_config = config
+
+    if streaming not in _llms:
+        logger.info(f"Inicializando cliente LLM con modelo {settings.OPENAI_LLM_MODEL} (streaming={streaming})")
+        _llms[streaming] = _build_llm(streaming)
+
+    return _llms[streaming]
+
+def get_llm(streaming: bool = False) -> ChatOpenAI:
+    """Obtiene el cliente LLM compartido, para llamadas fuera de la cadena RAG"""
+    with _lock:
+        return _get_llm(streaming)
+
+def _get_prompt(variant: str = "general") -> PromptTemplate:
+    """Obtiene el prompt RAG compartido de una variante (llamar con el lock adquirido)"""
+    if variant not in _prompts:
+        _prompts[variant] = get_rag_prompt(variant)
+
+    return _prompts[variant]
+
+def get_prompt(variant: str = "general") -> PromptTemplate:
+    """Obtiene el prompt RAG compartido de una variante"""
+    with _lock:
+        return _get_prompt(variant)
+
+def get_llm_chain(streaming: bool = False, variant: str = "general") -> LLMChain:
+    """Obtiene la cadena prompt + LLM que genera la respuesta a partir del contexto, construyéndola una sola vez"""
+    key = (streaming, variant, _current_llm_config())
+
+    # Camino rápido sin lock: la cadena ya está construida
+    chain = _chains.get(key)
+    if chain is not None:
+        return chain
+
+    with _lock:
+        llm = _get_llm(streaming)
+        chain = _chains.get(key)
+        if chain is None:
+            logger.info(f"Construyendo cadena RAG (streaming={streaming}, variante={variant})")
+            chain = LLMChain(llm=llm, prompt=_get_prompt(variant))
+            _chains[key] = chain
+
+    return chain
@@ -0,0 +1,175 @@
+"""
+Ensamblado del contexto entre la recuperación y el LLM.
+
+Los fragmentos recuperados se solapan (CHUNK_OVERLAP) y a menudo se repiten entre
+ficheros (p. ej. menús idénticos en dos PDF). Antes de enviarlos al LLM:
+
+1. Se fusionan los fragmentos solapados de la misma fuente y página.
+2. Se descartan los casi duplicados (solapamiento de n-gramas de palabras).
+3. Se añaden por orden de relevancia hasta llenar CONTEXT_TOKEN_BUDGET tokens.
+"""
+import logging
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from langchain.schema import Document
+
+from app.core.config import settings
+
+logger = logging.getLogger("rag-app")
+
+# Separador entre documentos, el mismo que usa la cadena "stuff" de langchain
+DOCUMENT_SEPARATOR = "\n\n"
+# Longitud mínima de texto común para considerar que dos fragmentos se solapan
+MIN_OVERLAP_CHARS = 20
+# Tamaño de los n-gramas de palabras usados para detectar casi duplicados
+SHINGLE_SIZE = 3
+
+class TokenCounter:
+    """Cuenta tokens con tiktoken; si no hay codificación disponible, estima 4 caracteres por token"""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self._encoding = None
+        try:
+            import tiktoken
+
+            try:
+                self._encoding = tiktoken.encoding_for_model(model_name)
+            except KeyError:
+                # Modelos que esta versión de tiktoken no conoce
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.warning(f"No se pudo cargar la codificación de tiktoken ({e}); se estimarán los tokens")
+
+    def count(self, text: str) -> int:
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return (len(text) + 3) // 4
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        if self._encoding is not None:
+            tokens = self._encoding.encode(text, disallowed_special=())
+            return self._encoding.decode(tokens[:max_tokens])
+        return text[:max_tokens * 4]
+
+_token_counter: Optional[TokenCounter] = None
+_token_counter_lock = threading.Lock()
+
+def get_token_counter() -> TokenCounter:
+    """Obtiene el contador de tokens del modelo configurado, creándolo si no existe"""
+    global _token_counter
+
+    if _token_counter is None or _token_counter.model_name != settings.OPENAI_LLM_MODEL:
+        with _token_counter_lock:
+            if _token_counter is None or _token_counter.model_name != settings.OPENAI_LLM_MODEL:
+                _token_counter = TokenCounter(settings.OPENAI_LLM_MODEL)
+    return _token_counter
+
+@dataclass
+class _Segment:
+    text: str
+    rank: int
+    metadata: Dict[str, Any]
+    shingles: Set[Tuple[str, ...]] = field(default_factory=set)
+
+@dataclass
+class PackedContext:
+    """Contexto listo para el prompt y estadísticas del empaquetado"""
+    documents: List[Document]
+    text: str
+    chunks_before: int
+    tokens_before: int
+    tokens_after: int
+
+def merge_overlapping(first: str, second: str) -> Optional[str]:
+    """Une `second` detrás de `first` si el final de `first` es el inicio de `second`"""
+    probe = second[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return None
+    pos = first.find(probe)
+    while pos != -1:
+        tail = first[pos:]
+        if second.startswith(tail):
+            return first + second[len(tail):]
+        pos = first.find(probe, pos + 1)
+    return None
+
+def _merge_into(segment: _Segment, text: str) -> bool:
+    """Incorpora un fragmento a un segmento si lo contiene, lo contiene o se solapan"""
+    if text in segment.text:
+        return True
+    if segment.text in text:
+        segment.text = text
+        return True
+    merged = merge_overlapping(segment.text, text) or merge_overlapping(text, segment.text)
+    if merged is not None:
+        segment.text = merged
+        return True
+    return False
+
+def _shingles(text: str) -> Set[Tuple[str, ...]]:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {tuple(words)}
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+def _is_near_duplicate(candidate: _Segment, kept: _Segment, threshold: float) -> bool:
+    """Proporción del texto más corto que ya está presente en el otro"""
+    smaller = min(len(candidate.shingles), len(kept.shingles))
+    if not smaller:
+        return False
+    return len(candidate.shingles & kept.shingles) / smaller >= threshold
+
+def pack_context(documents: List[Document], budget: Optional[int] = None) -> PackedContext:
+    """Fusiona, deduplica y recorta los documentos recuperados (en orden de relevancia)"""
+    budget = budget or settings.CONTEXT_TOKEN_BUDGET
+    counter = get_token_counter()
+    tokens_before = counter.count(DOCUMENT_SEPARATOR.join(doc.page_content for doc in documents))
+
+    # 1. Fusionar fragmentos solapados de la misma fuente y página
+    groups: Dict[Tuple[Any, Any], List[_Segment]] = {}
+    for rank, doc in enumerate(documents):
+        key = (doc.metadata.get("source"), doc.metadata.get("page"))
+        segments = groups.setdefault(key, [])
+        target = next((segment for segment in segments if _merge_into(segment, doc.page_content)), None)
+        if target is None:
+            segments.append(_Segment(doc.page_content, rank, doc.metadata))
+            continue
+        # El segmento ampliado puede unir ahora otros segmentos del grupo
+        for other in [segment for segment in segments if segment is not target]:
+            if _merge_into(target, other.text):
+                target.rank = min(target.rank, other.rank)
+                segments.remove(other)
+
+    # 2. Descartar casi duplicados, conservando el más relevante
+    kept: List[_Segment] = []
+    for segment in sorted((s for segments in groups.values() for s in segments), key=lambda s: s.rank):
+        segment.shingles = _shingles(segment.text)
+        if not any(_is_near_duplicate(segment, other, settings.CONTEXT_DEDUP_THRESHOLD) for other in kept):
+            kept.append(segment)
+
+    # 3. Añadir por relevancia hasta agotar el presupuesto de tokens
+    packed: List[Document] = []
+    used = 0
+    separator_tokens = counter.count(DOCUMENT_SEPARATOR)
+    for segment in kept:
+        tokens = counter.count(segment.text) + (separator_tokens if packed else 0)
+        if used + tokens <= budget:
+            packed.append(Document(page_content=segment.text, metadata=segment.metadata))
+            used += tokens
+        elif not packed:
+            # Ni el documento más relevante cabe entero: se recorta
+            packed.append(Document(page_content=counter.truncate(segment.text, budget), metadata=segment.metadata))
+            used = budget
+
+    text = DOCUMENT_SEPARATOR.join(doc.page_content for doc in packed)
+    return PackedContext(
+        documents=packed,
+        text=text,
+        chunks_before=len(documents),
+        tokens_before=tokens_before,
+        tokens_after=counter.count(text)
+    )
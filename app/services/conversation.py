@@ -0,0 +1,268 @@
+"""
+Conversaciones con historial acotado en tokens.
+
+Cuando la petición trae session_id, cada turno:
+1. Si la pregunta parece de seguimiento ("¿y a qué hora cierra?"), la reescribe
+   con el LLM como pregunta autónoma a partir del historial de la sesión. La
+   recuperación, la caché de respuestas y la coalescencia usan esa pregunta, y
+   el prompt RAG no lleva historial.
+2. El historial enviado al LLM es el resumen acumulado más los turnos recientes
+   que quepan en SESSION_HISTORY_TOKEN_BUDGET tokens, por larga que sea la
+   conversación.
+3. Al terminar, guarda el turno; cuando hay más del doble de SESSION_RECENT_TURNS,
+   incorpora en segundo plano los más antiguos al resumen (como mucho
+   SESSION_SUMMARY_MAX_TOKENS tokens), partiendo del resumen anterior, sin
+   volver a enviar la conversación entera.
+
+Los tokens de cada paso se suman a la traza de la petición (record_tokens) y
+/api/chat los devuelve en `usage`.
+"""
+import asyncio
+import logging
+import re
+import secrets
+import unicodedata
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.tracing import record_tokens, stage
+from app.services.chain_registry import get_llm
+from app.services.context_packer import get_token_counter
+from app.services.intent_router import classify
+from app.services.llm_gateway import LLMOverloadedError, get_llm_gateway
+from app.services.prompt_service import get_rewrite_prompt, get_summary_prompt
+from app.services.session_store import Session, Turn, get_session_store
+
+logger = logging.getLogger("rag-app")
+
+SESSION_TOKENS = metrics.histogram(
+    "rag_session_tokens",
+    "Tokens por turno de conversación: historial, prompt de reescritura y resumen acumulado",
+    ["kind"],
+    buckets=(50, 100, 250, 500, 1000, 2000, 4000)
+)
+QUERY_REWRITES = metrics.counter(
+    "rag_query_rewrites_total",
+    "Preguntas de sesiones: reescritas (rewritten), ya autónomas (unchanged), sin reescribir (skipped) o con error (failed)",
+    ["result"]
+)
+SESSION_COMPACTIONS = metrics.counter(
+    "rag_session_compactions_total",
+    "Incorporaciones de turnos antiguos al resumen de la sesión",
+    ["outcome"]
+)
+
+# Palabras iniciales que encadenan con la pregunta anterior
+FOLLOW_UP_CONNECTORS = {"y", "e", "o", "pero", "entonces", "tambien", "ademas", "and", "but", "also", "so", "what about"}
+# Referencias a algo mencionado antes en la conversación (sin pronombres genéricos como "it" o "that",
+# presentes también en preguntas autónomas)
+FOLLOW_UP_REFERENCES = {
+    "alli", "ahi", "alla", "eso", "ese", "esa", "esos", "esas", "aquel", "aquella", "ello", "ellos", "ellas",
+    "mismo", "misma", "anterior", "those", "them"
+}
+# Tokens máximos de una pregunta reescrita; una respuesta más larga se descarta
+REWRITE_MAX_TOKENS = 100
+
+@dataclass
+class ConversationTurn:
+    """Turno en curso de una sesión"""
+    session_id: str
+    query: str
+    standalone_query: str
+    history_tokens: int = 0
+
+def new_session_id() -> str:
+    return secrets.token_urlsafe(16)
+
+def _words(text: str) -> List[str]:
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return re.findall(r"[a-z0-9]+", text)
+
+def is_follow_up(query: str) -> bool:
+    """Heurística: pregunta que empieza con un conector o que hace referencia a algo anterior"""
+    words = _words(query)
+    if not words:
+        return False
+    return (
+        words[0] in FOLLOW_UP_CONNECTORS
+        or " ".join(words[:2]) in FOLLOW_UP_CONNECTORS
+        or any(word in FOLLOW_UP_REFERENCES for word in words)
+    )
+
+def _format_turn(turn: Turn) -> str:
+    return f"Visitante: {turn.standalone_query}\nAsistente: {turn.answer}"
+
+def render_history(session: Session, budget: Optional[int] = None) -> str:
+    """Resumen acumulado y turnos más recientes que quepan en el presupuesto de tokens"""
+    counter = get_token_counter()
+    budget = settings.SESSION_HISTORY_TOKEN_BUDGET if budget is None else budget
+    parts: List[str] = []
+    if session.summary:
+        parts.append(counter.truncate(f"Resumen de la conversación anterior: {session.summary}", budget))
+    remaining = budget - sum(counter.count(part) for part in parts)
+
+    recent: List[str] = []
+    for turn in reversed(session.turns):
+        text = _format_turn(turn)
+        # Separador entre bloques incluido en el coste
+        tokens = counter.count(text) + 1
+        if tokens > remaining:
+            if not recent and remaining > 1:
+                # El último turno no cabe entero: se conserva su comienzo
+                recent.append(counter.truncate(text, remaining - 1))
+            break
+        recent.append(text)
+        remaining -= tokens
+
+    history = "\n\n".join(parts + recent[::-1])
+    # Garantía estricta frente a diferencias de tokenización en las uniones
+    if counter.count(history) > budget:
+        history = counter.truncate(history, budget)
+    return history
+
+async def _rewrite(query: str, history: str, lane: str) -> str:
+    """Pregunta autónoma equivalente a `query` dado el historial; la original si la respuesta no sirve"""
+    counter = get_token_counter()
+    prompt = get_rewrite_prompt().format(history=history, question=query)
+    prompt_tokens = counter.count(prompt)
+    with stage("query_rewrite"):
+        text = await get_llm_gateway().call(get_llm().predict, prompt, tokens=prompt_tokens + REWRITE_MAX_TOKENS, lane=lane)
+    SESSION_TOKENS.observe(prompt_tokens, kind="rewrite_prompt")
+    record_tokens("rewrite_prompt", prompt_tokens)
+    record_tokens("rewrite_completion", counter.count(text))
+
+    lines = [line.strip().strip('"«»').strip() for line in text.strip().splitlines()]
+    standalone = next((line for line in lines if line), "")
+    if not standalone or counter.count(standalone) > REWRITE_MAX_TOKENS:
+        logger.warning("Reescritura de la pregunta descartada; se usa la original")
+        return query
+    return standalone
+
+async def start_turn(session_id: str, query: str, lane: str = "chat") -> ConversationTurn:
+    """Prepara un turno: reescribe la pregunta si es de seguimiento de la conversación de la sesión"""
+    turn = ConversationTurn(session_id=session_id, query=query, standalone_query=query)
+    session = get_session_store().get(session_id)
+    if session is None or not (session.summary or session.turns):
+        return turn
+
+    # Saludos y agradecimientos se responden igual sin historial
+    if not settings.SESSION_QUERY_REWRITE_ENABLED or not is_follow_up(query) or classify(query).reply is not None:
+        QUERY_REWRITES.inc(result="skipped")
+        return turn
+
+    history = render_history(session)
+    turn.history_tokens = get_token_counter().count(history)
+    SESSION_TOKENS.observe(turn.history_tokens, kind="history")
+    record_tokens("history", turn.history_tokens)
+    try:
+        turn.standalone_query = await _rewrite(query, history, lane)
+    except LLMOverloadedError:
+        raise
+    except Exception as e:
+        QUERY_REWRITES.inc(result="failed")
+        logger.warning(f"No se pudo reescribir la pregunta de seguimiento: {e}")
+        return turn
+
+    changed = turn.standalone_query != query
+    QUERY_REWRITES.inc(result="rewritten" if changed else "unchanged")
+    if changed:
+        logger.info(f"Pregunta de seguimiento reescrita ({turn.history_tokens} tokens de historial): '{query}' -> '{turn.standalone_query}'")
+    return turn
+
+# Resúmenes en curso por sesión
+_compactions: Dict[str, "asyncio.Task[None]"] = {}
+
+def finish_turn(turn: ConversationTurn, answer: str, usage: Optional[Dict[str, int]] = None) -> None:
+    """Guarda el turno en la sesión y, si hace falta, lanza el resumen de los turnos antiguos"""
+    new_turn = Turn(query=turn.query, standalone_query=turn.standalone_query, answer=answer, usage=usage or {})
+
+    def append(session: Optional[Session]) -> Session:
+        session = session or Session(session_id=turn.session_id)
+        session.turns.append(new_turn)
+        return session
+
+    # Lectura y escritura atómicas: los turnos concurrentes de la misma sesión no se pierden
+    session = get_session_store().update(turn.session_id, append)
+
+    # Se resume por bloques: cuando los turnos literales duplican SESSION_RECENT_TURNS
+    if len(session.turns) > 2 * max(settings.SESSION_RECENT_TURNS, 0) and turn.session_id not in _compactions:
+        task = asyncio.ensure_future(_compact(turn.session_id))
+        _compactions[turn.session_id] = task
+        task.add_done_callback(lambda _task: _compactions.pop(turn.session_id, None))
+
+async def _summarize(summary: str, turns: List[Turn]) -> str:
+    counter = get_token_counter()
+    # Si resúmenes anteriores fallaron se acumulan turnos: el prompt sigue acotado
+    turns_text = counter.truncate("\n\n".join(_format_turn(turn) for turn in turns), 4 * settings.SESSION_HISTORY_TOKEN_BUDGET)
+    prompt = get_summary_prompt().format(
+        summary=summary or "(vacío)",
+        turns=turns_text,
+        max_words=max(20, int(settings.SESSION_SUMMARY_MAX_TOKENS * 0.6))
+    )
+    prompt_tokens = counter.count(prompt)
+    SESSION_TOKENS.observe(prompt_tokens, kind="summary_prompt")
+    text = await get_llm_gateway().call(
+        get_llm().predict,
+        prompt,
+        tokens=prompt_tokens + settings.SESSION_SUMMARY_MAX_TOKENS,
+        lane="summary"
+    )
+    new_summary = counter.truncate(text.strip(), settings.SESSION_SUMMARY_MAX_TOKENS)
+    SESSION_TOKENS.observe(counter.count(new_summary), kind="summary")
+    return new_summary
+
+async def _compact(session_id: str) -> None:
+    """Incorpora al resumen los turnos anteriores a los SESSION_RECENT_TURNS más recientes"""
+    store = get_session_store()
+    session = store.get(session_id)
+    keep = max(settings.SESSION_RECENT_TURNS, 0)
+    if session is None or len(session.turns) <= keep:
+        return
+    folded = session.turns[:len(session.turns) - keep]
+    summarized = session.summarized_turns
+
+    try:
+        summary = await _summarize(session.summary, folded)
+    except Exception as e:
+        # Los turnos se conservan y se resumen tras el siguiente; el historial sigue acotado
+        SESSION_COMPACTIONS.inc(outcome="failed")
+        logger.warning(f"No se pudo resumir la sesión: {e}")
+        return
+
+    def fold(session: Optional[Session]) -> Optional[Session]:
+        # Durante el resumen pueden haberse añadido turnos, o haberse borrado o resumido la sesión en otro proceso
+        if session is None or session.summarized_turns != summarized:
+            return None
+        session.summary = summary
+        session.turns = session.turns[len(folded):]
+        session.summarized_turns += len(folded)
+        return session
+
+    session = store.update(session_id, fold)
+    if session is None:
+        return
+    SESSION_COMPACTIONS.inc(outcome="ok")
+    logger.info(f"Sesión resumida: {len(folded)} turnos incorporados al resumen ({session.summarized_turns} en total)")
+
+def get_session_info(session_id: str) -> Optional[Dict[str, Any]]:
+    """Resumen, turnos recientes y tokens del historial de una sesión; None si no existe"""
+    session = get_session_store().get(session_id)
+    if session is None:
+        return None
+    return {
+        "session_id": session.session_id,
+        "summary": session.summary,
+        "summarized_turns": session.summarized_turns,
+        "turns": [
+            {"query": turn.query, "standalone_query": turn.standalone_query, "answer": turn.answer, "usage": turn.usage}
+            for turn in session.turns
+        ],
+        "history_tokens": get_token_counter().count(render_history(session)),
+        "updated_at": session.updated_at
+    }
+
+def delete_session(session_id: str) -> bool:
+    return get_session_store().delete(session_id)
@@ -1,31 +1,253 @@
+import hashlib
 import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
 from langchain.embeddings.openai import OpenAIEmbeddings
 
+from app.core import metrics
 from app.core.config import settings
+from app.core.tracing import stage
 
 logger = logging.getLogger("rag-app")
 
 # Singleton para el servicio de embeddings
 _embeddings = None
 
-def get_embeddings() -> OpenAIEmbeddings:
+CACHE_REQUESTS = metrics.counter(
+    "rag_embedding_cache_requests_total",
+    "Textos buscados en la caché de embeddings: memory_hit, disk_hit o miss (llamada a la API)",
+    ["result"]
+)
+
+class _DiskEmbeddingStore:
+    """Almacén de embeddings en SQLite compartido entre reinicios y procesos de uvicorn"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+
+    def _connection(self) -> sqlite3.Connection:
+        """Obtiene la conexión del hilo actual (sqlite3 no comparte conexiones entre hilos)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            # WAL permite lecturas concurrentes de varios procesos mientras otro escribe
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        conn = self._connection()
+        # Respetar el límite de parámetros por sentencia de SQLite
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch)
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, items: List[Tuple[str, np.ndarray]]) -> None:
+        with self._connection() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, vector.tobytes()) for key, vector in items]
+            )
+
+class _QueryBatcher:
+    """Agrupa las llamadas concurrentes a embed_query en una sola llamada a embed_documents"""
+
+    def __init__(self, embed_documents: Callable[[List[str]], List[List[float]]], window_seconds: float, max_batch_size: int):
+        self._embed_documents = embed_documents
+        self._window_seconds = window_seconds
+        self._max_batch_size = max_batch_size
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[str, Future]] = []
+        self._batch_full = threading.Event()
+        self._leader_active = False
+
+    def submit(self, text: str) -> List[float]:
+        """Encola un texto y espera su embedding; el primer hilo del lote lo envía"""
+        future: Future = Future()
+        with self._lock:
+            self._pending.append((text, future))
+            is_leader = not self._leader_active
+            self._leader_active = True
+            if len(self._pending) >= self._max_batch_size:
+                self._batch_full.set()
+
+        if is_leader:
+            self._flush()
+
+        return future.result()
+
+    def _flush(self) -> None:
+        # Esperar a que lleguen más consultas durante la ventana o hasta llenar el lote
+        self._batch_full.wait(self._window_seconds)
+        with self._lock:
+            batch, self._pending = self._pending, []
+            self._leader_active = False
+            self._batch_full.clear()
+
+        unique_texts = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            vectors = dict(zip(unique_texts, self._embed_documents(unique_texts)))
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        if len(batch) > 1:
+            logger.debug(f"Lote de {len(batch)} consultas enviado en una sola llamada de embeddings")
+        for text, future in batch:
+            future.set_result(vectors[text])
+
+class CachedEmbeddings(Embeddings):
+    """Servicio de embeddings con caché LRU en memoria, almacén opcional en disco y micro-lotes de consultas"""
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        namespace: str,
+        max_entries: int = 10000,
+        disk_path: Optional[str] = None,
+        batch_window_ms: float = 5.0,
+        max_batch_size: int = 64
+    ):
+        self.underlying = underlying
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = _DiskEmbeddingStore(disk_path) if disk_path else None
+        self._batcher = _QueryBatcher(self._embed_uncached, batch_window_ms / 1000, max_batch_size)
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.namespace}\0{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, items: List[Tuple[str, np.ndarray]]) -> None:
+        with self._lock:
+            for key, vector in items:
+                self._memory[key] = vector
+                self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _lookup(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Busca embeddings en memoria y, si no están, en disco"""
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+            self._counters["memory_hits"] += len(found)
+        CACHE_REQUESTS.inc(len(found), result="memory_hit")
+
+        missing = [key for key in keys if key not in found]
+        if missing and self._disk is not None:
+            from_disk = self._disk.get_many(missing)
+            if from_disk:
+                self._remember(list(from_disk.items()))
+                found.update(from_disk)
+                with self._lock:
+                    self._counters["disk_hits"] += len(from_disk)
+                CACHE_REQUESTS.inc(len(from_disk), result="disk_hit")
+
+        return found
+
+    def _embed_uncached(self, texts: List[str]) -> List[List[float]]:
+        """Calcula embeddings con el servicio subyacente y los guarda en las cachés"""
+        with stage("embedding_api"):
+            vectors = self.underlying.embed_documents(texts)
+        items = [(self._key(text), np.asarray(vector, dtype=np.float32)) for text, vector in zip(texts, vectors)]
+        self._remember(items)
+        if self._disk is not None:
+            self._disk.put_many(items)
+        with self._lock:
+            self._counters["misses"] += len(texts)
+        CACHE_REQUESTS.inc(len(texts), result="miss")
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+        found = self._lookup(list(dict.fromkeys(keys)))
+
+        missing_texts = list(dict.fromkeys(text for text, key in zip(texts, keys) if key not in found))
+        if missing_texts:
+            for text, vector in zip(missing_texts, self._embed_uncached(missing_texts)):
+                found[self._key(text)] = np.asarray(vector, dtype=np.float32)
+
+        return [found[key].tolist() for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        with stage("embedding"):
+            key = self._key(text)
+            found = self._lookup([key])
+            if key in found:
+                return found[key].tolist()
+            return list(self._batcher.submit(text))
+
+    def stats(self) -> Dict[str, int]:
+        """Devuelve contadores de aciertos y fallos de la caché de embeddings"""
+        with self._lock:
+            return {**self._counters, "entries": len(self._memory)}
+
+def get_index_embeddings() -> Embeddings:
+    """
+    Embeddings para indexar documentos: sin caché, para no desplazar de la LRU los
+    embeddings de las consultas, y sin reintentos propios, porque el indexador ya
+    reintenta con backoff respetando los límites por minuto.
+    """
+    return OpenAIEmbeddings(
+        model=settings.OPENAI_EMBEDDING_MODEL,
+        openai_api_key=settings.OPENAI_API_KEY,
+        max_retries=1
+    )
+
+def get_embeddings() -> CachedEmbeddings:
     """Obtiene el servicio de embeddings, inicializándolo si no existe"""
     global _embeddings
     
     if not _embeddings:
         logger.info(f"Inicializando servicio de embeddings con modelo {settings.OPENAI_EMBEDDING_MODEL}")
-        _embeddings = OpenAIEmbeddings(
-            model=settings.OPENAI_EMBEDDING_MODEL,
-            openai_api_key=settings.OPENAI_API_KEY
+        _embeddings = CachedEmbeddings(
+            OpenAIEmbeddings(
+                model=settings.OPENAI_EMBEDDING_MODEL,
+                openai_api_key=settings.OPENAI_API_KEY
+            ),
+            namespace=settings.OPENAI_EMBEDDING_MODEL,
+            max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+            disk_path=settings.EMBEDDING_CACHE_PATH or None,
+            batch_window_ms=settings.EMBEDDING_BATCH_WINDOW_MS,
+            max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE
         )
         
-        # Probar embeddings con un texto de muestra
-        try:
-            sample_text = "Texto de prueba para verificar el servicio de embeddings"
-            sample_embedding = _embeddings.embed_query(sample_text)
-            logger.info(f"Prueba de embedding exitosa: dimensión={len(sample_embedding)}")
-        except Exception as e:
-            logger.error(f"Prueba de embedding fallida: {e}")
-            raise
+        # Probar embeddings con un texto de muestra (opcional: añade una llamada al arranque)
+        if settings.EMBEDDINGS_STARTUP_PROBE:
+            try:
+                sample_text = "Texto de prueba para verificar el servicio de embeddings"
+                sample_embedding = _embeddings.embed_query(sample_text)
+                logger.info(f"Prueba de embedding exitosa: dimensión={len(sample_embedding)}")
+            except Exception as e:
+                logger.error(f"Prueba de embedding fallida: {e}")
+                raise
     
-    return _embeddings
\ No newline at end of file
+    return _embeddings
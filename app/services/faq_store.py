@@ -0,0 +1,489 @@
+"""
+Respuestas precalculadas de las preguntas frecuentes.
+
+Las preguntas salen de los documentos de tipo "faq" (app.db.schema.DOCUMENT_RULES)
+y de la lista YAML opcional FAQ_CURATED_PATH:
+
+    - question: ¿Se puede aparcar gratis?
+    - question: ¿Hay wifi en el Village?
+      answer: Sí, hay Wi-Fi gratis en todo el Village.   # opcional: respuesta fija
+
+Al construir el almacén, las respuestas que no son fijas se generan por el camino
+RAG normal (carril "faq" del gateway). Cada pregunta se guarda en FAQ_STORE_PATH
+con su embedding y su respuesta. Una consulta idéntica a una pregunta, o con una
+similitud de al menos FAQ_SIMILARITY_THRESHOLD, recibe la respuesta guardada sin
+recuperación ni LLM.
+
+Cada respuesta generada guarda los IDs de los fragmentos recuperados (los del
+indexador). Cuando cambia el índice de documentos, las respuestas con
+fragmentos que ya no están en el manifiesto de la colección activa dejan de
+servirse y se regeneran en segundo plano. También se regeneran si cambian la
+pregunta, la respuesta del documento, el prompt o el modelo.
+
+Con varios workers de uvicorn, solo uno regenera a la vez (bloqueo del fichero).
+Los demás recargan el fichero cuando cambia.
+
+Uso:
+    python -m app.services.faq_store [--force]
+"""
+import argparse
+import asyncio
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import asdict, dataclass, field, replace
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+import yaml
+
+from app.core import metrics
+from app.core.concurrency import run_blocking
+from app.core.config import settings
+from app.db.aliases import resolve_collection
+from app.db.document_loader import list_document_files
+from app.db.indexer import chunk_hash, load_manifest, point_id
+from app.db.parsing import file_hash, iter_parsed_files
+from app.db.schema import document_metadata
+from app.db.vector_store import get_index_version, get_vector_store
+from app.services.answer_cache import normalize_query
+from app.services.embeddings import get_embeddings
+from app.services.prompt_service import PROMPT_VERSION
+
+logger = logging.getLogger("rag-app")
+
+FAQ_ENTRIES = metrics.gauge(
+    "rag_faq_entries",
+    "Preguntas del almacén de preguntas frecuentes: servibles (fresh) o pendientes de regenerar (stale)",
+    ["state"]
+)
+FAQ_GENERATIONS = metrics.counter(
+    "rag_faq_generations_total",
+    "Respuestas del almacén de preguntas frecuentes generadas (ok) o con error (failed)",
+    ["outcome"]
+)
+
+STORE_FORMAT_VERSION = 1
+# Viñeta al comienzo de la línea de respuesta (incluidos los símbolos de fuentes de los PDF)
+BULLET = re.compile(r"^[-•–·*\ue000-\uf8ff]\s*")
+# Longitud máxima de una pregunta partida en varias líneas por la extracción del PDF
+MAX_QUESTION_CHARS = 200
+# Palabras mínimas de un encabezado sin signos de interrogación para tratarlo como pregunta
+MIN_HEADING_WORDS = 3
+
+@dataclass
+class FaqQuestion:
+    """Pregunta frecuente y su respuesta en el documento o la lista curada"""
+    question: str
+    origin: str  # "document" o "curated"
+    source: str
+    reference: str = ""  # Respuesta del documento (solo referencia)
+    answer: Optional[str] = None  # Respuesta fija de la lista curada
+
+    def fingerprint(self) -> str:
+        """Huella de lo que determina la respuesta, salvo los fragmentos recuperados"""
+        payload = json.dumps(
+            [self.question, self.reference, self.answer, PROMPT_VERSION, settings.OPENAI_LLM_MODEL, settings.OPENAI_EMBEDDING_MODEL],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+@dataclass
+class FaqEntry:
+    question: str
+    answer: str
+    origin: str
+    source: str
+    fingerprint: str
+    vector: List[float]
+    chunk_ids: List[str] = field(default_factory=list)  # Fragmentos de los que se generó la respuesta
+    reference: str = ""
+    generated_at: float = field(default_factory=time.time)
+    stale: bool = False
+
+def _is_question_start(lines: List[str], i: int) -> bool:
+    line = lines[i]
+    if line.startswith("¿"):
+        return True
+    # Encabezado sin signos de interrogación seguido de una respuesta con viñeta
+    return (
+        i + 1 < len(lines)
+        and bool(BULLET.match(lines[i + 1]))
+        and not BULLET.match(line)
+        and not line.endswith((".", ",", ";", ":"))
+        and len(line.split()) >= MIN_HEADING_WORDS
+        and (i == 0 or lines[i - 1].endswith((".", "!", "?")))
+    )
+
+def extract_pairs(text: str) -> List[Tuple[str, str]]:
+    """Pares (pregunta, respuesta) del texto de un documento de preguntas frecuentes"""
+    lines = [" ".join(line.split()) for line in text.splitlines()]
+    lines = [line for line in lines if line]
+    pairs: List[Tuple[str, str]] = []
+    question = ""
+    answer: List[str] = []
+    i = 0
+    while i < len(lines):
+        if _is_question_start(lines, i):
+            if question and answer:
+                pairs.append((question, " ".join(answer)))
+            # La pregunta puede ocupar varias líneas y compartir la última con el comienzo de la respuesta
+            end = i
+            if lines[i].startswith("¿"):
+                while "?" not in lines[end] and end + 1 < len(lines) and sum(map(len, lines[i:end + 1])) < MAX_QUESTION_CHARS:
+                    end += 1
+            head, mark, rest = " ".join(lines[i:end + 1]).partition("?")
+            question = head + mark
+            answer = [text for text in [BULLET.sub("", rest.strip())] if text]
+            i = end + 1
+            continue
+        text = BULLET.sub("", lines[i])
+        if question and text:
+            answer.append(text)
+        i += 1
+    if question and answer:
+        pairs.append((question, " ".join(answer)))
+    return pairs
+
+def load_curated(path: str) -> List[FaqQuestion]:
+    """Preguntas de la lista YAML curada; vacía si no existe"""
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        items = yaml.safe_load(f) or []
+    questions = []
+    for item in items:
+        if isinstance(item, str):
+            item = {"question": item}
+        question = str(item.get("question") or "").strip()
+        if not question:
+            logger.warning(f"Entrada sin pregunta en {path}: {item}")
+            continue
+        answer = item.get("answer")
+        questions.append(FaqQuestion(question=question, origin="curated", source=path, answer=str(answer).strip() if answer else None))
+    return questions
+
+def collect_questions() -> List[FaqQuestion]:
+    """Preguntas de los documentos de preguntas frecuentes y de la lista curada (que prevalece)"""
+    files = [(path, file_hash(path)) for path in list_document_files() if document_metadata(path)["doc_type"] == "faq"]
+    questions: Dict[str, FaqQuestion] = {}
+    for path, documents in iter_parsed_files(files, workers=1):
+        pairs = extract_pairs("\n".join(document.page_content for document in documents))
+        logger.info(f"{len(pairs)} preguntas frecuentes extraídas de {path}")
+        for question, reference in pairs:
+            questions[normalize_query(question)] = FaqQuestion(question=question, origin="document", source=str(path), reference=reference)
+    for question in load_curated(settings.FAQ_CURATED_PATH):
+        questions[normalize_query(question.question)] = question
+    return list(questions.values())
+
+def current_chunk_ids() -> Optional[Set[str]]:
+    """IDs de los fragmentos de la colección activa según su manifiesto; None si no hay manifiesto"""
+    manifest = load_manifest(resolve_collection())
+    if manifest is None:
+        return None
+    return {chunk_id for entry in manifest.get("files", {}).values() for chunk_id in entry["chunks"]}
+
+def document_chunk_id(document: Any) -> str:
+    """ID del fragmento indexado del que procede un documento recuperado"""
+    return point_id(str(document.metadata.get("source")), chunk_hash(document))
+
+def _unit_vector(embedding: List[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+class FaqStore:
+    """Preguntas frecuentes con respuesta precalculada, buscadas por texto normalizado y por embedding"""
+
+    def __init__(self, path: str, similarity_threshold: float):
+        self.path = path
+        self.similarity_threshold = similarity_threshold
+        self._entries: Dict[str, FaqEntry] = {}
+        self._lock = threading.Lock()
+        # Matriz de embeddings de las entradas servibles, reconstruida tras cada cambio
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[str] = []
+        self._mtime: Optional[float] = None
+        self._index_version: Optional[str] = None
+        # Última comprobación de ensure_current (se hace como mucho cada FAQ_STORE_CHECK_SECONDS)
+        self._checked_at = float("-inf")
+        self._refresh_task: Optional["asyncio.Task[Dict[str, int]]"] = None
+        self._last_refresh: Optional[float] = None
+        self._counters = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(not entry.stale for entry in self._entries.values())
+
+    def _file_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def is_current(self) -> bool:
+        """Si el almacén corresponde al índice de documentos y al fichero actuales"""
+        return self._index_version == get_index_version() and self._mtime == self._file_mtime()
+
+    def sync(self) -> bool:
+        """Recarga el fichero si cambió y retira las respuestas de fragmentos que ya no existen; True si cambió el índice"""
+        version = get_index_version()
+        mtime = self._file_mtime()
+        entries = None
+        if mtime != self._mtime and mtime is not None:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == STORE_FORMAT_VERSION:
+                entries = {normalize_query(item["question"]): FaqEntry(**item) for item in data.get("entries", [])}
+                logger.info(f"Almacén de preguntas frecuentes cargado ({len(entries)} preguntas)")
+
+        valid = current_chunk_ids()
+        with self._lock:
+            if entries is not None:
+                self._entries = entries
+            self._mtime = mtime
+            index_changed = self._index_version != version
+            self._index_version = version
+            self._mark_stale(valid)
+        return index_changed
+
+    def _mark_stale(self, valid: Optional[Set[str]]) -> None:
+        """Marca las respuestas generadas a partir de fragmentos eliminados (llamar con el lock adquirido)"""
+        if valid is not None:
+            for entry in self._entries.values():
+                if entry.chunk_ids and not valid.issuperset(entry.chunk_ids):
+                    entry.stale = True
+        self._matrix = None
+        FAQ_ENTRIES.set(sum(not entry.stale for entry in self._entries.values()), state="fresh")
+        FAQ_ENTRIES.set(sum(entry.stale for entry in self._entries.values()), state="stale")
+
+    async def ensure_current(self, force: bool = False) -> None:
+        """
+        Sincroniza con el índice y el fichero; si cambió el índice, regenera en segundo
+        plano lo que haga falta. Se llama en cada consulta: sin `force`, solo comprueba
+        cada FAQ_STORE_CHECK_SECONDS.
+        """
+        now = time.monotonic()
+        if not force and now - self._checked_at < settings.FAQ_STORE_CHECK_SECONDS:
+            return
+        self._checked_at = now
+        if self.is_current():
+            return
+        if await run_blocking(self.sync):
+            self.schedule_refresh()
+
+    def get_exact(self, query: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(normalize_query(query))
+            if entry is None or entry.stale:
+                return None
+            self._counters["exact_hits"] += 1
+            return entry.answer
+
+    def get_semantic(self, embedding: List[float]) -> Optional[str]:
+        """Respuesta de la pregunta más parecida si supera el umbral de similitud"""
+        vector = _unit_vector(embedding)
+        with self._lock:
+            matrix = self._semantic_matrix()
+            if matrix is not None:
+                scores = matrix @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold:
+                    entry = self._entries[self._matrix_keys[best]]
+                    self._counters["semantic_hits"] += 1
+                    logger.info(f"Respuesta del almacén de preguntas frecuentes: '{entry.question}' (similitud={scores[best]:.3f})")
+                    return entry.answer
+            self._counters["misses"] += 1
+            return None
+
+    def _semantic_matrix(self) -> Optional[np.ndarray]:
+        """Matriz de embeddings de las preguntas servibles (llamar con el lock adquirido)"""
+        if self._matrix is None:
+            keys = [key for key, entry in self._entries.items() if not entry.stale and entry.vector]
+            if not keys:
+                return None
+            self._matrix = np.vstack([_unit_vector(self._entries[key].vector) for key in keys])
+            self._matrix_keys = keys
+        return self._matrix
+
+    def schedule_refresh(self, force: bool = False) -> None:
+        """Lanza la regeneración en segundo plano si no hay una en curso"""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.ensure_future(self._refresh_logged(force))
+
+    async def _refresh_logged(self, force: bool) -> Dict[str, int]:
+        try:
+            return await self.refresh(force)
+        except Exception as e:
+            logger.error(f"Error regenerando el almacén de preguntas frecuentes: {e}", exc_info=True)
+            return {}
+
+    async def refresh(self, force: bool = False) -> Dict[str, int]:
+        """
+        Extrae las preguntas, conserva las respuestas vigentes y genera las que falten
+        o estén obsoletas; con `force`, las regenera todas. Devuelve los contadores.
+        """
+        lock_file = await run_blocking(self._try_lock)
+        if lock_file is None:
+            logger.info("Otro proceso está regenerando el almacén de preguntas frecuentes")
+            return {}
+        try:
+            return await self._refresh(force)
+        finally:
+            lock_file.close()
+
+    def _try_lock(self) -> Optional[Any]:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        lock_file = open(f"{self.path}.lock", "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return None
+        return lock_file
+
+    async def _refresh(self, force: bool) -> Dict[str, int]:
+        # Importación diferida: rag_service consulta este almacén en cada respuesta
+        from app.services.rag_service import generate_canonical_answer
+
+        start = time.perf_counter()
+        vector_store = await get_vector_store()
+        if vector_store is None:
+            raise RuntimeError("Almacén vectorial no inicializado")
+        await run_blocking(self.sync)
+        version = get_index_version()
+        questions = await run_blocking(collect_questions)
+        valid = await run_blocking(current_chunk_ids)
+
+        with self._lock:
+            current = dict(self._entries)
+        entries: Dict[str, FaqEntry] = {}
+        pending: List[FaqQuestion] = []
+        for question in questions:
+            key = normalize_query(question.question)
+            entry = current.get(key)
+            if not force and entry is not None and not entry.stale and entry.fingerprint == question.fingerprint():
+                entries[key] = entry
+            else:
+                pending.append(question)
+
+        counts = {"questions": len(questions), "kept": len(entries), "generated": 0, "failed": 0}
+        if pending:
+            logger.info(f"Generando {len(pending)} respuestas del almacén de preguntas frecuentes")
+            vectors = await run_blocking(get_embeddings().embed_documents, [question.question for question in pending])
+            semaphore = asyncio.Semaphore(max(1, settings.FAQ_GENERATION_CONCURRENCY))
+
+            async def generate(question: FaqQuestion, vector: List[float]) -> None:
+                key = normalize_query(question.question)
+                async with semaphore:
+                    try:
+                        chunk_ids: List[str] = []
+                        answer = question.answer
+                        if answer is None:
+                            answer, documents = await generate_canonical_answer(question.question, vector_store)
+                            chunk_ids = sorted({document_chunk_id(document) for document in documents})
+                            if valid is not None:
+                                # Solo los que el manifiesto puede invalidar
+                                chunk_ids = [chunk_id for chunk_id in chunk_ids if chunk_id in valid]
+                        entries[key] = FaqEntry(
+                            question=question.question,
+                            answer=answer,
+                            origin=question.origin,
+                            source=question.source,
+                            fingerprint=question.fingerprint(),
+                            vector=list(vector),
+                            chunk_ids=chunk_ids,
+                            reference=question.reference
+                        )
+                        counts["generated"] += 1
+                        FAQ_GENERATIONS.inc(outcome="ok")
+                    except Exception as e:
+                        # La anterior, si la había, se conserva sin servirse
+                        counts["failed"] += 1
+                        FAQ_GENERATIONS.inc(outcome="failed")
+                        logger.warning(f"No se pudo generar la respuesta de '{question.question}': {e}")
+                        if key in current:
+                            entries[key] = replace(current[key], stale=True)
+
+            await asyncio.gather(*(generate(question, vector) for question, vector in zip(pending, vectors)))
+
+        await run_blocking(self._save, list(entries.values()))
+        with self._lock:
+            self._entries = entries
+            self._mtime = self._file_mtime()
+            self._mark_stale(valid)
+        self._last_refresh = time.time()
+        logger.info(
+            f"Almacén de preguntas frecuentes actualizado en {time.perf_counter() - start:.1f} s: "
+            f"{counts['kept']} vigentes, {counts['generated']} generadas, {counts['failed']} con error"
+        )
+
+        # El índice cambió mientras se generaba: las respuestas pueden proceder de la versión anterior
+        if get_index_version() != version:
+            self.schedule_refresh()
+        return counts
+
+    def _save(self, entries: List[FaqEntry]) -> None:
+        """Guarda el almacén de forma atómica"""
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": STORE_FORMAT_VERSION, "entries": [asdict(entry) for entry in entries]}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de aciertos y parte del tráfico total servida por el almacén"""
+        # Importación diferida: solo para la proporción sobre todas las consultas enrutadas
+        from app.services.intent_router import ROUTES
+
+        with self._lock:
+            counters = dict(self._counters)
+            entries = len(self._entries)
+            stale = sum(entry.stale for entry in self._entries.values())
+        hits = counters["exact_hits"] + counters["semantic_hits"]
+        lookups = hits + counters["misses"]
+        traffic = sum(sample["value"] for sample in ROUTES.samples())
+        return {
+            "enabled": settings.FAQ_STORE_ENABLED,
+            "entries": entries,
+            "stale": stale,
+            "similarity_threshold": self.similarity_threshold,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "traffic_share": hits / traffic if traffic else 0.0,
+            "last_refresh": self._last_refresh,
+            **counters
+        }
+
+# Singleton para el almacén de preguntas frecuentes
+_faq_store: Optional[FaqStore] = None
+
+def get_faq_store() -> FaqStore:
+    """Obtiene el almacén de preguntas frecuentes, inicializándolo si no existe"""
+    global _faq_store
+
+    if _faq_store is None:
+        _faq_store = FaqStore(settings.FAQ_STORE_PATH, settings.FAQ_SIMILARITY_THRESHOLD)
+
+    return _faq_store
+
+def main() -> None:
+    from app.core.config import validate_settings
+    from app.core.logging import setup_logging
+
+    parser = argparse.ArgumentParser(description="Construye o actualiza el almacén de preguntas frecuentes")
+    parser.add_argument("--force", action="store_true", help="Regenerar todas las respuestas")
+    args = parser.parse_args()
+
+    setup_logging()
+    validate_settings()
+    counts = asyncio.run(get_faq_store().refresh(force=args.force))
+    print(json.dumps(counts, indent=2))
+
+if __name__ == "__main__":
+    main()
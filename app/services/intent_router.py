@@ -0,0 +1,301 @@
+"""
+Enrutado de consultas por intención antes del RAG.
+
+Los saludos, agradecimientos y despedidas se responden con una plantilla en el
+idioma de la consulta, sin embeddings, recuperación ni LLM. El resto de consultas
+se clasifican por tema (horarios, restaurantes, marcas, servicios) para elegir el
+número de fragmentos recuperados y la variante del prompt.
+
+La clasificación es por reglas de palabras clave (castellano, catalán, inglés y
+francés). Opcionalmente, si INTENT_MODEL_PATH apunta a un modelo fastText con
+etiquetas __label__<intención>, se consulta cuando las reglas no reconocen el tema.
+"""
+import logging
+import re
+import threading
+import unicodedata
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.tracing import stage
+
+logger = logging.getLogger("rag-app")
+
+SMALL_TALK_INTENTS = ("farewell", "thanks", "greeting")  # Por prioridad si se combinan
+TOPIC_INTENTS = ("hours", "restaurants", "brands", "services")
+DEFAULT_INTENT = "general"
+DEFAULT_LANGUAGE = "es"
+# Consultas más largas no se consideran charla aunque solo contengan fórmulas de cortesía
+SMALL_TALK_MAX_TOKENS = 12
+
+# Fórmulas de cortesía por intención e idioma (normalizadas: minúsculas y sin acentos)
+SMALL_TALK_PHRASES = {
+    "greeting": {
+        "es": ["hola", "buenas", "buenos dias", "buenas tardes", "buenas noches", "que tal", "saludos"],
+        "ca": ["bon dia", "bona tarda", "bona nit", "bones"],
+        "en": ["hi", "hello", "hey", "good morning", "good afternoon", "good evening"],
+        "fr": ["bonjour", "bonsoir", "salut"],
+    },
+    "thanks": {
+        "es": ["gracias", "muchas gracias", "mil gracias", "muchisimas gracias", "te lo agradezco", "se lo agradezco", "muy amable"],
+        "ca": ["gracies", "moltes gracies", "merces", "molt amable"],
+        "en": ["thanks", "thank you", "thank you very much", "thanks a lot", "many thanks", "thx", "cheers"],
+        "fr": ["merci", "merci beaucoup"],
+    },
+    "farewell": {
+        "es": ["adios", "hasta luego", "hasta pronto", "hasta manana", "chao", "chau", "nos vemos", "que vaya bien"],
+        "ca": ["adeu", "fins aviat", "fins despres", "fins dema", "a reveure"],
+        "en": ["bye", "goodbye", "bye bye", "see you", "see you soon", "have a nice day"],
+        "fr": ["au revoir", "a bientot", "bonne journee"],
+    },
+}
+
+# Palabras que pueden acompañar a una fórmula de cortesía sin cambiar la intención
+SMALL_TALK_FILLERS = frozenset("""
+a al de del el la y e o por tu su vuestra ayuda todo muy pues vale ok okay perfecto genial estupendo bien
+and for your help all very much so great perfect
+per teva vostra ajuda tot molt perfecte
+pour votre aide tout tres parfait
+""".split())
+
+# Palabras clave por tema; las terminadas en "*" son raíces que se comparan con el inicio
+# de cada término, elegidas para no coincidir con palabras de otros temas ("carta" no es "cartera")
+TOPIC_KEYWORDS = {
+    "hours": [
+        "horari*", "hora", "horas", "abre", "abren", "abrir", "abierto", "abierta", "abiertos", "abiertas", "apertura",
+        "cierra", "cierran", "cerrar", "cierre", "cerrado", "cerrada", "cerrados", "festivo", "festivos", "domingo", "domingos",
+        "open", "opens", "opening", "close", "closes", "closing", "closed", "hours", "sunday", "sundays", "holiday", "holidays",
+        "obert", "oberta", "oberts", "obre", "obren", "tanca", "tanquen", "tancat", "diumenge", "diumenges",
+        "ouvert", "ouverte", "ouverture", "ferme", "fermeture", "heure", "heures", "dimanche",
+    ],
+    "restaurants": [
+        "restaura*", "comer", "comida", "comidas", "menu", "menus", "carta", "cafe", "cafes", "cafeteria*", "desayun*",
+        "almorzar", "almuerzo", "almuerzos", "cena", "cenar", "cenas", "halal", "vegetarian*", "vegan*", "celiac*", "gluten",
+        "alergen*", "helado*", "heladeria*", "postre", "postres", "bebida", "bebidas",
+        "food", "eat", "eating", "lunch", "dinner", "breakfast", "drink", "drinks", "allergen*",
+        "menjar", "esmorzar", "dinar", "sopar",
+        "manger", "dejeuner",
+    ],
+    "brands": [
+        "marca", "marcas", "tienda", "tiendas", "boutique", "boutiques", "firma", "firmas", "ropa", "moda", "zapat*",
+        "bolso", "bolsos", "perfum*", "reloj", "relojes", "joya", "joyas", "joyeria*", "gafas",
+        "brand", "brands", "store", "stores", "fashion", "shoe", "shoes", "bag", "bags", "watch", "watches", "jewel*",
+        "botiga", "botigues", "roba", "sabata", "sabates",
+        "magasin", "magasins", "vetement", "vetements", "chaussure", "chaussures",
+    ],
+    "services": [
+        "servicio", "servicios", "parking", "aparca*", "shopper", "tax", "taxi", "wifi", "consigna", "mascota", "mascotas",
+        "perro", "perros", "carrito", "carritos", "silla", "sillas", "tren", "trenes", "autobus", "autobuses", "bus",
+        "shuttle", "transporte", "tarjeta", "tarjetas", "regalo", "regalos", "devoluc*", "cambio", "cambios", "cambiar",
+        "hands", "recarga*", "accesib*", "experiencia", "experiencias",
+        "service", "services", "pet", "pets", "dog", "dogs", "gift", "gifts", "refund", "refunds", "return", "returns",
+        "transport", "experience", "experiences",
+        "servei", "serveis", "gos", "gossos", "targeta", "targetes",
+        "chien", "chiens", "cadeau", "cadeaux", "remboursement",
+    ],
+}
+
+def _build_keyword_table() -> Dict[str, Tuple[frozenset, Tuple[str, ...]]]:
+    """Palabras exactas y raíces de cada tema"""
+    return {
+        intent: (
+            frozenset(keyword for keyword in keywords if not keyword.endswith("*")),
+            tuple(keyword[:-1] for keyword in keywords if keyword.endswith("*"))
+        )
+        for intent, keywords in TOPIC_KEYWORDS.items()
+    }
+
+_KEYWORDS = _build_keyword_table()
+
+# Variante del prompt por intención (ver prompt_service.EJEMPLOS_POR_VARIANTE)
+PROMPT_VARIANTS = {intent: intent for intent in TOPIC_INTENTS}
+
+# Respuestas directas por intención e idioma, con el tono de los ejemplos del prompt
+TEMPLATES = {
+    "greeting": {
+        "es": "Bienvenido a La Roca Village. ¿En qué puedo ayudarle hoy? Estamos a su disposición para cualquier consulta sobre nuestras boutiques exclusivas, servicios premium o información práctica para su visita.",
+        "ca": "Benvingut a La Roca Village. En què el puc ajudar avui? Estem a la seva disposició per a qualsevol consulta sobre les nostres botigues exclusives, serveis prèmium o informació pràctica per a la seva visita.",
+        "en": "Welcome to La Roca Village. How may I help you today? We are at your disposal for any enquiry about our exclusive boutiques, premium services or practical information for your visit.",
+        "fr": "Bienvenue à La Roca Village. Comment puis-je vous aider aujourd'hui ? Nous sommes à votre disposition pour toute question sur nos boutiques exclusives, nos services premium ou des informations pratiques pour votre visite.",
+    },
+    "thanks": {
+        "es": "Es un placer atenderle. Si desea cualquier otra información sobre nuestras boutiques, servicios o su visita a La Roca Village, estaremos encantados de ayudarle.",
+        "ca": "És un plaer atendre'l. Si desitja qualsevol altra informació sobre les nostres botigues, serveis o la seva visita a La Roca Village, estarem encantats d'ajudar-lo.",
+        "en": "It is a pleasure to assist you. Should you need any further information about our boutiques, services or your visit to La Roca Village, we will be delighted to help.",
+        "fr": "C'est un plaisir de vous aider. Si vous souhaitez d'autres informations sur nos boutiques, nos services ou votre visite à La Roca Village, nous serons ravis de vous aider.",
+    },
+    "farewell": {
+        "es": "Ha sido un placer atenderle. Le agradecemos su interés en La Roca Village y esperamos darle la bienvenida muy pronto para que disfrute de una experiencia de compra excepcional. Que tenga un excelente día.",
+        "ca": "Ha estat un plaer atendre'l. Li agraïm el seu interès per La Roca Village i esperem donar-li la benvinguda molt aviat perquè gaudeixi d'una experiència de compra excepcional. Que tingui un dia excel·lent.",
+        "en": "It has been a pleasure to assist you. Thank you for your interest in La Roca Village; we look forward to welcoming you very soon for an exceptional shopping experience. Have a wonderful day.",
+        "fr": "Ce fut un plaisir de vous aider. Nous vous remercions de votre intérêt pour La Roca Village et espérons vous accueillir très bientôt pour une expérience de shopping exceptionnelle. Excellente journée.",
+    },
+}
+
+ROUTES = metrics.counter(
+    "rag_intent_routes_total",
+    "Consultas por intención y camino: respuesta directa (template) o recuperación + LLM (rag)",
+    ["intent", "route"]
+)
+LATENCY_SAVED = metrics.counter(
+    "rag_intent_latency_saved_seconds_total",
+    "Latencia estimada ahorrada por las respuestas directas (media móvil del camino RAG completo)"
+)
+FULL_PATH_SECONDS = metrics.gauge(
+    "rag_full_path_seconds_avg",
+    "Media móvil exponencial de la duración de una respuesta RAG completa"
+)
+# Peso de cada nueva observación en la media móvil
+FULL_PATH_EWMA_ALPHA = 0.1
+
+@dataclass(frozen=True)
+class RouteDecision:
+    """Intención detectada y cómo atender la consulta"""
+    intent: str
+    language: str
+    k: int
+    prompt_variant: str
+    reply: Optional[str] = None  # Respuesta directa; None si hay que pasar por el RAG
+    source: str = "rules"  # "rules", "model" o "disabled"
+
+def _normalize(text: str) -> List[str]:
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return re.findall(r"[a-z0-9]+", text)
+
+def _build_phrase_table() -> Dict[Tuple[str, ...], Tuple[str, str]]:
+    table = {}
+    for intent, languages in SMALL_TALK_PHRASES.items():
+        for language, phrases in languages.items():
+            for phrase in phrases:
+                table.setdefault(tuple(phrase.split()), (intent, language))
+    return table
+
+_PHRASES = _build_phrase_table()
+_MAX_PHRASE_TOKENS = max(len(phrase) for phrase in _PHRASES)
+
+def _match_small_talk(tokens: List[str]) -> Optional[Tuple[str, str]]:
+    """(intención, idioma) si la consulta solo contiene fórmulas de cortesía y relleno"""
+    if not tokens or len(tokens) > SMALL_TALK_MAX_TOKENS:
+        return None
+
+    intents, languages = set(), []
+    i = 0
+    while i < len(tokens):
+        for size in range(min(_MAX_PHRASE_TOKENS, len(tokens) - i), 0, -1):
+            match = _PHRASES.get(tuple(tokens[i:i + size]))
+            if match:
+                intents.add(match[0])
+                languages.append(match[1])
+                i += size
+                break
+        else:
+            if tokens[i] not in SMALL_TALK_FILLERS:
+                return None
+            i += 1
+
+    if not intents:
+        return None
+    intent = next(intent for intent in SMALL_TALK_INTENTS if intent in intents)
+    return intent, languages[0]
+
+def _match_topic(tokens: List[str]) -> Optional[str]:
+    """Tema con más palabras clave en la consulta; None si no hay ninguna o hay empate"""
+    scores = {
+        intent: sum(token in words or token.startswith(stems) for token in tokens)
+        for intent, (words, stems) in _KEYWORDS.items()
+    }
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    if not ranked[0][1] or ranked[0][1] == ranked[1][1]:
+        return None
+    return ranked[0][0]
+
+_model: Any = None
+_model_path: Optional[str] = None
+_model_lock = threading.Lock()
+
+def _get_model() -> Any:
+    """Modelo fastText opcional; None si no está configurado o no se puede cargar"""
+    global _model, _model_path
+
+    path = settings.INTENT_MODEL_PATH
+    if not path:
+        return None
+    if _model_path != path:
+        with _model_lock:
+            if _model_path != path:
+                try:
+                    import fasttext
+                    _model = fasttext.load_model(path)
+                    logger.info(f"Modelo de intenciones cargado desde {path}")
+                except ImportError:
+                    _model = None
+                    logger.warning("INTENT_MODEL_PATH configurado pero fasttext no está instalado; se usarán solo las reglas")
+                except Exception as e:
+                    _model = None
+                    logger.warning(f"No se pudo cargar el modelo de intenciones {path}: {e}")
+                _model_path = path
+    return _model
+
+def _predict_intent(tokens: List[str]) -> Optional[str]:
+    model = _get_model()
+    if model is None or not tokens:
+        return None
+    labels, probabilities = model.predict(" ".join(tokens), k=1)
+    if not labels or probabilities[0] < settings.INTENT_MODEL_MIN_CONFIDENCE:
+        return None
+    intent = labels[0].replace("__label__", "")
+    return intent if intent in SMALL_TALK_INTENTS or intent in TOPIC_INTENTS else None
+
+def _decision(intent: str, language: str = DEFAULT_LANGUAGE, source: str = "rules") -> RouteDecision:
+    reply = TEMPLATES[intent].get(language, TEMPLATES[intent][DEFAULT_LANGUAGE]) if intent in TEMPLATES else None
+    return RouteDecision(
+        intent=intent,
+        language=language,
+        k=settings.INTENT_RETRIEVAL_K.get(intent) or settings.RAG_RETRIEVAL_K,
+        prompt_variant=PROMPT_VARIANTS.get(intent, DEFAULT_INTENT),
+        reply=reply,
+        source=source
+    )
+
+def classify(query: str) -> RouteDecision:
+    """Clasifica la consulta sin registrar métricas"""
+    if not settings.INTENT_ROUTER_ENABLED:
+        return _decision(DEFAULT_INTENT, source="disabled")
+
+    tokens = _normalize(query)
+    small_talk = _match_small_talk(tokens)
+    if small_talk:
+        return _decision(*small_talk)
+
+    topic = _match_topic(tokens)
+    if topic:
+        return _decision(topic)
+
+    predicted = _predict_intent(tokens)
+    if predicted:
+        return _decision(predicted, source="model")
+    return _decision(DEFAULT_INTENT)
+
+def route_query(query: str) -> RouteDecision:
+    """Clasifica la consulta y registra la decisión de enrutado"""
+    with stage("intent"):
+        decision = classify(query)
+    if decision.source == "disabled":
+        return decision
+
+    if decision.reply is not None:
+        ROUTES.inc(intent=decision.intent, route="template")
+        LATENCY_SAVED.inc(FULL_PATH_SECONDS.value())
+        logger.info(f"Consulta respondida sin RAG (intención={decision.intent}, idioma={decision.language})")
+    else:
+        ROUTES.inc(intent=decision.intent, route="rag")
+        logger.info(f"Intención '{decision.intent}' ({decision.source}): k={decision.k}, prompt={decision.prompt_variant}")
+    return decision
+
+def record_full_path(seconds: float) -> None:
+    """Registra la duración de una respuesta RAG completa para estimar el ahorro de las respuestas directas"""
+    previous = FULL_PATH_SECONDS.value()
+    FULL_PATH_SECONDS.set(seconds if not previous else previous + FULL_PATH_EWMA_ALPHA * (seconds - previous))
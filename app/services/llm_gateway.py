@@ -0,0 +1,235 @@
+"""
+Control de admisión de las llamadas al LLM.
+
+Todas las generaciones pasan por el gateway, que limita:
+- las llamadas simultáneas (LLM_MAX_CONCURRENCY);
+- los tokens por minuto enviados (LLM_TOKENS_PER_MINUTE, prompt + respuesta estimada).
+
+Las peticiones que no caben esperan en una cola acotada ordenada por prioridad
+(carril de la petición, LLM_PRIORITY_LANES; menor valor = más prioritario). Si la
+cola está llena, o la espera estimada o real supera LLM_MAX_WAIT_SECONDS, se
+rechazan con LLMOverloadedError, que la API traduce a 429 con Retry-After.
+
+Los errores transitorios de OpenAI se reintentan con backoff exponencial sin
+liberar el turno, mientras la llamada no haya emitido ningún token.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+from typing import Any, Callable, List, Optional, Tuple, TypeVar
+
+import openai
+
+from app.core import metrics
+from app.core.concurrency import run_blocking
+from app.core.config import settings
+from app.core.rate_limit import TokenBucket, backoff_delay
+from app.core.tracing import record_stage, stage
+
+logger = logging.getLogger("rag-app")
+
+T = TypeVar("T")
+
+# Errores de OpenAI que pueden resolverse reintentando
+RETRYABLE_ERRORS = (
+    openai.error.Timeout,
+    openai.error.APIError,
+    openai.error.APIConnectionError,
+    openai.error.RateLimitError,
+    openai.error.ServiceUnavailableError,
+    openai.error.TryAgain,
+)
+# Duración estimada de una llamada hasta tener observaciones reales
+INITIAL_SERVICE_SECONDS = 2.0
+# Peso de cada nueva observación en la media móvil de la duración
+SERVICE_EWMA_ALPHA = 0.2
+MAX_RETRY_SECONDS = 30.0
+
+QUEUE_DEPTH = metrics.gauge("rag_llm_queue_depth", "Peticiones esperando turno para llamar al LLM")
+IN_FLIGHT = metrics.gauge("rag_llm_in_flight", "Llamadas al LLM en curso")
+QUEUE_WAIT = metrics.histogram(
+    "rag_llm_queue_wait_seconds",
+    "Espera hasta obtener turno (concurrencia y tokens por minuto) por carril",
+    ["lane"]
+)
+ADMISSIONS = metrics.counter(
+    "rag_llm_admissions_total",
+    "Decisiones de admisión por carril: admitted, rejected_queue_full, rejected_deadline",
+    ["lane", "outcome"]
+)
+RETRIES = metrics.counter("rag_llm_retries_total", "Reintentos de llamadas al LLM por tipo de error", ["error"])
+
+class LLMOverloadedError(Exception):
+    """El LLM no puede atender la petición ahora; reintentar tras `retry_after` segundos"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def lane_priority(lane: str) -> int:
+    """Prioridad de un carril (menor valor = más prioritario); los desconocidos van al final"""
+    lanes = settings.LLM_PRIORITY_LANES
+    return lanes.get(lane, max(lanes.values(), default=0) + 1)
+
+def _upstream_retry_after(error: BaseException) -> Optional[float]:
+    """Retry-After indicado por OpenAI en la respuesta de error, si lo hay"""
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+class LLMGateway:
+    """Cola de prioridad acotada, límite de concurrencia y presupuesto de tokens por minuto"""
+
+    def __init__(self, max_concurrency: int, tokens_per_minute: float, max_queue: int, max_wait_seconds: float):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self._tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute) if tokens_per_minute > 0 else None
+        self._active = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._service_seconds = INITIAL_SERVICE_SECONDS
+
+    def _estimated_wait(self, priority: int) -> float:
+        """Espera estimada de una nueva petición según las que tiene delante en la cola"""
+        ahead = sum(1 for waiter_priority, _, _ in self._waiters if waiter_priority <= priority)
+        return math.ceil((ahead + 1) / self.max_concurrency) * self._service_seconds
+
+    def _reject(self, lane: str, outcome: str, retry_after: float, reason: str) -> LLMOverloadedError:
+        ADMISSIONS.inc(lane=lane, outcome=outcome)
+        logger.warning(f"Petición al LLM rechazada (carril {lane}): {reason}; reintentar en {retry_after:.1f} s")
+        return LLMOverloadedError(f"Servicio saturado: {reason}", retry_after)
+
+    def _release(self) -> None:
+        """Libera un turno y se lo cede a la petición en espera más prioritaria"""
+        self._active -= 1
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                self._active += 1
+                break
+        QUEUE_DEPTH.set(len(self._waiters))
+        IN_FLIGHT.set(self._active)
+
+    async def _acquire_slot(self, priority: int, lane: str, deadline: float) -> None:
+        if self._active < self.max_concurrency and not self._waiters:
+            self._active += 1
+            IN_FLIGHT.set(self._active)
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            raise self._reject(lane, "rejected_queue_full", self._estimated_wait(priority), "cola de espera llena")
+        estimate = self._estimated_wait(priority)
+        if estimate > self.max_wait_seconds:
+            raise self._reject(lane, "rejected_deadline", estimate, f"espera estimada de {estimate:.1f} s")
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._sequence), future)
+        heapq.heappush(self._waiters, entry)
+        QUEUE_DEPTH.set(len(self._waiters))
+        try:
+            await asyncio.wait_for(future, timeout=max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            raise self._reject(lane, "rejected_deadline", self._estimated_wait(priority), "tiempo de espera agotado")
+        except BaseException:
+            # Petición cancelada: devolver el turno si ya se le había cedido
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+        finally:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            QUEUE_DEPTH.set(len(self._waiters))
+        IN_FLIGHT.set(self._active)
+
+    async def _acquire_tokens(self, tokens: int, lane: str, deadline: float) -> None:
+        if self._tokens is None:
+            return
+        while True:
+            wait_seconds = self._tokens.try_acquire(tokens)
+            if wait_seconds <= 0:
+                return
+            if time.monotonic() + wait_seconds > deadline:
+                raise self._reject(lane, "rejected_deadline", wait_seconds, "presupuesto de tokens por minuto agotado")
+            await asyncio.sleep(wait_seconds)
+
+    async def call(
+        self,
+        func: Callable[..., T],
+        *args: Any,
+        tokens: int,
+        lane: str = "chat",
+        can_retry: Callable[[], bool] = lambda: True,
+        **kwargs: Any
+    ) -> T:
+        """Ejecuta una llamada bloqueante al LLM cuando haya turno y presupuesto, con reintentos"""
+        start = time.monotonic()
+        deadline = start + self.max_wait_seconds
+
+        await self._acquire_slot(lane_priority(lane), lane, deadline)
+        try:
+            await self._acquire_tokens(tokens, lane, deadline)
+            waited = time.monotonic() - start
+            QUEUE_WAIT.observe(waited, lane=lane)
+            record_stage("llm_queue", waited)
+            ADMISSIONS.inc(lane=lane, outcome="admitted")
+
+            attempt = 0
+            while True:
+                call_start = time.monotonic()
+                try:
+                    with stage("llm"):
+                        result = await run_blocking(func, *args, **kwargs)
+                except RETRYABLE_ERRORS as e:
+                    attempt += 1
+                    if attempt > settings.LLM_MAX_RETRIES or not can_retry():
+                        if isinstance(e, openai.error.RateLimitError):
+                            raise LLMOverloadedError(f"Límite de OpenAI alcanzado: {e}", _upstream_retry_after(e) or self.max_wait_seconds) from e
+                        raise
+                    delay = max(
+                        backoff_delay(attempt, settings.LLM_RETRY_BASE_SECONDS, MAX_RETRY_SECONDS),
+                        _upstream_retry_after(e) or 0.0
+                    )
+                    RETRIES.inc(error=type(e).__name__)
+                    logger.warning(f"Error transitorio del LLM ({type(e).__name__}: {e}); reintento {attempt}/{settings.LLM_MAX_RETRIES} en {delay:.1f} s")
+                    await asyncio.sleep(delay)
+                    continue
+
+                elapsed = time.monotonic() - call_start
+                self._service_seconds += SERVICE_EWMA_ALPHA * (elapsed - self._service_seconds)
+                return result
+        finally:
+            self._release()
+
+    def stats(self) -> dict:
+        return {
+            "active": self._active,
+            "queued": len(self._waiters),
+            "service_seconds": round(self._service_seconds, 3),
+        }
+
+_gateway: Optional[LLMGateway] = None
+
+def get_llm_gateway() -> LLMGateway:
+    """Obtiene el gateway de llamadas al LLM, creándolo si no existe"""
+    global _gateway
+
+    if _gateway is None:
+        _gateway = LLMGateway(
+            max_concurrency=settings.LLM_MAX_CONCURRENCY,
+            tokens_per_minute=settings.LLM_TOKENS_PER_MINUTE,
+            max_queue=settings.LLM_MAX_QUEUE,
+            max_wait_seconds=settings.LLM_MAX_WAIT_SECONDS
+        )
+        logger.info(
+            f"Gateway LLM: {settings.LLM_MAX_CONCURRENCY} llamadas simultáneas, "
+            f"{settings.LLM_TOKENS_PER_MINUTE or 'sin límite de'} tokens/min, cola de {settings.LLM_MAX_QUEUE}"
+        )
+    return _gateway
@@ -1,3 +1,5 @@
+import hashlib
+
 from langchain.prompts import PromptTemplate
 
 # Contexto sobre La Roca Village
@@ -48,8 +50,7 @@ RESTRICCIONES = """
 """
 
 # Ejemplos de respuestas
-EJEMPLOS_RESPUESTAS = """
-Ejemplo 1:
+EJEMPLO_MARCAS = """
 Pregunta: ¿Qué marcas de lujo puedo encontrar en La Roca Village?
 Respuesta: En La Roca Village encontrará una selecta colección de boutiques de marcas de lujo con descuentos exclusivos. Las principales marcas disponibles son:
 
@@ -63,12 +64,14 @@ Respuesta: En La Roca Village encontrará una selecta colección de boutiques de
 • **Versace**
 
 Todas estas boutiques ofrecen colecciones de temporadas anteriores con descuentos de hasta el 60 sobre el precio original. Le recomendamos reservar al menos 3 horas para disfrutar plenamente de su experiencia de compra en nuestro exclusivo entorno.
+"""
 
-Ejemplo 2:
+EJEMPLO_HORARIOS = """
 Pregunta: ¿Cuál es el horario de apertura?
 Respuesta: La Roca Village está abierto de lunes a domingo de 10:00 a 21:00h. Durante días festivos especiales y temporada alta, podemos extender nuestro horario hasta las 22:00h. Le recomendamos visitar nuestro Village preferiblemente entre semana para disfrutar de una experiencia de compra más tranquila y personalizada.
+"""
 
-Ejemplo 3:
+EJEMPLO_RESTAURANTES = """
 Pregunta: What restaurants can I find at La Roca Village?
 Respuesta: At La Roca Village, you can enjoy a variety of premium dining options to complement your exclusive shopping experience:
 
@@ -79,16 +82,44 @@ Respuesta: At La Roca Village, you can enjoy a variety of premium dining options
 • **Sushi Club**: Contemporary Japanese cuisine
 
 All our restaurants use high-quality ingredients and offer both indoor and outdoor seating in our charming Mediterranean village setting.
+"""
+
+EJEMPLO_SERVICIOS = """
+Pregunta: ¿Qué servicios ofrecen a los visitantes?
+Respuesta: La Roca Village pone a su disposición servicios pensados para que disfrute de su visita con total comodidad, entre otras opciones:
+
+• **Devolución de impuestos**: Tramitación del tax refund para visitantes de fuera de la Unión Europea
+• **Hands-Free Shopping**: Deje sus compras en custodia y recójalas al final de su visita
+• **Personal Shopping**: Asesoramiento de imagen y acompañamiento personalizado por las boutiques
 
-Ejemplo 4:
+Le recomendamos reservar con antelación el servicio de Personal Shopping para garantizar su disponibilidad.
+"""
+
+EJEMPLO_DESPEDIDA = """
 Pregunta: Muchas gracias por tu ayuda, hasta luego.
 Respuesta: Ha sido un placer atenderle. Le agradecemos su interés en La Roca Village y esperamos darle la bienvenida muy pronto para que disfrute de una experiencia de compra excepcional. Que tenga un excelente día.
+"""
 
-Ejemplo 5:
+EJEMPLO_SALUDO = """
 Pregunta: hola
 Respuesta: Bienvenido a La Roca Village. ¿En qué puedo ayudarle hoy? Estamos a su disposición para cualquier consulta sobre nuestras boutiques exclusivas, servicios premium o información práctica para su visita.
 """
 
+# Ejemplos incluidos en cada variante del prompt (según la intención de la consulta)
+EJEMPLOS_POR_VARIANTE = {
+    "general": [EJEMPLO_MARCAS, EJEMPLO_HORARIOS, EJEMPLO_RESTAURANTES, EJEMPLO_DESPEDIDA, EJEMPLO_SALUDO],
+    "brands": [EJEMPLO_MARCAS],
+    "hours": [EJEMPLO_HORARIOS],
+    "restaurants": [EJEMPLO_RESTAURANTES],
+    "services": [EJEMPLO_SERVICIOS],
+}
+
+def _format_examples(examples) -> str:
+    """Numera los ejemplos con el formato que espera el prompt"""
+    return "\n" + "\n\n".join(f"Ejemplo {i}:\n{example.strip()}" for i, example in enumerate(examples, start=1)) + "\n"
+
+EJEMPLOS_RESPUESTAS = _format_examples(EJEMPLOS_POR_VARIANTE["general"])
+
 # Template de prompt mejorado
 PROMPT_TEMPLATE = """
 {context}
@@ -111,8 +142,20 @@ Pregunta del usuario: {question}
 IMPORTANTE: Todas las instrucciones anteriores son obligatorias y deben seguirse sin excepción. Las respuestas deben ser concisas (máximo 300 palabras) y basarse en el contexto proporcionado.
 """
 
-def get_rag_prompt() -> PromptTemplate:
-    """Obtiene el prompt template para el servicio RAG"""
+# Huella del contenido del prompt (plantilla, instrucciones y ejemplos)
+PROMPT_VERSION = hashlib.sha1("\n".join([
+    PROMPT_TEMPLATE,
+    LA_ROCA_CONTEXT,
+    FORMATO_INSTRUCCIONES,
+    TONO_INSTRUCCIONES,
+    CONTENIDO_INSTRUCCIONES,
+    RESTRICCIONES,
+    *(_format_examples(examples) for examples in EJEMPLOS_POR_VARIANTE.values()),
+]).encode("utf-8")).hexdigest()[:12]
+
+def get_rag_prompt(variant: str = "general") -> PromptTemplate:
+    """Obtiene el prompt template para el servicio RAG en la variante indicada"""
+    examples = EJEMPLOS_POR_VARIANTE.get(variant, EJEMPLOS_POR_VARIANTE["general"])
     return PromptTemplate(
         template=PROMPT_TEMPLATE,
         input_variables=["context", "question"],
@@ -122,6 +165,42 @@ def get_rag_prompt() -> PromptTemplate:
             "tono_instrucciones": TONO_INSTRUCCIONES,
             "contenido_instrucciones": CONTENIDO_INSTRUCCIONES,
             "restricciones": RESTRICCIONES,
-            "ejemplos_respuestas": EJEMPLOS_RESPUESTAS
+            "ejemplos_respuestas": _format_examples(examples)
         }
-    )
\ No newline at end of file
+    )
+
+# Reescritura de preguntas de seguimiento como preguntas autónomas
+REWRITE_TEMPLATE = """
+A continuación tiene una conversación entre un visitante y el asistente de La Roca Village, y una nueva pregunta del visitante.
+Reescriba la nueva pregunta para que se entienda sin la conversación: sustituya pronombres y referencias ("allí", "ese", "y el domingo") por lo que designan.
+Conserve el idioma de la pregunta. No la responda. Si ya se entiende por sí sola, devuélvala sin cambios.
+Devuelva solo la pregunta reescrita, en una línea.
+
+Conversación:
+{history}
+
+Nueva pregunta: {question}
+
+Pregunta reescrita:"""
+
+# Resumen acumulado de los turnos antiguos de una conversación
+SUMMARY_TEMPLATE = """
+Actualice el resumen de una conversación entre un visitante y el asistente de La Roca Village incorporando los turnos nuevos.
+Conserve los datos que el visitante podría retomar (tiendas, restaurantes, servicios, fechas, horarios, preferencias) y omita las fórmulas de cortesía.
+Escriba como máximo {max_words} palabras, en el idioma de la conversación.
+
+Resumen actual:
+{summary}
+
+Turnos nuevos:
+{turns}
+
+Resumen actualizado:"""
+
+def get_rewrite_prompt() -> PromptTemplate:
+    """Obtiene el prompt que convierte una pregunta de seguimiento en una pregunta autónoma"""
+    return PromptTemplate(template=REWRITE_TEMPLATE, input_variables=["history", "question"])
+
+def get_summary_prompt() -> PromptTemplate:
+    """Obtiene el prompt que incorpora turnos antiguos al resumen de la conversación"""
+    return PromptTemplate(template=SUMMARY_TEMPLATE, input_variables=["summary", "turns", "max_words"])
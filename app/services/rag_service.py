@@ -1,15 +1,73 @@
+import asyncio
 import logging
 import re
-from typing import List, Dict, Any
-from langchain.chains import RetrievalQA
-from langchain.chat_models import ChatOpenAI
-from langchain.vectorstores import Qdrant
+import time
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
+from langchain.schema import Document
+from langchain.vectorstores.base import VectorStore
 
+from app.core.concurrency import run_blocking
 from app.core.config import settings
-from app.services.prompt_service import get_rag_prompt
+from app.db.vector_store import get_index_version
+from app.services.answer_cache import get_answer_cache, normalize_query
+from app.core import metrics
+from app.core.single_flight import Flight, SingleFlight
+from app.core.tracing import record_tokens, stage, without_trace
+from app.services.chain_registry import get_llm_chain, get_prompt
+from app.services.context_packer import PackedContext, get_token_counter, pack_context
+from app.services.embeddings import get_embeddings
+from app.services.faq_store import get_faq_store
+from app.services.intent_router import RouteDecision, classify, record_full_path, route_query
+from app.services.llm_gateway import LLMOverloadedError, get_llm_gateway
+from app.services.prompt_service import PROMPT_VERSION
+from app.services.retrieval import category_boost, get_retriever, retrieve_batch
+from app.services.streaming import IncrementalFormatter, TokenQueueHandler
 
 logger = logging.getLogger("rag-app")
 
+PROMPT_TOKENS = metrics.counter(
+    "rag_prompt_tokens_total",
+    "Tokens de prompt por petición: sin empaquetar el contexto (before) y enviados al LLM (after)",
+    ["stage"]
+)
+CONTEXT_CHUNKS = metrics.counter(
+    "rag_context_chunks_total",
+    "Fragmentos de contexto recuperados (before) y enviados al LLM tras fusionar y deduplicar (after)",
+    ["stage"]
+)
+CONTEXT_REQUESTS = metrics.counter("rag_context_requests_total", "Peticiones con contexto ensamblado")
+COALESCED_REQUESTS = metrics.counter(
+    "rag_coalesced_requests_total",
+    "Peticiones RAG que lanzan una generación (leader) o se unen a una idéntica en curso (follower)",
+    ["role"]
+)
+
+ANSWER_CACHE_REQUESTS = metrics.counter(
+    "rag_answer_cache_requests_total",
+    "Consultas buscadas en la caché de respuestas: exact_hit, semantic_hit o miss",
+    ["result"]
+)
+FAQ_REQUESTS = metrics.counter(
+    "rag_faq_requests_total",
+    "Consultas buscadas en el almacén de preguntas frecuentes: exact_hit, semantic_hit o miss "
+    "(proporción del tráfico: aciertos / rag_intent_routes_total)",
+    ["result"]
+)
+CANONICAL_PROMPT_TOKENS = metrics.counter(
+    "rag_canonical_prompt_tokens_total",
+    "Tokens de prompt de las respuestas de referencia generadas en segundo plano, por carril del gateway",
+    ["lane"]
+)
+REQUEST_TOKENS = metrics.histogram(
+    "rag_request_tokens",
+    "Tokens por generación: prompt enviado al LLM y respuesta",
+    ["kind"],
+    buckets=(50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+)
+
+# Generaciones en curso, compartidas entre /chat y /chat/stream
+_in_flight = SingleFlight()
+
 def clean_response(text: str) -> str:
     """Limpia la respuesta y asegura formato correcto para viñetas"""
     # Primero, normaliza todos los saltos de línea
@@ -24,57 +82,328 @@ def clean_response(text: str) -> str:
     
     return text.strip()
 
-async def get_rag_answer(query: str, vector_store: Qdrant) -> str:
+async def _lookup_cached_answer(query: str) -> Tuple[Optional[str], Optional[List[float]]]:
+    """Busca la consulta en la caché de respuestas; devuelve la respuesta y el embedding calculado"""
+    if not settings.ANSWER_CACHE_ENABLED:
+        return None, None
+    
+    cache = get_answer_cache()
+    version = get_index_version()
+    
+    with stage("answer_cache"):
+        answer = cache.get_exact(query, version)
+        if answer is not None:
+            logger.info("Respuesta obtenida de la caché (coincidencia exacta)")
+            ANSWER_CACHE_REQUESTS.inc(result="exact_hit")
+            return answer, None
+        
+        embedding = await run_blocking(get_embeddings().embed_query, query)
+        answer = cache.get_semantic(embedding, version)
+    ANSWER_CACHE_REQUESTS.inc(result="semantic_hit" if answer is not None else "miss")
+    return answer, embedding
+
+async def _lookup_faq_answer(query: str, embedding: Optional[List[float]]) -> Tuple[Optional[str], Optional[List[float]]]:
+    """Busca la consulta en el almacén de preguntas frecuentes; devuelve la respuesta y el embedding (calculado si hizo falta)"""
+    if not settings.FAQ_STORE_ENABLED:
+        return None, embedding
+
+    store = get_faq_store()
+    with stage("faq_store"):
+        await store.ensure_current()
+        if not len(store):
+            return None, embedding
+        answer = store.get_exact(query)
+        if answer is not None:
+            FAQ_REQUESTS.inc(result="exact_hit")
+            return answer, embedding
+        if embedding is None:
+            embedding = await run_blocking(get_embeddings().embed_query, query)
+        answer = store.get_semantic(embedding)
+    FAQ_REQUESTS.inc(result="semantic_hit" if answer is not None else "miss")
+    return answer, embedding
+
+def _store_answer(query: str, embedding: Optional[List[float]], answer: str) -> None:
+    """Guarda una respuesta generada en la caché de respuestas"""
+    if settings.ANSWER_CACHE_ENABLED and answer:
+        get_answer_cache().put(query, embedding, answer, get_index_version())
+
+def _fixed_prompt_tokens(query: str, variant: str = "general") -> int:
+    """Tokens del prompt sin contexto: instrucciones, ejemplos y pregunta"""
+    return get_token_counter().count(get_prompt(variant).format(context="", question=query))
+
+def _retrieve_context(
+    query: str,
+    vector_store: VectorStore,
+    route: RouteDecision,
+    documents: Optional[List[Document]] = None
+) -> Tuple[PackedContext, int, int]:
+    """
+    Recupera (si no se reciben ya recuperados) y empaqueta los fragmentos; devuelve
+    el contexto y los tokens del prompt antes y después de empaquetarlo
+    """
+    if documents is None:
+        documents = get_retriever(vector_store, "chat", route.k, boost=category_boost(route.intent)).get_relevant_documents(query)
+    with stage("pack_context"):
+        packed = pack_context(documents)
+
+    with stage("prompt_render"):
+        fixed_tokens = _fixed_prompt_tokens(query, route.prompt_variant)
+    return packed, fixed_tokens + packed.tokens_before, fixed_tokens + packed.tokens_after
+
+def _record_prompt_usage(packed: PackedContext, tokens_before: int, tokens_after: int) -> None:
+    """Contabiliza el prompt de una petición de usuario en las métricas y en su traza"""
+    PROMPT_TOKENS.inc(tokens_before, stage="before")
+    PROMPT_TOKENS.inc(tokens_after, stage="after")
+    REQUEST_TOKENS.observe(tokens_after, kind="prompt")
+    record_tokens("prompt", tokens_after)
+    CONTEXT_CHUNKS.inc(packed.chunks_before, stage="before")
+    CONTEXT_CHUNKS.inc(len(packed.documents), stage="after")
+    CONTEXT_REQUESTS.inc()
+    logger.info(
+        f"Tokens de prompt: {tokens_before} -> {tokens_after} "
+        f"(contexto {packed.tokens_before} -> {packed.tokens_after} tokens, "
+        f"{packed.chunks_before} -> {len(packed.documents)} fragmentos)"
+    )
+
+def _coalescing_key(query: str, route: RouteDecision) -> Optional[Tuple[Any, ...]]:
+    """Clave de las consultas que producen la misma respuesta: consulta normalizada, prompt, modelo e índice"""
+    if not settings.REQUEST_COALESCING_ENABLED:
+        return None
+    return (
+        normalize_query(query),
+        route.prompt_variant,
+        route.k,
+        PROMPT_VERSION,
+        settings.OPENAI_LLM_MODEL,
+        get_index_version()
+    )
+
+async def _generate_answer(
+    query: str,
+    vector_store: VectorStore,
+    route: RouteDecision,
+    lane: str,
+    flight: Flight,
+    documents: Optional[List[Document]] = None
+) -> str:
+    """Cálculo compartido: caché, recuperación y generación; publica los tokens del LLM en `flight`"""
+    start = time.perf_counter()
+    
+    # Consultar primero la caché de respuestas
+    cached_answer, embedding = await _lookup_cached_answer(query)
+    if cached_answer is not None:
+        return cached_answer
+    
+    # Preguntas frecuentes con respuesta precalculada
+    faq_answer, embedding = await _lookup_faq_answer(query, embedding)
+    if faq_answer is not None:
+        return faq_answer
+    
+    # Recuperar y empaquetar el contexto; después, generar con la cadena de la intención
+    context, tokens_before, prompt_tokens = await run_blocking(_retrieve_context, query, vector_store, route, documents)
+    _record_prompt_usage(context, tokens_before, prompt_tokens)
+    
+    # La cadena se ejecuta en un hilo cuando el gateway da turno y difunde cada token
+    # a todas las peticiones unidas; solo se reintenta si aún no se emitió ningún token
+    llm_chain = get_llm_chain(streaming=True, variant=route.prompt_variant)
+    response = await get_llm_gateway().call(
+        llm_chain.run,
+        tokens=prompt_tokens + settings.LLM_COMPLETION_TOKENS_ESTIMATE,
+        lane=lane,
+        can_retry=lambda: flight.chunks_published == 0,
+        context=context.text,
+        question=query,
+        callbacks=[TokenQueueHandler(asyncio.get_running_loop(), flight)]
+    )
+    
+    completion_tokens = get_token_counter().count(response)
+    REQUEST_TOKENS.observe(completion_tokens, kind="completion")
+    record_tokens("completion", completion_tokens)
+    
+    # Limpiar y formatear la respuesta
+    with stage("clean_response"):
+        cleaned_response = clean_response(response)
+    _store_answer(query, embedding, cleaned_response)
+    record_full_path(time.perf_counter() - start)
+    
+    return cleaned_response
+
+async def generate_canonical_answer(query: str, vector_store: VectorStore, lane: str = "faq") -> Tuple[str, List[Document]]:
+    """
+    Respuesta de referencia por el camino RAG, sin cachés ni coalescencia; devuelve
+    también los fragmentos recuperados. Sus tokens se cuentan aparte, por carril, y
+    no en las métricas de usuarios ni en la traza de la petición que la lanzó.
+    """
+    # classify no cuenta la pregunta como tráfico de usuarios
+    route = classify(query)
+    if route.reply is not None:
+        return route.reply, []
+    with without_trace():
+        retriever = get_retriever(vector_store, "chat", route.k, boost=category_boost(route.intent))
+        documents = await run_blocking(retriever.get_relevant_documents, query)
+        context, _, prompt_tokens = await run_blocking(_retrieve_context, query, vector_store, route, documents)
+        CANONICAL_PROMPT_TOKENS.inc(prompt_tokens, lane=lane)
+        response = await get_llm_gateway().call(
+            get_llm_chain(streaming=False, variant=route.prompt_variant).run,
+            tokens=prompt_tokens + settings.LLM_COMPLETION_TOKENS_ESTIMATE,
+            lane=lane,
+            context=context.text,
+            question=query
+        )
+    return clean_response(response), documents
+
+def _join_answer(
+    query: str,
+    vector_store: VectorStore,
+    route: RouteDecision,
+    lane: str,
+    documents: Optional[List[Document]] = None
+) -> Flight:
+    """Se une a la generación en curso de la misma consulta o lanza una nueva en el carril indicado"""
+    flight, leader = _in_flight.join(
+        _coalescing_key(query, route),
+        lambda flight: _generate_answer(query, vector_store, route, lane, flight, documents)
+    )
+    COALESCED_REQUESTS.inc(role="leader" if leader else "follower")
+    if not leader:
+        logger.info(f"Consulta unida a una generación en curso ({flight.followers} peticiones en espera)")
+    return flight
+
+async def get_rag_answer(query: str, vector_store: VectorStore, lane: str = "chat") -> str:
     """Obtiene una respuesta usando RAG (Retrieval-Augmented Generation)"""
     try:
-        # Crear plantilla personalizada
-        prompt = get_rag_prompt()
+        # Saludos, agradecimientos y despedidas se responden sin RAG
+        route = route_query(query)
+        if route.reply is not None:
+            return route.reply
         
-        # Crear LLM
-        llm = ChatOpenAI(
-            model_name=settings.OPENAI_LLM_MODEL,
-            openai_api_key=settings.OPENAI_API_KEY
-        )
+        # Las consultas idénticas concurrentes comparten una sola generación
+        return await _join_answer(query, vector_store, route, lane).result()
+    
+    except LLMOverloadedError:
+        raise
+    except Exception as e:
+        logger.error(f"Error obteniendo respuesta RAG: {e}", exc_info=True)
+        raise
+
+async def stream_rag_answer(query: str, vector_store: VectorStore, lane: str = "stream") -> AsyncIterator[str]:
+    """Obtiene una respuesta RAG como flujo de fragmentos de texto ya formateados"""
+    start = time.perf_counter()
+    formatter = IncrementalFormatter(clean_response)
+    first_token_time = None
+    
+    try:
+        # Saludos, agradecimientos y despedidas se responden sin RAG
+        route = route_query(query)
+        if route.reply is not None:
+            yield route.reply
+            return
         
-        # Crear cadena de recuperación con prompt personalizado
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=llm,
-            chain_type="stuff",
-            retriever=vector_store.as_retriever(search_kwargs={"k": 8}),
-            chain_type_kwargs={"prompt": prompt}
-        )
+        # Los tokens llegan desde la generación compartida, incluidos los ya emitidos antes de unirse
+        flight = _join_answer(query, vector_store, route, lane)
+        async for token in flight.stream():
+            if first_token_time is None:
+                first_token_time = time.perf_counter() - start
+                logger.info(f"Tiempo hasta el primer token: {first_token_time * 1000:.0f} ms")
+            
+            text = formatter.feed(token)
+            if text:
+                yield text
         
-        # Obtener respuesta
-        response = qa_chain.run(query)
+        # Propagar errores de la generación
+        answer = await flight.result()
         
-        # Limpiar y formatear la respuesta
-        cleaned_response = clean_response(response)
+        if first_token_time is None:
+            # Respuesta de la caché: no hay tokens
+            yield answer
+            return
         
-        return cleaned_response
+        text = formatter.flush()
+        if text:
+            yield text
+        
+        logger.info(f"Respuesta en streaming completada en {(time.perf_counter() - start) * 1000:.0f} ms")
     
+    except LLMOverloadedError:
+        raise
     except Exception as e:
-        logger.error(f"Error obteniendo respuesta RAG: {e}", exc_info=True)
+        logger.error(f"Error obteniendo respuesta RAG en streaming: {e}", exc_info=True)
         raise
 
-async def get_relevant_documents(query: str, vector_store: Qdrant) -> List[Dict[str, Any]]:
+def _document_info(docs: List[Document]) -> List[Dict[str, Any]]:
+    """Resumen de los documentos recuperados para la respuesta de diagnóstico"""
+    return [
+        {
+            "rank": i+1,
+            "source": doc.metadata.get("source", "Desconocida"),
+            "page": doc.metadata.get("page", "N/A"),
+            "content_preview": doc.page_content[:200] + "...",
+            "content_length": len(doc.page_content)
+        }
+        for i, doc in enumerate(docs)
+    ]
+
+async def get_relevant_documents(query: str, vector_store: VectorStore) -> List[Dict[str, Any]]:
     """Obtiene documentos relevantes para una consulta (para diagnóstico)"""
     try:
-        # Recuperar documentos relevantes
-        docs = vector_store.similarity_search(query, k=3)
+        # Recuperar documentos relevantes con la misma combinación vectorial + léxica que /chat
+        retriever = get_retriever(vector_store, "diagnose", settings.DIAGNOSE_RETRIEVAL_K)
+        docs = await run_blocking(retriever.get_relevant_documents, query)
         
         # Preparar respuesta de diagnóstico
-        results = []
-        for i, doc in enumerate(docs):
-            results.append({
-                "rank": i+1,
-                "source": doc.metadata.get("source", "Desconocida"),
-                "page": doc.metadata.get("page", "N/A"),
-                "content_preview": doc.page_content[:200] + "...",
-                "content_length": len(doc.page_content)
-            })
-        
-        return results
+        return _document_info(docs)
     
     except Exception as e:
         logger.error(f"Error obteniendo documentos relevantes: {e}", exc_info=True)
-        raise
\ No newline at end of file
+        raise
+
+async def get_relevant_documents_batch(queries: List[str], vector_store: VectorStore) -> List[List[Dict[str, Any]]]:
+    """Documentos relevantes de varias consultas con un solo cálculo de embeddings y una búsqueda por lotes"""
+    retriever = get_retriever(vector_store, "diagnose", settings.DIAGNOSE_RETRIEVAL_K)
+    results = await run_blocking(retrieve_batch, [retriever] * len(queries), queries)
+    return [_document_info(docs) for docs in results]
+
+async def get_rag_answers_batch(queries: List[str], vector_store: VectorStore) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Responde varias consultas; produce {"index", "response"} o {"index", "error"} a medida que terminan.
+
+    Los embeddings y la búsqueda vectorial se calculan para todo el lote de una vez;
+    las generaciones van por el carril "batch" del gateway, con como mucho
+    BATCH_LLM_CONCURRENCY a la vez, y se coalescen con las consultas idénticas en curso.
+    """
+    routes = [route_query(query) for query in queries]
+    pending = [i for i, route in enumerate(routes) if route.reply is None]
+    for i, route in enumerate(routes):
+        if route.reply is not None:
+            yield {"index": i, "response": route.reply}
+
+    retrievers = [get_retriever(vector_store, "chat", routes[i].k, boost=category_boost(routes[i].intent)) for i in pending]
+    try:
+        documents = await run_blocking(retrieve_batch, retrievers, [queries[i] for i in pending])
+    except Exception as e:
+        logger.error(f"Error recuperando documentos del lote: {e}", exc_info=True)
+        for i in pending:
+            yield {"index": i, "error": f"Error procesando solicitud: {str(e)}"}
+        return
+
+    semaphore = asyncio.Semaphore(max(1, settings.BATCH_LLM_CONCURRENCY))
+
+    async def answer(i: int, docs: List[Document]) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                response = await _join_answer(queries[i], vector_store, routes[i], "batch", docs).result()
+                return {"index": i, "response": response}
+            except LLMOverloadedError as e:
+                return {"index": i, "error": str(e), "retry_after": e.retry_after}
+            except Exception as e:
+                logger.error(f"Error obteniendo respuesta RAG del lote: {e}", exc_info=True)
+                return {"index": i, "error": f"Error procesando solicitud: {str(e)}"}
+
+    tasks = [asyncio.ensure_future(answer(i, docs)) for i, docs in zip(pending, documents)]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        # Cliente desconectado: no lanzar las generaciones que aún esperan turno
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,214 @@
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain.callbacks.manager import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain.schema import BaseRetriever, Document
+from langchain.vectorstores.base import VectorStore
+
+from app.core import metrics
+from app.core.concurrency import run_blocking
+from app.core.config import settings
+from app.core.tracing import stage
+from app.services.embeddings import get_embeddings
+from app.db.aliases import resolve_collection
+from app.db.backends import search_batch, search_options
+from app.db.lexical_index import BM25Index, lexical_index_path
+from app.db.local_index import metadata_matches
+
+logger = logging.getLogger("rag-app")
+
+CATEGORY_BOOSTS = metrics.counter(
+    "rag_category_boosted_retrievals_total",
+    "Recuperaciones que favorecen las categorías de la intención, según la categoría del primer resultado",
+    ["top"]
+)
+
+# Índice léxico cargado por alias, con su fichero y fecha de modificación
+_lexical_indexes: Dict[str, Tuple[str, float, BM25Index]] = {}
+_lexical_lock = threading.Lock()
+# Recuperadores construidos para el almacén vectorial actual, indexados por colección y configuración
+_retrievers: Dict[Tuple[str, str], "HybridRetriever"] = {}
+_retrievers_lock = threading.Lock()
+
+def get_lexical_index(collection_name: Optional[str] = None) -> Optional[BM25Index]:
+    """Índice BM25 de la colección; se recarga si el indexador lo ha reconstruido o cambia el alias"""
+    if not settings.LEXICAL_INDEX_ENABLED:
+        return None
+    alias = collection_name or settings.VECTOR_DB_COLLECTION
+    path = lexical_index_path(resolve_collection(alias))
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
+
+    cached = _lexical_indexes.get(alias)
+    if cached and cached[:2] == (path, mtime):
+        return cached[2]
+
+    with _lexical_lock:
+        cached = _lexical_indexes.get(alias)
+        if not cached or cached[:2] != (path, mtime):
+            index = BM25Index.load(path)
+            logger.info(f"Índice léxico '{os.path.basename(path)}' cargado ({len(index)} fragmentos)")
+            # Sustituye al de la versión anterior del alias
+            cached = _lexical_indexes[alias] = (path, mtime, index)
+    return cached[2]
+
+def retrieval_weights(endpoint: str) -> Tuple[float, float]:
+    """Pesos (vectorial, léxico) de la fusión para un endpoint ("chat", "diagnose")"""
+    prefix = endpoint.upper()
+    return getattr(settings, f"{prefix}_VECTOR_WEIGHT", 1.0), getattr(settings, f"{prefix}_LEXICAL_WEIGHT", 1.0)
+
+def _document_key(doc: Document) -> Tuple[Any, ...]:
+    return (doc.metadata.get("source"), doc.metadata.get("page"), doc.page_content)
+
+def reciprocal_rank_fusion(rankings: List[Tuple[float, List[Document]]], k: int, rrf_k: int = 60) -> List[Document]:
+    """Fusiona listas ordenadas: cada documento suma peso / (rrf_k + posición) en cada lista"""
+    scores: Dict[Tuple[Any, ...], float] = {}
+    documents: Dict[Tuple[Any, ...], Document] = {}
+    for weight, docs in rankings:
+        for rank, doc in enumerate(docs, start=1):
+            key = _document_key(doc)
+            documents.setdefault(key, doc)
+            scores[key] = scores.get(key, 0.0) + weight / (rrf_k + rank)
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [documents[key] for key in ranked[:k]]
+
+class HybridRetriever(BaseRetriever):
+    """
+    Recuperador que combina búsqueda vectorial y BM25 mediante fusión por rango recíproco.
+
+    `filter` restringe ambas búsquedas a los metadatos indicados. `boost` solo
+    favorece a los candidatos que cumplen sus metadatos: se añaden a la fusión
+    como una lista más, con peso `boost_weight`, y un documento de otra categoría
+    muy relevante (el horario de un restaurante en el directorio) sigue entrando.
+    """
+
+    vector_store: VectorStore
+    collection_name: str
+    k: int = 4
+    vector_weight: float = 1.0
+    lexical_weight: float = 1.0
+    candidates: int = 20
+    rrf_k: int = 60
+    filter: Optional[Dict[str, Any]] = None
+    boost: Optional[Dict[str, Any]] = None
+    boost_weight: float = 0.5
+
+    def _candidates(self, lexical_index: Optional[BM25Index]) -> int:
+        """Resultados de cada búsqueda que entran en la fusión"""
+        if lexical_index is None and not self.boost:
+            return self.k
+        return max(self.candidates, self.k)
+
+    def vector_candidates(self) -> int:
+        """Resultados de la búsqueda vectorial que necesita la consulta (0 si no la usa)"""
+        lexical_index = get_lexical_index(self.collection_name) if self.lexical_weight > 0 else None
+        if lexical_index is not None and self.vector_weight <= 0:
+            return 0
+        return self._candidates(lexical_index)
+
+    def combine(self, query: str, vector_docs: List[Document]) -> List[Document]:
+        """Combina los resultados vectoriales ya obtenidos con la búsqueda léxica y las categorías favorecidas"""
+        lexical_index = get_lexical_index(self.collection_name) if self.lexical_weight > 0 else None
+        candidates = self._candidates(lexical_index)
+        rankings: List[Tuple[float, List[Document]]] = []
+        if lexical_index is None:
+            rankings.append((1.0, vector_docs[:candidates]))
+        else:
+            if self.vector_weight > 0:
+                rankings.append((self.vector_weight, vector_docs[:candidates]))
+            with stage("lexical_search"):
+                rankings.append((self.lexical_weight, [doc for doc, _ in lexical_index.search(query, k=candidates, filter=self.filter)]))
+        if len(rankings) == 1 and not self.boost:
+            return rankings[0][1][:self.k]
+
+        with stage("fusion"):
+            if self.boost:
+                # Candidatos de las categorías favorecidas, en el orden de la fusión sin favorecer
+                fused = reciprocal_rank_fusion(rankings, k=2 * candidates, rrf_k=self.rrf_k)
+                rankings.append((self.boost_weight, [doc for doc in fused if metadata_matches(doc.metadata, self.boost)]))
+            docs = reciprocal_rank_fusion(rankings, k=self.k, rrf_k=self.rrf_k)
+        if self.boost and docs:
+            CATEGORY_BOOSTS.inc(top="in_category" if metadata_matches(docs[0].metadata, self.boost) else "other")
+        return docs
+
+    def _search(self, query: str) -> List[Document]:
+        vector_docs = []
+        limit = self.vector_candidates()
+        if limit:
+            with stage("vector_search"):
+                vector_docs = self.vector_store.similarity_search(query, k=limit, **search_options(self.vector_store, self.filter))
+        return self.combine(query, vector_docs)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self._search(query)
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        return await run_blocking(self._get_relevant_documents, query, run_manager=run_manager.get_sync())
+
+def category_boost(intent: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Metadatos de las categorías de documentos que favorece una intención; None si no tiene"""
+    if not settings.CATEGORY_BOOST_ENABLED or not intent:
+        return None
+    categories = settings.INTENT_CATEGORIES.get(intent)
+    return {"category": list(categories)} if categories else None
+
+def get_retriever(
+    vector_store: VectorStore,
+    endpoint: str = "chat",
+    k: Optional[int] = None,
+    filter: Optional[Dict[str, Any]] = None,
+    boost: Optional[Dict[str, Any]] = None
+) -> HybridRetriever:
+    """Recuperador híbrido con los pesos configurados para el endpoint, construido una sola vez"""
+    vector_weight, lexical_weight = retrieval_weights(endpoint)
+    options = {
+        "collection_name": settings.VECTOR_DB_COLLECTION,
+        "k": k or settings.RAG_RETRIEVAL_K,
+        "vector_weight": vector_weight,
+        "lexical_weight": lexical_weight,
+        "candidates": settings.HYBRID_CANDIDATES,
+        "rrf_k": settings.HYBRID_RRF_K,
+        "filter": filter,
+        "boost": boost,
+        "boost_weight": settings.CATEGORY_BOOST_WEIGHT,
+    }
+    # Filtro y categorías favorecidas (listas) no son hashables: la clave usa las opciones serializadas
+    collection = getattr(vector_store, "collection_name", "")
+    key = (collection, json.dumps(options, sort_keys=True))
+    retriever = _retrievers.get(key)
+    if retriever is None or retriever.vector_store is not vector_store:
+        with _retrievers_lock:
+            # Tras una reindexación se descartan los recuperadores de la colección anterior,
+            # que mantendrían vivo su almacén vectorial
+            for stale_key, stale in list(_retrievers.items()):
+                if stale_key[0] != collection or stale.vector_store is not vector_store:
+                    del _retrievers[stale_key]
+            retriever = _retrievers[key] = HybridRetriever(vector_store=vector_store, **options)
+    return retriever
+
+def retrieve_batch(retrievers: List[HybridRetriever], queries: List[str]) -> List[List[Document]]:
+    """
+    Recupera varias consultas a la vez: un solo cálculo de embeddings y una sola
+    búsqueda vectorial por lotes; la parte léxica y la fusión se hacen por consulta.
+    Todos los recuperadores deben compartir el almacén vectorial.
+    """
+    if not queries:
+        return []
+    limits = [retriever.vector_candidates() for retriever in retrievers]
+    vector_results: List[List[Document]] = [[] for _ in queries]
+    if any(limits):
+        with stage("embedding"):
+            vectors = get_embeddings().embed_documents(queries)
+        with stage("vector_search"):
+            vector_results = search_batch(
+                retrievers[0].vector_store,
+                vectors,
+                limits,
+                [retriever.filter for retriever in retrievers]
+            )
+    return [retriever.combine(query, docs) for retriever, query, docs in zip(retrievers, queries, vector_results)]
@@ -0,0 +1,211 @@
+"""
+Almacén de sesiones de conversación.
+
+Cada sesión guarda un resumen acumulado de los turnos antiguos y los turnos
+recientes literalmente (app.services.conversation decide cuándo resumir). El
+backend se elige con SESSION_BACKEND:
+- "memory": en el proceso, LRU con caducidad por inactividad (SESSION_TTL_SECONDS,
+  SESSION_MAX_ENTRIES); con varios workers de uvicorn, cada uno tiene las suyas.
+- "sqlite": fichero SESSION_STORE_PATH compartido entre workers y reinicios.
+
+Cualquier clase con get/put/update/delete/stats sirve como backend
+(set_session_store); update hace la lectura, modificación y escritura de una
+sesión de forma atómica, para que los turnos concurrentes no se pisen.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from app.core import metrics
+from app.core.config import settings
+
+logger = logging.getLogger("rag-app")
+
+SESSIONS = metrics.gauge("rag_sessions", "Sesiones de conversación guardadas en el proceso")
+SESSION_EVICTIONS = metrics.counter(
+    "rag_session_evictions_total",
+    "Sesiones descartadas por caducidad (expired) o por falta de espacio (lru)",
+    ["reason"]
+)
+
+@dataclass
+class Turn:
+    """Pregunta del usuario, pregunta autónoma usada para recuperar y respuesta"""
+    query: str
+    standalone_query: str
+    answer: str
+    usage: Dict[str, int] = field(default_factory=dict)
+
+@dataclass
+class Session:
+    session_id: str
+    summary: str = ""
+    turns: List[Turn] = field(default_factory=list)
+    summarized_turns: int = 0  # Turnos ya incorporados al resumen
+    updated_at: float = field(default_factory=time.time)
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, data: str) -> "Session":
+        values = json.loads(data)
+        values["turns"] = [Turn(**turn) for turn in values.get("turns", [])]
+        return cls(**values)
+
+class InMemorySessionBackend:
+    """Sesiones en memoria del proceso, con caducidad y descarte LRU"""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, session_id: str) -> Optional[Session]:
+        """Sesión vigente (llamar con el lock adquirido)"""
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        if session.updated_at + self.ttl_seconds <= time.time():
+            del self._sessions[session_id]
+            SESSION_EVICTIONS.inc(reason="expired")
+            SESSIONS.set(len(self._sessions))
+            return None
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def _put(self, session: Session) -> None:
+        """Guarda la sesión (llamar con el lock adquirido)"""
+        session.updated_at = time.time()
+        self._sessions[session.session_id] = session
+        self._sessions.move_to_end(session.session_id)
+        while len(self._sessions) > self.max_entries:
+            self._sessions.popitem(last=False)
+            SESSION_EVICTIONS.inc(reason="lru")
+        SESSIONS.set(len(self._sessions))
+
+    def get(self, session_id: str) -> Optional[Session]:
+        with self._lock:
+            return self._get(session_id)
+
+    def put(self, session: Session) -> None:
+        with self._lock:
+            self._put(session)
+
+    def update(self, session_id: str, change: Callable[[Optional[Session]], Optional[Session]]) -> Optional[Session]:
+        """Aplica `change` a la sesión actual y guarda su resultado (None: sin cambios) en una sola operación"""
+        with self._lock:
+            session = change(self._get(session_id))
+            if session is not None:
+                self._put(session)
+            return session
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            found = self._sessions.pop(session_id, None) is not None
+            SESSIONS.set(len(self._sessions))
+            return found
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"backend": "memory", "sessions": len(self._sessions)}
+
+class SqliteSessionBackend:
+    """Sesiones en SQLite compartidas entre procesos de uvicorn; caducan por inactividad"""
+
+    def __init__(self, path: str, ttl_seconds: float):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        """Obtiene la conexión del hilo actual (sqlite3 no comparte conexiones entre hilos)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, session_id: str) -> Optional[Session]:
+        row = self._connection().execute(
+            "SELECT data FROM sessions WHERE id = ? AND updated_at > ?",
+            (session_id, time.time() - self.ttl_seconds)
+        ).fetchone()
+        return Session.from_json(row[0]) if row else None
+
+    def _write(self, conn: sqlite3.Connection, session: Session) -> None:
+        session.updated_at = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (id, data, updated_at) VALUES (?, ?, ?)",
+            (session.session_id, session.to_json(), session.updated_at)
+        )
+        # Las sesiones caducadas se borran al escribir, sin tarea periódica
+        expired = conn.execute("DELETE FROM sessions WHERE updated_at <= ?", (session.updated_at - self.ttl_seconds,)).rowcount
+        if expired:
+            SESSION_EVICTIONS.inc(expired, reason="expired")
+
+    def put(self, session: Session) -> None:
+        with self._connection() as conn:
+            self._write(conn, session)
+
+    def update(self, session_id: str, change: Callable[[Optional[Session]], Optional[Session]]) -> Optional[Session]:
+        """Aplica `change` a la sesión actual y guarda su resultado (None: sin cambios) en una sola transacción"""
+        with self._connection() as conn:
+            # Bloqueo de escritura desde la lectura: otros procesos esperan a que termine
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT data FROM sessions WHERE id = ? AND updated_at > ?",
+                (session_id, time.time() - self.ttl_seconds)
+            ).fetchone()
+            session = change(Session.from_json(row[0]) if row else None)
+            if session is not None:
+                self._write(conn, session)
+        return session
+
+    def delete(self, session_id: str) -> bool:
+        with self._connection() as conn:
+            return conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount > 0
+
+    def stats(self) -> Dict[str, Any]:
+        count = self._connection().execute(
+            "SELECT COUNT(*) FROM sessions WHERE updated_at > ?", (time.time() - self.ttl_seconds,)
+        ).fetchone()[0]
+        return {"backend": "sqlite", "sessions": count}
+
+# Singleton para el almacén de sesiones
+_session_store: Any = None
+
+def get_session_store() -> Any:
+    """Obtiene el almacén de sesiones configurado, inicializándolo si no existe"""
+    global _session_store
+
+    if _session_store is None:
+        if settings.SESSION_BACKEND == "sqlite":
+            logger.info(f"Sesiones de conversación en SQLite ({settings.SESSION_STORE_PATH})")
+            _session_store = SqliteSessionBackend(settings.SESSION_STORE_PATH, settings.SESSION_TTL_SECONDS)
+        else:
+            _session_store = InMemorySessionBackend(settings.SESSION_MAX_ENTRIES, settings.SESSION_TTL_SECONDS)
+
+    return _session_store
+
+def set_session_store(store: Any) -> None:
+    """Sustituye el backend de sesiones (p. ej. por uno compartido como Redis)"""
+    global _session_store
+    _session_store = store
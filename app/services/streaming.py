@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import re
+from typing import Any, Callable, List
+
+from langchain.callbacks.base import BaseCallbackHandler
+
+logger = logging.getLogger("rag-app")
+
+# Caracteres al final del texto que aún pueden cambiar de formato con los siguientes tokens
+_UNSTABLE_TAIL = " \t\r\n•"
+# Último carácter visible antes de una viñeta o un salto de línea: el formato a partir de ahí
+# no depende del texto anterior
+_SEGMENT_ANCHOR = re.compile(r"[^\s•](?=\s*•\s|[^\S\n]*\n\s*[^\s•])")
+
+class TokenQueueHandler(BaseCallbackHandler):
+    """Publica los tokens del LLM (generados en un hilo de trabajo) en una cola asyncio"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue):
+        self._loop = loop
+        self._queue = queue
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, token)
+
+class Replacement(str):
+    """Texto completo que sustituye a todo lo emitido hasta ahora en el flujo"""
+
+class IncrementalFormatter:
+    """
+    Aplica una función de limpieza de forma incremental sobre un flujo de tokens.
+
+    El texto se divide en segmentos que empiezan en cada viñeta o salto de línea:
+    el formato de un segmento no depende de los anteriores salvo por el carácter
+    visible que lo precede, que se incluye como ancla al limpiarlo. Cada token solo vuelve a limpiar
+    el segmento abierto, no toda la respuesta. Si al terminar el texto emitido no
+    coincide con la limpieza de la respuesta completa, flush devuelve una
+    Replacement con el texto final.
+    """
+
+    def __init__(self, clean: Callable[[str], str]):
+        self._clean = clean
+        self._raw = ""
+        self._stable_length = 0
+        # Inicio del segmento abierto en el texto original (su ancla, salvo en el primero)
+        self._segment_start = 0
+        # Texto limpio ya emitido del segmento abierto y de toda la respuesta
+        self._segment_emitted = ""
+        self._emitted: List[str] = []
+
+    def _clean_segment(self, text: str) -> str:
+        cleaned = self._clean(text)
+        # El ancla es un carácter visible que la limpieza conserva al principio
+        return cleaned if self._segment_start == 0 else cleaned[1:]
+
+    def _emit(self, cleaned: str) -> str:
+        """Devuelve la parte nueva del segmento limpio, si es continuación de lo ya emitido"""
+        if not cleaned.startswith(self._segment_emitted):
+            # No se puede retractar lo ya enviado; se espera a más texto
+            return ""
+        delta = cleaned[len(self._segment_emitted):]
+        self._segment_emitted = cleaned
+        if delta:
+            self._emitted.append(delta)
+        return delta
+
+    def feed(self, token: str) -> str:
+        """Añade un token y devuelve el texto formateado que ya es definitivo"""
+        scan_from = max(self._stable_length - 1, self._segment_start + 1)
+        self._raw += token
+
+        # Retener espacios y viñetas finales: su formato depende de lo que venga después
+        stable_length = len(self._raw.rstrip(_UNSTABLE_TAIL))
+        if stable_length <= self._stable_length:
+            return ""
+        self._stable_length = stable_length
+        stable = self._raw[:stable_length]
+
+        # Cerrar los segmentos terminados: el ancla es el último carácter del segmento y el primero del siguiente
+        text = ""
+        for match in _SEGMENT_ANCHOR.finditer(stable, scan_from):
+            anchor = match.start()
+            text += self._emit(self._clean_segment(stable[self._segment_start:anchor + 1]))
+            self._segment_start, self._segment_emitted = anchor, ""
+
+        return text + self._emit(self._clean_segment(stable[self._segment_start:]))
+
+    def flush(self) -> str:
+        """Devuelve el texto formateado pendiente al terminar el flujo"""
+        delta = self._emit(self._clean_segment(self._raw[self._segment_start:]))
+        cleaned = self._clean(self._raw)
+        if "".join(self._emitted) != cleaned:
+            logger.warning("El formato incremental difiere del formato final de la respuesta; se reenvía completa")
+            self._emitted = [cleaned]
+            return Replacement(cleaned)
+        return delta
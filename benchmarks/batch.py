@@ -0,0 +1,115 @@
+"""
+Rendimiento de los endpoints por lotes frente a peticiones individuales.
+
+Arranca la API simulada de benchmarks.load y, para /api/diagnose y /api/chat,
+envía las mismas N consultas:
+- una a una, de forma secuencial (como los scripts de evaluación actuales);
+- en una sola petición a /api/diagnose/batch o /api/chat/batch, leyendo el
+  NDJSON a medida que llega.
+
+Cada modo usa consultas distintas (sufijo numerado) para que no se beneficie de
+las cachés de embeddings y respuestas llenadas por el otro. Informa en JSON del
+tiempo total, consultas por segundo, tiempo hasta el primer resultado y la
+aceleración del lote.
+
+Uso:
+    python -m benchmarks.batch --queries 100 --embedding-latency 0.05 --llm-latency 0.3
+"""
+import argparse
+import http.client
+import json
+import sys
+import time
+from typing import Any, Dict, List
+
+from benchmarks.load import QUERIES, LoadClient, add_server_arguments, server_env, start_server
+
+def _queries(count: int, mode: str) -> List[str]:
+    return [f"{QUERIES[i % len(QUERIES)]} ({mode} {i})" for i in range(count)]
+
+def run_sequential(client: LoadClient, endpoint: str, queries: List[str]) -> Dict[str, Any]:
+    errors = 0
+    first_seconds = None
+    start = time.perf_counter()
+    for query in queries:
+        status, _ = client.request("POST", f"/api/{endpoint}", {"query": query})
+        errors += not 200 <= status < 300
+        if first_seconds is None:
+            first_seconds = time.perf_counter() - start
+    elapsed = time.perf_counter() - start
+    return _summary(len(queries), errors, elapsed, first_seconds)
+
+def run_batch(port: int, endpoint: str, queries: List[str], batch_size: int) -> Dict[str, Any]:
+    errors = results = 0
+    first_seconds = None
+    start = time.perf_counter()
+    for offset in range(0, len(queries), batch_size):
+        body = json.dumps([{"query": query} for query in queries[offset:offset + batch_size]])
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=600)
+        connection.request("POST", f"/api/{endpoint}/batch", body=body.encode("utf-8"), headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+        if response.status != 200:
+            errors += len(queries[offset:offset + batch_size])
+        else:
+            for line in response:
+                if not line.strip():
+                    continue
+                if first_seconds is None:
+                    first_seconds = time.perf_counter() - start
+                results += 1
+                errors += "error" in json.loads(line)
+        connection.close()
+    elapsed = time.perf_counter() - start
+    summary = _summary(len(queries), errors, elapsed, first_seconds)
+    summary["results"] = results
+    return summary
+
+def _summary(count: int, errors: int, elapsed: float, first_seconds: float) -> Dict[str, Any]:
+    return {
+        "queries": count,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "queries_per_second": round(count / elapsed, 2) if elapsed else None,
+        "first_result_seconds": round(first_seconds, 3) if first_seconds is not None else None,
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=100, help="Consultas por petición (máximo BATCH_MAX_QUERIES)")
+    parser.add_argument("--endpoints", default="diagnose,chat")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    process, ready_seconds = start_server(args.port, server_env(args), args.timeout)
+    if ready_seconds is None:
+        process.terminate()
+        sys.exit(f"La API no estuvo lista en {args.timeout:.0f} s")
+
+    results: Dict[str, Any] = {
+        "config": {
+            "queries": args.queries,
+            "batch_size": args.batch_size,
+            "embedding_latency": args.embedding_latency,
+            "llm_latency": args.llm_latency,
+            "llm_tokens_per_second": args.llm_tokens_per_second,
+        },
+    }
+    try:
+        client = LoadClient(args.port)
+        for endpoint in [endpoint.strip() for endpoint in args.endpoints.split(",") if endpoint.strip()]:
+            sequential = run_sequential(client, endpoint, _queries(args.queries, f"{endpoint} seq"))
+            batch = run_batch(args.port, endpoint, _queries(args.queries, f"{endpoint} batch"), args.batch_size)
+            results[endpoint] = {
+                "sequential": sequential,
+                "batch": batch,
+                "speedup": round(sequential["seconds"] / batch["seconds"], 2) if batch["seconds"] else None,
+            }
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Microbenchmark del coste por petición de construir la cadena RAG.
+
+Compara el camino anterior (prompt, ChatOpenAI, retriever y RetrievalQA
+creados en cada petición) con el registro de cadenas y recuperadores
+(recuperar, empaquetar el contexto y generar), usando un LLM falso,
+embeddings falsos y Qdrant en memoria para no realizar llamadas de red.
+
+Uso:
+    python -m benchmarks.chain_overhead --iterations 500
+"""
+import argparse
+import os
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from langchain.chains import RetrievalQA
+from langchain.chat_models import ChatOpenAI
+from langchain.embeddings import FakeEmbeddings
+from langchain.llms.base import LLM
+from langchain.vectorstores import Qdrant
+
+from app.core.config import settings
+from app.services import chain_registry
+from app.services.context_packer import pack_context
+from app.services.prompt_service import get_rag_prompt
+from app.services.retrieval import get_retriever
+
+ANSWER = "La Roca Village está abierto de lunes a domingo de 10:00 a 21:00h."
+
+class FixedAnswerLLM(LLM):
+    """LLM falso que devuelve siempre la misma respuesta sin latencia"""
+
+    @property
+    def _llm_type(self) -> str:
+        return "fixed-answer"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs) -> str:
+        return ANSWER
+
+def fake_llm(streaming: bool = False) -> FixedAnswerLLM:
+    return FixedAnswerLLM()
+
+def build_vector_store() -> Qdrant:
+    texts = [f"Fragmento de prueba número {i} sobre La Roca Village" for i in range(64)]
+    return Qdrant.from_texts(texts, FakeEmbeddings(size=64), location=":memory:", collection_name="bench")
+
+def build_per_request(vector_store: Qdrant, llm) -> RetrievalQA:
+    """Réplica del camino anterior: todo se construye en cada petición"""
+    prompt = get_rag_prompt()
+    ChatOpenAI(model_name=settings.OPENAI_LLM_MODEL, openai_api_key=settings.OPENAI_API_KEY)
+    return RetrievalQA.from_chain_type(
+        llm=llm,
+        chain_type="stuff",
+        retriever=vector_store.as_retriever(search_kwargs={"k": settings.RAG_RETRIEVAL_K}),
+        chain_type_kwargs={"prompt": prompt}
+    )
+
+def run_registered(vector_store: Qdrant, query: str) -> str:
+    """Camino actual: recuperador y cadena compartidos, contexto empaquetado"""
+    documents = get_retriever(vector_store).get_relevant_documents(query)
+    context = pack_context(documents)
+    return chain_registry.get_llm_chain().run(context=context.text, question=query)
+
+def timed(label: str, iterations: int, func) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    per_call_us = (time.perf_counter() - start) / iterations * 1e6
+    print(f"{label:<40} {per_call_us:10.1f} µs/petición")
+    return per_call_us
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=500)
+    args = parser.parse_args()
+
+    vector_store = build_vector_store()
+    llm = fake_llm()
+    chain_registry._build_llm = fake_llm
+
+    print("Construcción de la cadena:")
+    before = timed("  antes (por petición)", args.iterations, lambda: build_per_request(vector_store, llm))
+    after = timed("  después (registro)", args.iterations, lambda: (get_retriever(vector_store), chain_registry.get_llm_chain()))
+    print(f"  ahorro: {before - after:.1f} µs/petición")
+
+    print("Petición completa con modelos falsos:")
+    before = timed("  antes (por petición)", args.iterations, lambda: build_per_request(vector_store, llm).run("horarios"))
+    after = timed("  después (registro)", args.iterations, lambda: run_registered(vector_store, "horarios"))
+    print(f"  ahorro: {before - after:.1f} µs/petición")
+
+if __name__ == "__main__":
+    main()
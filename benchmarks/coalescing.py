@@ -0,0 +1,110 @@
+"""
+Prueba de concurrencia de la coalescencia de consultas idénticas (single-flight).
+
+Lanza N peticiones simultáneas con la misma pregunta (con variaciones de
+mayúsculas, tildes y puntuación), la mitad por /chat y la otra mitad por
+/chat/stream, con la coalescencia desactivada y activada. Cuenta las llamadas al
+LLM y a la recuperación, y comprueba que todas las peticiones reciben la misma
+respuesta. Usa un LLM falso con latencia, embeddings falsos y Qdrant en memoria;
+la caché de respuestas se desactiva para medir solo la coalescencia.
+
+Termina con código de salida 1 si, con la coalescencia activada, hay más de una
+llamada al LLM.
+
+Uso:
+    python -m benchmarks.coalescing --requests 200 --llm-latency 0.5
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Any, ClassVar, Dict, List
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from langchain.embeddings import FakeEmbeddings
+from langchain.llms.base import LLM
+from langchain.vectorstores import Qdrant
+
+from app.core.config import settings
+from app.services import chain_registry, rag_service
+
+ANSWER = "Durante la promoción, las boutiques participantes ofrecen un descuento adicional: • **Gucci** • **Prada** • **Loewe**"
+QUERIES = [
+    "¿Qué descuentos hay en la promoción de este fin de semana?",
+    "que descuentos hay en la promocion de este fin de semana",
+    "¿QUÉ DESCUENTOS HAY EN LA PROMOCIÓN DE ESTE FIN DE SEMANA?",
+]
+
+class CountingLLM(LLM):
+    """LLM falso con latencia que cuenta sus llamadas y emite la respuesta token a token"""
+
+    streaming: bool = False
+    latency: float = 0.5
+    calls: ClassVar[int] = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "counting"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs) -> str:
+        CountingLLM.calls += 1
+        tokens = [ANSWER[i:i + 4] for i in range(0, len(ANSWER), 4)]
+        for token in tokens:
+            time.sleep(self.latency / len(tokens))
+            if self.streaming and run_manager:
+                run_manager.on_llm_new_token(token)
+        return ANSWER
+
+def build_vector_store() -> Qdrant:
+    texts = [f"Promoción {i}: descuentos adicionales en boutiques de La Roca Village" for i in range(64)]
+    return Qdrant.from_texts(texts, FakeEmbeddings(size=64), location=":memory:", collection_name="bench")
+
+async def _stream(query: str, vector_store: Qdrant) -> str:
+    return "".join([text async for text in rag_service.stream_rag_answer(query, vector_store)])
+
+async def run(requests: int, vector_store: Qdrant) -> Dict[str, Any]:
+    CountingLLM.calls = 0
+    retrievals = rag_service.CONTEXT_REQUESTS.value()
+
+    calls = []
+    for i in range(requests):
+        query = QUERIES[i % len(QUERIES)]
+        calls.append(_stream(query, vector_store) if i % 2 else rag_service.get_rag_answer(query, vector_store))
+
+    start = time.perf_counter()
+    answers: List[str] = await asyncio.gather(*calls)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "llm_calls": CountingLLM.calls,
+        "retrievals": int(rag_service.CONTEXT_REQUESTS.value() - retrievals),
+        "distinct_answers": len(set(answers)),
+        "seconds": round(elapsed, 3),
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Segundos por llamada al LLM falso")
+    args = parser.parse_args()
+
+    settings.ANSWER_CACHE_ENABLED = False
+    settings.LEXICAL_INDEX_ENABLED = False
+    settings.BLOCKING_POOL_SIZE = max(settings.BLOCKING_POOL_SIZE, 64)
+    chain_registry._build_llm = lambda streaming=False: CountingLLM(streaming=streaming, latency=args.llm_latency)
+    vector_store = build_vector_store()
+
+    results = {"requests": args.requests}
+    for mode, enabled in (("without_coalescing", False), ("with_coalescing", True)):
+        settings.REQUEST_COALESCING_ENABLED = enabled
+        results[mode] = asyncio.run(run(args.requests, vector_store))
+
+    print(json.dumps(results, indent=2))
+    if results["with_coalescing"]["llm_calls"] != 1 or results["with_coalescing"]["distinct_answers"] != 1:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
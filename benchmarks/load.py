@@ -0,0 +1,285 @@
+"""
+Prueba de carga de la API sin dependencias externas.
+
+Arranca la API con OpenAI simulado (benchmarks.load_app) y Qdrant embebido en
+memoria, que indexa el corpus documents/ al arrancar, y lanza contra /api/health,
+/api/chat y /api/diagnose el número de peticiones indicado con cada nivel de
+concurrencia. Informa en JSON:
+- tiempo de arranque hasta /api/ready;
+- por endpoint y concurrencia: peticiones por segundo, latencia p50/p95/p99,
+  códigos de estado;
+- memoria residente máxima del servidor.
+
+Con --reindex, lanza además una reindexación completa (POST /api/admin/reindex)
+y mantiene carga de /api/chat mientras dura, para comprobar que no hay errores
+durante el cambio de colección.
+
+Cliente y servidor comparten las CPU de la máquina: compare resultados obtenidos
+en la misma máquina.
+
+Uso:
+    python -m benchmarks.load --concurrency 1,8,32 --requests 200 --llm-latency 0.3
+    python -m benchmarks.load --endpoints chat --distinct-queries --output load.json
+"""
+import argparse
+import http.client
+import json
+import os
+import resource
+import secrets
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from benchmarks.startup import _status
+
+QUERIES = [
+    "¿Cuál es el horario de La Roca Village?",
+    "¿Qué restaurantes hay en el centro?",
+    "¿Qué marcas tienen descuento esta semana?",
+    "¿Cómo funciona el servicio de personal shopper?",
+    "¿Qué ventajas tiene la membresía de La Roca Village?",
+    "¿Se puede aparcar en el centro comercial?",
+    "¿Hay opciones vegetarianas en los restaurantes?",
+    "¿Cómo puedo devolver una compra?",
+]
+ENDPOINTS = {
+    "health": ("GET", "/api/health"),
+    "chat": ("POST", "/api/chat"),
+    "diagnose": ("POST", "/api/diagnose"),
+}
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Percentil por rango más cercano"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+
+def start_server(port: int, env: Dict[str, str], timeout: float) -> Tuple[subprocess.Popen, Optional[float]]:
+    """Arranca la API simulada y espera a que /api/ready devuelva 200"""
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.load_app:app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+        stdout=subprocess.DEVNULL
+    )
+    while time.perf_counter() - start < timeout and process.poll() is None:
+        if _status(f"http://127.0.0.1:{port}/api/ready") == 200:
+            return process, time.perf_counter() - start
+        time.sleep(0.05)
+    return process, None
+
+def server_env(args: argparse.Namespace, admin_key: str = "") -> Dict[str, str]:
+    """Entorno de la API simulada: Qdrant en memoria y estado de indexación temporal"""
+    return {
+        **os.environ,
+        "OPENAI_API_KEY": "sk-benchmark",
+        "LOAD_LLM_LATENCY": str(args.llm_latency),
+        "LOAD_LLM_TOKENS_PER_SECOND": str(args.llm_tokens_per_second),
+        "LOAD_EMBEDDING_LATENCY": str(args.embedding_latency),
+        "VECTOR_DB_BACKEND": "qdrant",
+        "VECTOR_DB_URL": "",
+        "QDRANT_URL": "",
+        "VECTOR_DB_LOCATION": ":memory:",
+        "INDEX_STATE_DIR": tempfile.mkdtemp(prefix="rag-load-"),
+        "EMBEDDING_CACHE_PATH": "",
+        "ANSWER_CACHE_ENABLED": str(args.answer_cache).lower(),
+        "FAQ_STORE_ENABLED": str(args.faq_store).lower(),
+        "FAQ_STORE_PATH": os.path.join(tempfile.mkdtemp(prefix="rag-load-faq-"), "faq_store.json"),
+        "STARTUP_MODE": "background",
+        "ADMIN_API_KEY": admin_key,
+    }
+
+def add_server_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Segundos hasta el primer token del LLM falso")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=50.0, help="Velocidad de generación del LLM falso")
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="Segundos por llamada de embeddings falsa")
+    parser.add_argument("--answer-cache", action="store_true", help="Mantener activada la caché de respuestas")
+    parser.add_argument("--faq-store", action="store_true", help="Activar el almacén de preguntas frecuentes")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--timeout", type=float, default=300.0, help="Segundos máximos de arranque y de reindexación")
+
+def peak_memory_mb(pid: int) -> Optional[float]:
+    """Memoria residente máxima del proceso (Linux, /proc)"""
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+class LoadClient:
+    """Conexión HTTP persistente por hilo"""
+
+    def __init__(self, port: int, headers: Optional[Dict[str, str]] = None):
+        self.port = port
+        self.headers = {"Content-Type": "application/json", **(headers or {})}
+        self._local = threading.local()
+
+    def request(self, method: str, path: str, body: Optional[dict] = None) -> Tuple[int, float]:
+        """Devuelve (código de estado, segundos); 0 si falla la conexión"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=120)
+        payload = json.dumps(body).encode("utf-8") if body is not None else None
+        start = time.perf_counter()
+        try:
+            connection.request(method, path, body=payload, headers=self.headers)
+            response = connection.getresponse()
+            response.read()
+            return response.status, time.perf_counter() - start
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            self._local.connection = None
+            return 0, time.perf_counter() - start
+
+def run_phase(
+    client: LoadClient,
+    endpoint: str,
+    concurrency: int,
+    requests: int,
+    distinct: bool,
+    until: Optional[threading.Event] = None
+) -> Dict[str, Any]:
+    """Lanza `requests` peticiones (o hasta que se active `until`) con `concurrency` hilos"""
+    method, path = ENDPOINTS[endpoint]
+    counter = iter(range(sys.maxsize))
+    lock = threading.Lock()
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+
+    def worker() -> None:
+        while True:
+            with lock:
+                i = next(counter)
+            if i >= requests and (until is None or until.is_set()):
+                return
+            body = None
+            if method == "POST":
+                query = QUERIES[i % len(QUERIES)]
+                # Consultas distintas: sin aciertos de caché ni coalescencia
+                body = {"query": f"{query} ({i})" if distinct else query}
+            status, seconds = client.request(method, path, body)
+            with lock:
+                latencies.append(seconds)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    elapsed = time.perf_counter() - start
+
+    ms = [seconds * 1000 for seconds in latencies]
+    return {
+        "requests": len(latencies),
+        "errors": sum(count for status, count in statuses.items() if not 200 <= status < 300),
+        "status_codes": {str(status): count for status, count in sorted(statuses.items())},
+        "seconds": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "p50": _round(percentile(ms, 50)),
+            "p95": _round(percentile(ms, 95)),
+            "p99": _round(percentile(ms, 99)),
+            "max": _round(max(ms, default=None)),
+        },
+    }
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 2) if value is not None else None
+
+def run_reindex_phase(port: int, admin_key: str, concurrency: int, requests: int, timeout: float) -> Dict[str, Any]:
+    """Carga de /api/chat mientras se reindexa; termina al acabar la reindexación"""
+    admin = LoadClient(port, {"X-Admin-Key": admin_key})
+    done = threading.Event()
+    job: Dict[str, Any] = {}
+
+    def watch() -> None:
+        status, _ = admin.request("POST", "/api/admin/reindex")
+        job["accepted"] = status == 202
+        deadline = time.monotonic() + timeout
+        while job["accepted"] and time.monotonic() < deadline:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+            connection.request("GET", "/api/admin/reindex", headers={"X-Admin-Key": admin_key})
+            job["status"] = json.loads(connection.getresponse().read())
+            connection.close()
+            if job["status"]["status"] != "running":
+                break
+            time.sleep(0.2)
+        done.set()
+
+    watcher = threading.Thread(target=watch)
+    watcher.start()
+    result = run_phase(LoadClient(port), "chat", concurrency, requests, distinct=False, until=done)
+    watcher.join()
+    result["reindex"] = job.get("status", {"status": "rejected"})
+    return result
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", default="health,diagnose,chat", help="Endpoints a probar, en orden")
+    parser.add_argument("--concurrency", default="1,8,32", help="Niveles de concurrencia separados por comas")
+    parser.add_argument("--requests", type=int, default=200, help="Peticiones por endpoint y nivel de concurrencia")
+    parser.add_argument("--distinct-queries", action="store_true", help="Consultas únicas: sin caché de respuestas ni coalescencia")
+    parser.add_argument("--reindex", action="store_true", help="Medir /api/chat durante una reindexación completa")
+    add_server_arguments(parser)
+    parser.add_argument("--output", default=None, help="Fichero donde guardar el JSON además de imprimirlo")
+    args = parser.parse_args()
+
+    endpoints = [endpoint.strip() for endpoint in args.endpoints.split(",") if endpoint.strip()]
+    levels = [int(level) for level in args.concurrency.split(",")]
+    admin_key = secrets.token_hex(16)
+    env = server_env(args, admin_key)
+
+    process, ready_seconds = start_server(args.port, env, args.timeout)
+    if ready_seconds is None:
+        process.terminate()
+        sys.exit(f"La API no estuvo lista en {args.timeout:.0f} s")
+
+    results: Dict[str, Any] = {
+        "config": {
+            "endpoints": endpoints,
+            "concurrency": levels,
+            "requests": args.requests,
+            "llm_latency": args.llm_latency,
+            "llm_tokens_per_second": args.llm_tokens_per_second,
+            "embedding_latency": args.embedding_latency,
+            "distinct_queries": args.distinct_queries,
+            "answer_cache": args.answer_cache,
+        },
+        "startup_seconds": round(ready_seconds, 3),
+        "endpoints": {},
+    }
+    try:
+        client = LoadClient(args.port)
+        for endpoint in endpoints:
+            results["endpoints"][endpoint] = {
+                str(level): run_phase(client, endpoint, level, args.requests, args.distinct_queries)
+                for level in levels
+            }
+        if args.reindex:
+            results["chat_during_reindex"] = run_reindex_phase(args.port, admin_key, max(levels), args.requests, args.timeout)
+        results["peak_memory_mb"] = peak_memory_mb(process.pid)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    if results.get("peak_memory_mb") is None:
+        # Fuera de Linux: máximo de los procesos hijos ya terminados (KB en Linux, bytes en macOS)
+        peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        results["peak_memory_mb"] = round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+    output = json.dumps(results, indent=2, ensure_ascii=False)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+
+if __name__ == "__main__":
+    main()
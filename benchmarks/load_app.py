@@ -0,0 +1,71 @@
+"""
+API con OpenAI simulado para las pruebas de carga (benchmarks.load).
+
+Sustituye los embeddings de OpenAI por HashingEmbeddings (deterministas, sin red)
+con LOAD_EMBEDDING_LATENCY segundos por llamada, y el LLM por uno falso que tarda
+LOAD_LLM_LATENCY segundos hasta el primer token y emite LOAD_LLM_TOKENS_PER_SECOND
+tokens por segundo. El resto de la aplicación (cachés, enrutado, recuperación
+híbrida, gateway, Qdrant embebido) es el real.
+
+Uso:
+    LOAD_LLM_LATENCY=0.3 python -m uvicorn benchmarks.load_app:app --port 8766
+"""
+import os
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from langchain.llms.base import LLM
+
+from app.services import chain_registry, embeddings
+from benchmarks.retrieval import HashingEmbeddings
+
+ANSWER = (
+    "La Roca Village abre todos los días de 10:00 a 21:00. Algunas de las boutiques con descuento son: "
+    "• **Gucci**: moda y complementos • **Loewe**: marroquinería • **Prada**: moda. "
+    "Puede consultar las condiciones en el servicio de atención al cliente."
+)
+
+class FakeLLM(LLM):
+    """LLM falso con latencia hasta el primer token y velocidad de generación configurables"""
+
+    streaming: bool = False
+    latency: float = 0.3
+    tokens_per_second: float = 50.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-load"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs) -> str:
+        time.sleep(self.latency)
+        tokens = [ANSWER[i:i + 4] for i in range(0, len(ANSWER), 4)]
+        for token in tokens:
+            if self.tokens_per_second > 0:
+                time.sleep(1 / self.tokens_per_second)
+            if self.streaming and run_manager:
+                run_manager.on_llm_new_token(token)
+        return ANSWER
+
+class SlowHashingEmbeddings(HashingEmbeddings):
+    """HashingEmbeddings con la latencia de ida y vuelta de una llamada a la API"""
+
+    def __init__(self, latency: float):
+        super().__init__()
+        self.latency = latency
+
+    def embed_documents(self, texts):
+        time.sleep(self.latency)
+        return super().embed_documents(texts)
+
+def _build_llm(streaming: bool = False) -> FakeLLM:
+    return FakeLLM(
+        streaming=streaming,
+        latency=float(os.getenv("LOAD_LLM_LATENCY", "0.3")),
+        tokens_per_second=float(os.getenv("LOAD_LLM_TOKENS_PER_SECOND", "50"))
+    )
+
+embeddings.OpenAIEmbeddings = lambda **kwargs: SlowHashingEmbeddings(float(os.getenv("LOAD_EMBEDDING_LATENCY", "0")))
+chain_registry._build_llm = _build_llm
+
+from app.main import app  # noqa: E402
@@ -0,0 +1,50 @@
+"""
+Benchmark de la extracción de texto sobre el árbol documents/ incluido.
+
+Mide ficheros/s en cuatro escenarios:
+- serie, caché fría
+- paralelo, caché fría
+- serie, caché caliente
+- paralelo, caché caliente
+
+Cada escenario en frío usa un directorio de caché temporal vacío.
+
+Uso:
+    python -m benchmarks.parsing --workers 4
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from app.core.config import settings
+from app.db.document_loader import list_document_files
+from app.db.parsing import ParsedTextCache, file_hash, iter_parsed_files
+
+def run(files, workers: int, cache: ParsedTextCache) -> dict:
+    start = time.perf_counter()
+    parsed = sum(1 for _ in iter_parsed_files(files, workers=workers, cache=cache))
+    elapsed = time.perf_counter() - start
+    return {"files": parsed, "seconds": round(elapsed, 3), "files_per_second": round(parsed / elapsed, 2) if elapsed else None}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=settings.PARSE_WORKERS)
+    parser.add_argument("--documents", default=settings.DOCUMENT_DIR)
+    args = parser.parse_args()
+
+    settings.DOCUMENT_DIR = args.documents
+    files = [(path, file_hash(path)) for path in list_document_files()]
+
+    results = {"documents": args.documents, "workers": args.workers}
+    for label, workers in (("serial", 1), ("parallel", args.workers)):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = ParsedTextCache(os.path.join(cache_dir, "parsed"))
+            results[f"{label}_cold"] = run(files, workers, cache)
+            results[f"{label}_warm"] = run(files, workers, cache)
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
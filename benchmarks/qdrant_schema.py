@@ -0,0 +1,170 @@
+"""
+Benchmark del esquema de colecciones de Qdrant (app.db.schema).
+
+Genera N vectores sintéticos agrupados por categoría (como los fragmentos de
+cada carpeta de documentos) y los carga en dos colecciones:
+- "default": solo vectores, configuración por defecto de Qdrant;
+- "schema": la de app.db.schema.create_collection (índices de payload sobre
+  category/doc_type, HNSW VECTOR_DB_HNSW_* y cuantización VECTOR_DB_QUANTIZATION).
+
+Para cada una mide, sin filtro y filtrando por la categoría de la consulta,
+la latencia p50/p95 y el recall@k frente a la búsqueda exacta. Informa también
+de la memoria del proceso y de la estimada para los vectores en el servidor
+(float32 frente a int8).
+
+Qdrant embebido (por defecto) busca por fuerza bruta e ignora HNSW,
+cuantización e índices: para cifras representativas use --qdrant-url con un
+servidor de Qdrant.
+
+Uso:
+    python -m benchmarks.qdrant_schema --points 20000 --dim 1536 --queries 200 --qdrant-url http://localhost:6333
+"""
+import argparse
+import json
+import resource
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http import models as rest
+
+from app.core.config import settings
+from app.db.schema import DOCUMENT_RULES, create_collection, qdrant_filter, search_params
+
+COLLECTIONS = {"default": "benchmark_default", "schema": "benchmark_schema"}
+CATEGORIES = sorted({category for _, category, _ in DOCUMENT_RULES})
+
+def _rss_mb() -> float:
+    """Memoria residente actual del proceso (pico si /proc no está disponible)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / 1024 / 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def synthetic_data(points: int, dim: int, queries: int, seed: int = 0):
+    """Vectores alrededor de un centro por categoría; cada consulta, cerca de un punto al azar"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((len(CATEGORIES), dim), dtype=np.float32)
+    labels = rng.integers(len(CATEGORIES), size=points)
+    vectors = centers[labels] + rng.standard_normal((points, dim), dtype=np.float32)
+    picked = rng.integers(points, size=queries)
+    query_vectors = vectors[picked] + 0.5 * rng.standard_normal((queries, dim), dtype=np.float32)
+    return vectors, labels, query_vectors, labels[picked]
+
+def load(client: QdrantClient, layout: str, vectors: np.ndarray, labels: np.ndarray, batch_size: int = 256) -> float:
+    """Crea la colección con el diseño indicado y sube los puntos; devuelve los segundos empleados"""
+    name = COLLECTIONS[layout]
+    if client.collection_exists(name):
+        client.delete_collection(name)
+    start = time.perf_counter()
+    if layout == "schema":
+        create_collection(client, name, vectors.shape[1])
+    else:
+        client.create_collection(name, vectors_config=rest.VectorParams(size=vectors.shape[1], distance=rest.Distance.COSINE))
+    # Solo se espera al último lote: Qdrant aplica las operaciones en orden
+    for offset in range(0, len(vectors), batch_size):
+        client.upsert(name, points=[
+            rest.PointStruct(
+                id=str(uuid.uuid4()),
+                vector=vector.tolist(),
+                payload={"page_content": f"fragmento {offset + i}", "metadata": {"category": CATEGORIES[label], "doc_type": "document"}}
+            )
+            for i, (vector, label) in enumerate(zip(vectors[offset:offset + batch_size], labels[offset:offset + batch_size]))
+        ], wait=offset + batch_size >= len(vectors))
+    return time.perf_counter() - start
+
+def _ids(client: QdrantClient, name: str, query: np.ndarray, k: int, filter: Optional[rest.Filter], params: Optional[rest.SearchParams]) -> List[Any]:
+    response = client.query_points(name, query=query.tolist(), query_filter=filter, search_params=params, limit=k)
+    return [point.id for point in response.points]
+
+def measure(
+    client: QdrantClient,
+    layout: str,
+    queries: np.ndarray,
+    query_labels: np.ndarray,
+    k: int,
+    filtered: bool
+) -> Dict[str, Any]:
+    name = COLLECTIONS[layout]
+    params = search_params() if layout == "schema" else None
+    filters = [
+        qdrant_filter({"category": [CATEGORIES[label]]}) if filtered else None
+        for label in query_labels
+    ]
+    # Calentamiento: primera consulta (carga de páginas, conexiones)
+    _ids(client, name, queries[0], k, filters[0], params)
+    latencies, recalls = [], []
+    for query, filter in zip(queries, filters):
+        start = time.perf_counter()
+        found = _ids(client, name, query, k, filter, params)
+        latencies.append((time.perf_counter() - start) * 1000)
+        exact = _ids(client, name, query, k, filter, rest.SearchParams(exact=True))
+        recalls.append(len(set(found) & set(exact)) / max(len(exact), 1))
+    latencies = np.array(latencies)
+    return {
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        f"recall@{k}": round(float(np.mean(recalls)), 4),
+    }
+
+def vector_memory_mb(points: int, dim: int, layout: str) -> float:
+    """Memoria de vectores estimada en el servidor (sin el grafo HNSW)"""
+    float32 = points * dim * 4
+    if layout != "schema" or not settings.VECTOR_DB_QUANTIZATION:
+        return round(float32 / 1024 / 1024, 1)
+    # Vectores int8 en memoria; los originales solo si no están en disco
+    in_ram = points * dim + (0 if settings.VECTOR_DB_ON_DISK_VECTORS else float32)
+    return round(in_ram / 1024 / 1024, 1)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--qdrant-url", default="", help="Qdrant remoto; por defecto, embebido en memoria")
+    args = parser.parse_args()
+
+    vectors, labels, queries, query_labels = synthetic_data(args.points, args.dim, args.queries)
+    # app.db.schema decide por VECTOR_DB_URL si el servidor admite índices de payload
+    settings.VECTOR_DB_URL = args.qdrant_url
+    client = QdrantClient(url=args.qdrant_url) if args.qdrant_url else QdrantClient(location=":memory:")
+    results: Dict[str, Any] = {
+        "points": args.points,
+        "dim": args.dim,
+        "queries": args.queries,
+        "k": args.k,
+        "categories": len(CATEGORIES),
+        "qdrant": "remote" if args.qdrant_url else "embedded (sin HNSW, cuantización ni índices)",
+        "config": {
+            "hnsw_m": settings.VECTOR_DB_HNSW_M,
+            "hnsw_ef": settings.VECTOR_DB_HNSW_EF,
+            "quantization": settings.VECTOR_DB_QUANTIZATION or None,
+            "rescore": settings.VECTOR_DB_RESCORE,
+            "oversampling": settings.VECTOR_DB_OVERSAMPLING,
+        },
+    }
+
+    try:
+        for layout in COLLECTIONS:
+            rss_before = _rss_mb()
+            load_seconds = load(client, layout, vectors, labels)
+            results[layout] = {
+                "load_seconds": round(load_seconds, 2),
+                "process_rss_delta_mb": round(_rss_mb() - rss_before, 1),
+                "vector_memory_estimate_mb": vector_memory_mb(args.points, args.dim, layout),
+                "unfiltered": measure(client, layout, queries, query_labels, args.k, filtered=False),
+                "filtered": measure(client, layout, queries, query_labels, args.k, filtered=True),
+            }
+    finally:
+        if args.qdrant_url:
+            for name in COLLECTIONS.values():
+                client.delete_collection(name)
+
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
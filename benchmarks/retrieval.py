@@ -0,0 +1,136 @@
+"""
+Benchmark de calidad y latencia de la recuperación: vectorial, BM25 e híbrida (RRF).
+
+Indexa el árbol documents/ en un índice local temporal y evalúa el conjunto de
+consultas etiquetadas de benchmarks/data/retrieval_queries.json. Una consulta
+acierta en k si alguno de los k primeros fragmentos cumple alguna de sus
+alternativas "relevant": procede del fichero indicado ("source", subcadena de la
+ruta) y, si se indica, contiene el texto "contains".
+
+Informa recall@k, MRR y latencia por consulta (p50/p95). Las consultas se
+ejecutan una vez antes de medir, de modo que la latencia no incluye la llamada
+a la API de embeddings (queda en la caché de embeddings).
+
+Uso:
+    python -m benchmarks.retrieval --k 1,3,5,8
+    python -m benchmarks.retrieval --hashing-embeddings   # sin OpenAI, solo para pruebas
+"""
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+from langchain.schema import Document
+
+from app.core.config import settings
+from app.db.indexer import index_documents
+from app.db.lexical_index import tokenize
+from app.db.local_index import LocalIndexWriter, LocalVectorIndex
+from app.services.retrieval import HybridRetriever
+
+QUERIES_PATH = os.path.join(os.path.dirname(__file__), "data", "retrieval_queries.json")
+COLLECTION = "benchmark"
+MODES = {"vector": (1.0, 0.0), "lexical": (0.0, 1.0), "hybrid": (1.0, 1.0)}
+
+class HashingEmbeddings(Embeddings):
+    """Embeddings deterministas por hashing de términos (sin red); no reflejan la calidad real"""
+
+    def __init__(self, size: int = 512):
+        self.size = size
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        for term in tokenize(text):
+            vector[int(hashlib.md5(term.encode("utf-8")).hexdigest(), 16) % self.size] += 1
+        return vector.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+def _normalize(text: str) -> str:
+    return " ".join(tokenize(text))
+
+def is_relevant(doc: Document, label: Dict[str, Any]) -> bool:
+    source = str(doc.metadata.get("source", "")).replace(os.sep, "/")
+    content = _normalize(doc.page_content)
+    return any(
+        relevant["source"] in source and ("contains" not in relevant or _normalize(relevant["contains"]) in content)
+        for relevant in label["relevant"]
+    )
+
+def evaluate(retriever: HybridRetriever, labels: List[Dict[str, Any]], ks: List[int]) -> Dict[str, Any]:
+    for label in labels:
+        retriever.get_relevant_documents(label["query"])
+
+    hits = {k: 0 for k in ks}
+    reciprocal_ranks = []
+    latencies = []
+    for label in labels:
+        start = time.perf_counter()
+        docs = retriever.get_relevant_documents(label["query"])
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        rank = next((i for i, doc in enumerate(docs, start=1) if is_relevant(doc, label)), None)
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+        for k in ks:
+            hits[k] += bool(rank and rank <= k)
+
+    return {
+        **{f"recall@{k}": round(hits[k] / len(labels), 3) for k in ks},
+        "mrr": round(float(np.mean(reciprocal_ranks)), 3),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", default=settings.DOCUMENT_DIR)
+    parser.add_argument("--queries", default=QUERIES_PATH)
+    parser.add_argument("--k", default="1,3,5,8", help="Valores de k separados por comas")
+    parser.add_argument("--hashing-embeddings", action="store_true", help="Usar embeddings locales por hashing en vez de OpenAI")
+    args = parser.parse_args()
+
+    ks = sorted(int(k) for k in args.k.split(","))
+    with open(args.queries, encoding="utf-8") as f:
+        labels = json.load(f)
+
+    if args.hashing_embeddings:
+        embeddings = HashingEmbeddings()
+    else:
+        from app.services.embeddings import get_embeddings
+        embeddings = get_embeddings()
+
+    with tempfile.TemporaryDirectory() as directory:
+        settings.DOCUMENT_DIR = args.documents
+        settings.INDEX_STATE_DIR = os.path.join(directory, "state")
+        settings.LOCAL_INDEX_DIR = os.path.join(directory, "local")
+        settings.LEXICAL_INDEX_ENABLED = True
+
+        report = index_documents(LocalIndexWriter(settings.LOCAL_INDEX_DIR, COLLECTION), embeddings)
+        vector_store = LocalVectorIndex(settings.LOCAL_INDEX_DIR, COLLECTION, embeddings)
+
+        results = {"queries": len(labels), "chunks": report.chunks_added + report.chunks_skipped}
+        for mode, (vector_weight, lexical_weight) in MODES.items():
+            retriever = HybridRetriever(
+                vector_store=vector_store,
+                collection_name=COLLECTION,
+                k=max(ks),
+                vector_weight=vector_weight,
+                lexical_weight=lexical_weight,
+                candidates=settings.HYBRID_CANDIDATES,
+                rrf_k=settings.HYBRID_RRF_K
+            )
+            results[mode] = evaluate(retriever, labels, ks)
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
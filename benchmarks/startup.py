@@ -0,0 +1,89 @@
+"""
+Benchmark reproducible del arranque de la API.
+
+Mide, en procesos nuevos y para varias repeticiones:
+- el tiempo de importación de `app.main`
+- el tiempo hasta que /api/live responde (proceso aceptando tráfico)
+- el tiempo hasta que /api/ready devuelve 200 (recursos calentados)
+
+Usa la configuración del entorno actual (.env incluido).
+
+Uso:
+    python -m benchmarks.startup --runs 5 --port 8765
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+
+def measure_import() -> float:
+    """Tiempo de importación de app.main en un intérprete nuevo"""
+    output = subprocess.check_output([sys.executable, "-c", IMPORT_SNIPPET], stderr=subprocess.DEVNULL)
+    return float(output.decode().strip().splitlines()[-1])
+
+def _status(url: str) -> int:
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except (urllib.error.URLError, ConnectionError, OSError):
+        return 0
+
+def measure_server(port: int, timeout: float) -> dict:
+    """Arranca uvicorn y mide el tiempo hasta liveness y readiness"""
+    base_url = f"http://127.0.0.1:{port}/api"
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    live_seconds = ready_seconds = None
+    try:
+        while time.perf_counter() - start < timeout:
+            if live_seconds is None and _status(f"{base_url}/live") == 200:
+                live_seconds = time.perf_counter() - start
+            if live_seconds is not None and _status(f"{base_url}/ready") == 200:
+                ready_seconds = time.perf_counter() - start
+                break
+            if process.poll() is not None:
+                break
+            time.sleep(0.05)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+    return {"live_seconds": live_seconds, "ready_seconds": ready_seconds}
+
+def summarize(values: list) -> dict:
+    values = [value for value in values if value is not None]
+    if not values:
+        return {"runs": 0}
+    return {"runs": len(values), "min": min(values), "median": statistics.median(values), "max": max(values)}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=300.0, help="Segundos máximos de espera por arranque")
+    args = parser.parse_args()
+
+    imports = [measure_import() for _ in range(args.runs)]
+    servers = [measure_server(args.port, args.timeout) for _ in range(args.runs)]
+
+    print(json.dumps({
+        "startup_mode": os.getenv("STARTUP_MODE", "background"),
+        "import_seconds": summarize(imports),
+        "time_to_live_seconds": summarize([run["live_seconds"] for run in servers]),
+        "time_to_ready_seconds": summarize([run["ready_seconds"] for run in servers])
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark de latencia de recuperación: índice local (NumPy) frente a Qdrant.
+
+Genera N vectores sintéticos normalizados de dimensión D, los carga en ambos
+backends y mide la latencia de similarity_search_by_vector (sin el coste del
+embedding de la consulta). Qdrant se usa embebido en memoria salvo que se pase
+--qdrant-url, en cuyo caso se mide también el viaje de red.
+
+Uso:
+    python -m benchmarks.vector_backends --points 5000 --dim 1536 --queries 200
+"""
+import argparse
+import json
+import tempfile
+import time
+import uuid
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+from langchain.vectorstores import Qdrant
+from qdrant_client import QdrantClient
+
+from app.db.backends import QdrantSink
+from app.db.local_index import LocalIndexWriter, LocalVectorIndex
+
+COLLECTION = "benchmark"
+
+class _UnusedEmbeddings(Embeddings):
+    """Las consultas se hacen por vector: no se deben generar embeddings"""
+
+    def embed_documents(self, texts):
+        raise NotImplementedError
+
+    def embed_query(self, text):
+        raise NotImplementedError
+
+def load(sink, vectors: np.ndarray, batch_size: int = 256) -> None:
+    sink.ensure(vectors.shape[1])
+    for start in range(0, len(vectors), batch_size):
+        batch = vectors[start:start + batch_size]
+        ids = [str(uuid.uuid4()) for _ in batch]
+        payloads = [{"page_content": f"fragmento {start + i}", "metadata": {"row": start + i}} for i in range(len(batch))]
+        sink.upsert(ids, batch.tolist(), payloads, wait=False)
+    sink.commit()
+
+def measure(vector_store, queries: np.ndarray, k: int) -> dict:
+    # Calentamiento: primera consulta (carga de páginas, conexiones)
+    vector_store.similarity_search_by_vector(queries[0].tolist(), k=k)
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        vector_store.similarity_search_by_vector(query.tolist(), k=k)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies = np.array(latencies)
+    return {
+        "mean_ms": round(float(latencies.mean()), 3),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--qdrant-url", default="", help="Qdrant remoto; por defecto, embebido en memoria")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((args.points, args.dim), dtype=np.float32)
+    queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+    embeddings = _UnusedEmbeddings()
+    results = {"points": args.points, "dim": args.dim, "queries": args.queries, "k": args.k}
+
+    with tempfile.TemporaryDirectory() as directory:
+        load(LocalIndexWriter(directory, COLLECTION), vectors)
+        results["local"] = measure(LocalVectorIndex(directory, COLLECTION, embeddings), queries, args.k)
+
+    client = QdrantClient(url=args.qdrant_url) if args.qdrant_url else QdrantClient(location=":memory:")
+    sink = QdrantSink(client, COLLECTION)
+    if sink.count() is not None:
+        sink.drop()
+    load(sink, vectors)
+    results["qdrant_remote" if args.qdrant_url else "qdrant_embedded"] = measure(
+        Qdrant(client=client, collection_name=COLLECTION, embeddings=embeddings), queries, args.k
+    )
+    if args.qdrant_url:
+        sink.drop()
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Configuración común de las pruebas.
+
+La aplicación se importa a través de benchmarks.load_app: embeddings por hashing
+(sin red) y un LLM falso con latencia configurable. El entorno se fija antes de
+importar app.core.config, que lee la configuración al cargarse.
+"""
+import os
+import tempfile
+
+_state_dir = tempfile.mkdtemp(prefix="rag-tests-")
+os.environ.update(
+    OPENAI_API_KEY="sk-test",
+    VECTOR_DB_BACKEND="local",
+    LOCAL_INDEX_DIR=os.path.join(_state_dir, "local_index"),
+    INDEX_STATE_DIR=os.path.join(_state_dir, "index"),
+    ANSWER_CACHE_ENABLED="false",
+    LEXICAL_INDEX_ENABLED="false",
+    FAQ_STORE_ENABLED="false",
+    VECTOR_STORE_STARTUP_PROBE="false",
+)
+
+import pytest  # noqa: E402
+
+import benchmarks.load_app  # noqa: E402,F401
+from app.core.config import settings  # noqa: E402
+from app.db import vector_store  # noqa: E402
+from app.db.local_index import LocalVectorIndex  # noqa: E402
+from app.services.embeddings import get_embeddings  # noqa: E402
+
+TEXTS = [
+    "La Roca Village abre todos los días de 10:00 a 21:00.",
+    "El aparcamiento es gratuito para todos los visitantes.",
+    "Los restaurantes del centro ofrecen menús halal y vegetarianos.",
+    "El servicio de personal shopper se reserva con antelación.",
+]
+
+@pytest.fixture
+def reset_vector_store():
+    """Deja el singleton del almacén vectorial sin inicializar antes y después de la prueba"""
+    def reset():
+        vector_store._vector_store = None
+        vector_store._vector_store_collection = None
+        vector_store._init_task = None
+        vector_store._switch_task = None
+        vector_store._init_failures = 0
+        vector_store._init_retry_at = 0.0
+        vector_store._init_error = None
+    reset()
+    yield
+    reset()
+
+@pytest.fixture
+def indexed_documents(reset_vector_store):
+    """Colección local con unos pocos fragmentos, lista para que el almacén vectorial la abra"""
+    LocalVectorIndex.from_texts(
+        TEXTS,
+        get_embeddings(),
+        metadatas=[{"source": f"doc{i}.pdf"} for i in range(len(TEXTS))],
+        directory=settings.LOCAL_INDEX_DIR,
+        collection_name=settings.VECTOR_DB_COLLECTION
+    )
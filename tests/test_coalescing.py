@@ -0,0 +1,104 @@
+"""
+Coalescencia de consultas idénticas concurrentes (single-flight) en /chat y /chat/stream.
+"""
+import asyncio
+import json
+import threading
+
+import httpx
+import openai
+import pytest
+
+from app.core.config import settings
+from app.main import app
+from app.services import chain_registry
+from benchmarks.load_app import ANSWER, FakeLLM
+
+QUERY = "¿Qué descuentos hay en la promoción de este fin de semana?"
+
+class CountingLLM(FakeLLM):
+    """LLM falso que cuenta sus llamadas y puede fallar tras emitir `fail_after_tokens` tokens"""
+
+    fail_after_tokens: int = -1
+    failures: int = 0
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs) -> str:
+        with _lock:
+            _calls.append(prompt)
+            failing = len(_calls) <= self.failures
+        if not failing:
+            return super()._call(prompt, stop, run_manager, **kwargs)
+        tokens = [ANSWER[i:i + 4] for i in range(0, len(ANSWER), 4)]
+        for token in tokens[:self.fail_after_tokens]:
+            if self.streaming and run_manager:
+                run_manager.on_llm_new_token(token)
+        raise openai.error.APIConnectionError("conexión interrumpida")
+
+_calls = []
+_lock = threading.Lock()
+
+@pytest.fixture
+def counting_llm(monkeypatch, indexed_documents):
+    """Instala un LLM contador; devuelve una función para configurar sus fallos"""
+    options = {"fail_after_tokens": -1, "failures": 0}
+    monkeypatch.setattr(
+        chain_registry,
+        "_build_llm",
+        lambda streaming=False: CountingLLM(streaming=streaming, latency=0.3, tokens_per_second=200, **options)
+    )
+    monkeypatch.setattr(chain_registry, "_llms", {})
+    monkeypatch.setattr(chain_registry, "_chains", {})
+    monkeypatch.setattr(settings, "REQUEST_COALESCING_ENABLED", True)
+    monkeypatch.setattr(settings, "LLM_RETRY_BASE_SECONDS", 0.0)
+    _calls.clear()
+    return options
+
+def _stream_text(body: str) -> str:
+    """Texto reconstruido de un flujo SSE (tokens y sustituciones)"""
+    text = ""
+    for event in body.strip().split("\n\n"):
+        lines = event.split("\n")
+        name = lines[0][len("event: "):] if lines[0].startswith("event: ") else None
+        data = json.loads(lines[-1][len("data: "):])
+        if name == "replace":
+            text = data["text"]
+        elif name is None:
+            text += data["token"]
+    return text
+
+async def _requests(calls):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test", timeout=30) as client:
+        # Inicializa el almacén vectorial antes de contar las llamadas al LLM
+        await client.get("/api/health")
+        _calls.clear()
+        return await asyncio.gather(*(client.post(path, json={"query": QUERY}) for path in calls))
+
+def test_identical_concurrent_requests_share_one_llm_call(counting_llm):
+    paths = ["/api/chat", "/api/chat/stream"] * 10
+
+    responses = asyncio.run(_requests(paths))
+
+    assert [response.status_code for response in responses] == [200] * len(paths)
+    assert len(_calls) == 1
+    chat_bodies = [response.json()["response"] for response, path in zip(responses, paths) if path == "/api/chat"]
+    stream_bodies = [_stream_text(response.text) for response, path in zip(responses, paths) if path != "/api/chat"]
+    assert len(set(chat_bodies)) == 1
+    assert set(stream_bodies) == set(chat_bodies)
+
+def test_failure_before_first_chunk_is_retried(counting_llm):
+    counting_llm.update(fail_after_tokens=0, failures=1)
+
+    [response] = asyncio.run(_requests(["/api/chat/stream"]))
+
+    assert len(_calls) == 2
+    assert "event: error" not in response.text
+    assert _stream_text(response.text)
+
+def test_failure_after_first_published_chunk_is_not_retried(counting_llm):
+    counting_llm.update(fail_after_tokens=3, failures=1)
+
+    responses = asyncio.run(_requests(["/api/chat/stream"] * 3))
+
+    # Repetir la llamada duplicaría el texto ya enviado: todas las peticiones unidas reciben el error
+    assert len(_calls) == 1
+    assert all("event: error" in response.text for response in responses)
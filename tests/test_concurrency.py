@@ -0,0 +1,54 @@
+"""
+Las peticiones concurrentes a /chat no se serializan: las llamadas bloqueantes al
+LLM se ejecutan fuera del bucle de eventos, en el ejecutor acotado.
+"""
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.core.config import settings
+from app.main import app
+from app.services import chain_registry
+from benchmarks.load_app import FakeLLM
+
+LLM_LATENCY = 0.5
+QUERIES = [
+    "¿Cuál es el horario de apertura?",
+    "¿El aparcamiento es gratuito?",
+    "¿Hay restaurantes con menú halal?",
+    "¿Cómo reservo el personal shopper?",
+    "¿Hay menús vegetarianos?",
+    "¿Abren todos los días?",
+    "¿Cuánto cuesta el personal shopper?",
+    "¿Dónde se aparca?",
+]
+
+@pytest.fixture
+def slow_llm(monkeypatch):
+    """LLM falso que bloquea su hilo LLM_LATENCY segundos por llamada"""
+    monkeypatch.setattr(
+        chain_registry,
+        "_build_llm",
+        lambda streaming=False: FakeLLM(streaming=streaming, latency=LLM_LATENCY, tokens_per_second=0)
+    )
+    monkeypatch.setattr(chain_registry, "_llms", {})
+    monkeypatch.setattr(chain_registry, "_chains", {})
+
+async def _post_chats(queries):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test", timeout=30) as client:
+        # Primera petición fuera de la medida: inicializa el almacén vectorial y la cadena
+        await client.post("/api/chat", json={"query": "¿Qué tiendas hay?"})
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(client.post("/api/chat", json={"query": query}) for query in queries))
+        return time.perf_counter() - start, responses
+
+def test_concurrent_chats_overlap_llm_calls(indexed_documents, slow_llm):
+    assert len(QUERIES) <= min(settings.LLM_MAX_CONCURRENCY, settings.BLOCKING_POOL_SIZE)
+
+    elapsed, responses = asyncio.run(_post_chats(QUERIES))
+
+    assert [response.status_code for response in responses] == [200] * len(QUERIES)
+    # En serie tardarían len(QUERIES) * LLM_LATENCY; en paralelo, lo que tarda una llamada
+    assert elapsed < 2 * LLM_LATENCY, f"{len(QUERIES)} peticiones en {elapsed:.2f} s"
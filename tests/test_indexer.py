@@ -0,0 +1,44 @@
+"""
+Checkpoint del indexador: solo registra fragmentos cuya subida está confirmada.
+"""
+import pytest
+from langchain.schema import Document
+
+from app.core.config import settings
+from app.db.indexer import _Checkpoint, _upsert_chunks
+from app.services.embeddings import get_embeddings
+
+class CrashingSink:
+    """Destino reanudable que falla en la subida número `crash_at`"""
+
+    collection_name = "checkpoint_test"
+    supports_resume = True
+
+    def __init__(self, crash_at: int):
+        self.crash_at = crash_at
+        self.waits = []
+
+    def ensure(self, vector_size: int) -> None:
+        pass
+
+    def upsert(self, ids, vectors, payloads, wait: bool = False) -> None:
+        if len(self.waits) + 1 == self.crash_at:
+            raise RuntimeError("proceso interrumpido")
+        self.waits.append(wait)
+
+def test_checkpoint_records_only_confirmed_batches(monkeypatch):
+    monkeypatch.setattr(settings, "INDEX_BATCH_SIZE", 2)
+    monkeypatch.setattr(settings, "INDEX_CHECKPOINT_BATCHES", 3)
+    monkeypatch.setattr(settings, "INDEX_EMBEDDING_CONCURRENCY", 1)
+    chunks = [(f"id{i}", f"h{i}", Document(page_content=f"fragmento {i}")) for i in range(20)]
+    sink = CrashingSink(crash_at=6)
+    checkpoint = _Checkpoint(sink.collection_name)
+    checkpoint.clear()
+
+    with pytest.raises(RuntimeError):
+        _upsert_chunks(sink, get_embeddings(), chunks, checkpoint)
+
+    # Lotes 1-5 subidos; solo el 3.º esperó a Qdrant y confirma los tres primeros
+    assert sink.waits == [False, False, True, False, False]
+    assert _Checkpoint(sink.collection_name).done == {f"id{i}" for i in range(6)}
+    checkpoint.clear()
@@ -0,0 +1,47 @@
+"""
+Versiones del índice local: comprobación periódica de CURRENT y eliminación diferida.
+"""
+import os
+
+from app.db.local_index import LocalIndexWriter, LocalVectorIndex
+from app.services.embeddings import get_embeddings
+
+def _publish(directory: str, texts, keep_versions: int = 2) -> None:
+    writer = LocalIndexWriter(directory, "docs", keep_versions=keep_versions)
+    writer.drop()
+    writer.upsert(
+        [str(i) for i in range(len(texts))],
+        get_embeddings().embed_documents(texts),
+        [{"page_content": text, "metadata": {}} for text in texts]
+    )
+    writer.commit()
+
+def _versions(directory: str):
+    return sorted(name for name in os.listdir(os.path.join(directory, "docs")) if name.startswith("v"))
+
+def test_commit_keeps_previous_version_until_next_gc(tmp_path):
+    directory = str(tmp_path)
+    _publish(directory, ["uno"])
+    _publish(directory, ["dos"])
+
+    # La versión sustituida sigue en disco para los lectores que aún no han cambiado
+    assert _versions(directory) == ["v1", "v2"]
+
+    _publish(directory, ["tres"])
+    assert _versions(directory) == ["v2", "v3"]
+
+def test_reader_checks_current_at_most_every_refresh_seconds(tmp_path, monkeypatch):
+    directory = str(tmp_path)
+    _publish(directory, ["uno"])
+    index = LocalVectorIndex(directory, "docs", get_embeddings(), refresh_seconds=60)
+    assert index.similarity_search("uno", k=1)[0].page_content == "uno"
+
+    _publish(directory, ["dos", "tres"])
+    assert len(index) == 1
+    index.similarity_search("dos", k=1)
+    # Dentro del intervalo no se vuelve a mirar CURRENT
+    assert len(index) == 1
+
+    monkeypatch.setattr(index, "refresh_seconds", 0)
+    assert index.similarity_search("dos", k=1)[0].page_content == "dos"
+    assert len(index) == 2
@@ -0,0 +1,28 @@
+"""
+Contabilidad de tokens de las respuestas de referencia generadas en segundo plano.
+"""
+import asyncio
+
+from app.core.tracing import current_trace, end_trace, start_trace
+from app.db import vector_store
+from app.services import rag_service
+
+def test_canonical_answer_is_not_counted_as_user_traffic(indexed_documents):
+    async def main():
+        store = await vector_store.get_vector_store()
+        token = start_trace()
+        try:
+            await rag_service.generate_canonical_answer("¿El aparcamiento es gratuito?", store)
+            return current_trace().usage()
+        finally:
+            end_trace(token)
+
+    prompt_tokens = rag_service.PROMPT_TOKENS.value(stage="after")
+    canonical_tokens = rag_service.CANONICAL_PROMPT_TOKENS.value(lane="faq")
+
+    usage = asyncio.run(main())
+
+    # Ni la traza de la petición que lanzó la regeneración ni las métricas de usuarios
+    assert usage == {"total": 0}
+    assert rag_service.PROMPT_TOKENS.value(stage="after") == prompt_tokens
+    assert rag_service.CANONICAL_PROMPT_TOKENS.value(lane="faq") > canonical_tokens
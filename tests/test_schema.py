@@ -0,0 +1,47 @@
+"""
+Comparación del esquema configurado con el de una colección existente de Qdrant.
+"""
+from types import SimpleNamespace
+from unittest import mock
+
+from qdrant_client.http import models as rest
+
+from app.core.config import settings
+from app.db import schema
+
+def _client(quantization_config, m=None):
+    client = mock.Mock()
+    client.get_collection.return_value = SimpleNamespace(
+        config=SimpleNamespace(
+            hnsw_config=SimpleNamespace(m=m or settings.VECTOR_DB_HNSW_M, ef_construct=settings.VECTOR_DB_HNSW_EF_CONSTRUCT),
+            quantization_config=quantization_config
+        ),
+        payload_schema={"metadata.category": None, "metadata.doc_type": None}
+    )
+    return client
+
+def test_server_defaults_do_not_count_as_schema_changes(monkeypatch, caplog):
+    monkeypatch.setattr(settings, "VECTOR_DB_URL", "http://qdrant:6333")
+    monkeypatch.setattr(settings, "VECTOR_DB_QUANTIZATION", "int8")
+    monkeypatch.setattr(settings, "VECTOR_DB_QUANTIZATION_QUANTILE", 0.99)
+    monkeypatch.setattr(settings, "VECTOR_DB_QUANTIZATION_ALWAYS_RAM", False)
+    # Así la devuelve el servidor: tipo como texto, cuantil en float32 y always_ram sin rellenar
+    live = rest.ScalarQuantization(scalar=rest.ScalarQuantizationConfig(type="int8", quantile=0.9900000095367432))
+    client = _client(live)
+
+    schema.ensure_schema(client, "docs_v1")
+
+    assert "difiere" not in caplog.text
+    client.update_collection.assert_not_called()
+
+def test_schema_changes_on_existing_collections_are_opt_in(monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_DB_URL", "http://qdrant:6333")
+    monkeypatch.setattr(settings, "VECTOR_DB_QUANTIZATION", "int8")
+    client = _client(None, m=8)
+
+    schema.ensure_schema(client, "docs_v1")
+    client.update_collection.assert_not_called()
+
+    monkeypatch.setattr(settings, "VECTOR_DB_UPDATE_EXISTING_SCHEMA", True)
+    schema.ensure_schema(client, "docs_v1")
+    assert set(client.update_collection.call_args.kwargs) == {"hnsw_config", "quantization_config"}
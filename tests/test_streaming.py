@@ -0,0 +1,37 @@
+"""
+Formato incremental de las respuestas en streaming.
+"""
+import pytest
+
+from app.services.rag_service import clean_response
+from app.services.streaming import IncrementalFormatter, Replacement
+from benchmarks.load_app import ANSWER
+
+def _stream(text: str, clean=clean_response, size: int = 3):
+    formatter = IncrementalFormatter(clean)
+    parts = [formatter.feed(text[i:i + size]) for i in range(0, len(text), size)]
+    return parts, formatter.flush()
+
+@pytest.mark.parametrize("text", [
+    ANSWER,
+    "Opciones:\n• a\n• b\nFin.",
+    "Opciones:\n\n • a\n\n\n• b  fin",
+    "  Intro\r\n\r\n• **A**: x\r\n• **B**: y\r\n\r\nGracias • ",
+    "Primer párrafo.\n\n\n\nSegundo párrafo.\n•sin espacio",
+])
+def test_incremental_output_matches_full_cleaning(text):
+    parts, last = _stream(text)
+
+    assert not isinstance(last, Replacement)
+    assert "".join(parts) + last == clean_response(text)
+
+def test_divergent_final_format_is_replaced():
+    # Limpieza que cambia todo el texto según su final: lo ya emitido deja de ser válido
+    def shout_if_exclaimed(text: str) -> str:
+        return text.upper() if text.endswith("!") else text
+
+    parts, last = _stream("hola a todos!", shout_if_exclaimed)
+
+    assert "".join(parts)
+    assert isinstance(last, Replacement)
+    assert last == "HOLA A TODOS!"
@@ -0,0 +1,130 @@
+"""
+Inicialización única (single-flight) del almacén vectorial y backoff tras un fallo.
+"""
+import asyncio
+import json
+import os
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.db import vector_store
+from app.db.indexer import manifest_path
+
+class SlowInit:
+    """Sustituto de initialize_vector_store que tarda en completarse y cuenta sus llamadas"""
+
+    def __init__(self, delay: float = 0.2, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("Qdrant no disponible")
+        return object()
+
+@pytest.fixture
+def slow_init(monkeypatch, reset_vector_store):
+    init = SlowInit()
+    monkeypatch.setattr(vector_store, "initialize_vector_store", init)
+    return init
+
+def test_concurrent_requests_share_one_initialization(slow_init):
+    async def main():
+        return await asyncio.gather(*(vector_store.get_vector_store() for _ in range(100)))
+
+    stores = asyncio.run(main())
+
+    assert slow_init.calls == 1
+    assert all(store is stores[0] for store in stores)
+
+def test_failed_initialization_backs_off(slow_init, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_STORE_INIT_BACKOFF_SECONDS", 0.3)
+    slow_init.fail = True
+    slow_init.delay = 0.05
+
+    async def main():
+        # Todas las peticiones concurrentes comparten el intento fallido
+        first = await asyncio.gather(*(vector_store.get_vector_store() for _ in range(10)))
+        assert first == [None] * 10
+        assert slow_init.calls == 1
+        assert "Qdrant no disponible" in vector_store.get_initialization_error()
+
+        # Dentro del backoff se responde sin reintentar
+        assert await vector_store.get_vector_store() is None
+        assert slow_init.calls == 1
+
+        # Vencido el backoff, la siguiente petición reintenta y, si funciona, limpia el error
+        await asyncio.sleep(0.35)
+        slow_init.fail = False
+        assert await vector_store.get_vector_store() is not None
+        assert slow_init.calls == 2
+        assert vector_store.get_initialization_error() is None
+
+    asyncio.run(main())
+
+def test_backoff_grows_with_consecutive_failures(slow_init, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_STORE_INIT_BACKOFF_SECONDS", 1.0)
+    monkeypatch.setattr(settings, "VECTOR_STORE_INIT_BACKOFF_MAX_SECONDS", 3.0)
+    slow_init.fail = True
+    slow_init.delay = 0
+
+    async def main():
+        delays = []
+        for _ in range(4):
+            # Forzar el vencimiento del backoff anterior
+            vector_store._init_retry_at = 0.0
+            await vector_store.get_vector_store()
+            delays.append(vector_store._init_retry_at - time.monotonic())
+        return delays
+
+    delays = asyncio.run(main())
+
+    assert slow_init.calls == 4
+    assert [round(delay) for delay in delays] == [1, 2, 3, 3]
+
+def test_concurrent_requests_share_one_collection_switch(monkeypatch, reset_vector_store):
+    opened = []
+
+    def open_store(embeddings, collection_name=None):
+        time.sleep(0.1)
+        opened.append(collection_name)
+        return object()
+
+    monkeypatch.setattr(vector_store, "open_vector_store", open_store)
+    monkeypatch.setattr(vector_store, "resolve_collection", lambda name=None: "docs_v2")
+    vector_store._vector_store = previous = object()
+    vector_store._vector_store_collection = "docs_v1"
+
+    async def main():
+        return await asyncio.gather(*(vector_store.get_vector_store() for _ in range(50)))
+
+    stores = asyncio.run(main())
+
+    assert opened == ["docs_v2"]
+    assert all(store is stores[0] and store is not previous for store in stores)
+    assert vector_store._vector_store_collection == "docs_v2"
+
+def test_index_version_follows_manifest_written_by_another_process(monkeypatch):
+    monkeypatch.setattr(settings, "INDEX_VERSION_REFRESH_SECONDS", 0)
+    path = manifest_path(settings.VECTOR_DB_COLLECTION)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def write_manifest(files):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"files": files}, f)
+
+    try:
+        write_manifest({"a.pdf": {"hash": "1"}})
+        first = vector_store.get_index_version()
+        # Un indexador sin cambios reescribe el mismo manifiesto
+        write_manifest({"a.pdf": {"hash": "1"}})
+        assert vector_store.get_index_version() == first
+        write_manifest({"a.pdf": {"hash": "2"}})
+        assert vector_store.get_index_version() != first
+    finally:
+        os.remove(path)